@@ -1,42 +1,56 @@
-from flask import Flask, render_template, request, send_file, jsonify, session, redirect, url_for, abort
+from flask import Flask, render_template, request, send_file, jsonify, session, redirect, url_for, abort, g, Response
 import os
 import logging
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import stripe
 import uuid
 import hashlib
+import random
 from functools import wraps
 import io
-from database_manager import TunnelgrainDB
+import re
+import csv
+import json
+import click
+import time
+import threading
+from logging_setup import configure_logging, dropped_records
+from database_manager import LazyDB, QuotaExceededError, ORDER_COLUMNS
+import metrics
+import migrations
+from db_pool import HOT_QUERIES, explain_hot_queries
+from profiling import RequestProfiler
+from rate_limiter import RateLimit, RateLimiter, ShardedMemoryStore, PostgresStore
+from reconciliation import reconcile
+from config_recycler import ConfigRecycler
+from config_store import ConfigStore, build_store, store_path
+from config_sync import sync_configs
+from order_events import OrderEventHub
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (queued, JSON by default; LOG_FORMAT=text for the plain format)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'change-in-production-very-secret-key')
 
-# Initialize database
-try:
-    db = TunnelgrainDB()
-    logger.info("✅ Database initialized successfully")
-except Exception as e:
-    logger.error(f"❌ Database initialization failed: {e}")
-    raise
+# Database is created on first use in each process (safe with gunicorn --preload)
+db = LazyDB()
 
-# Stripe Configuration
+# Stripe Configuration (applied on first payment call)
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY')
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
 
 if not STRIPE_PUBLISHABLE_KEY or not STRIPE_SECRET_KEY:
     logger.error("❌ Stripe keys not configured - payments will not work")
-    raise ValueError("Stripe keys are required")
-else:
-    stripe.api_key = STRIPE_SECRET_KEY
-    logger.info("✅ Stripe configured successfully")
+
+def require_stripe():
+    """Configure the Stripe client on first use; raises if keys are missing"""
+    if not STRIPE_PUBLISHABLE_KEY or not STRIPE_SECRET_KEY:
+        raise RuntimeError("Stripe keys are required")
+    if stripe.api_key != STRIPE_SECRET_KEY:
+        stripe.api_key = STRIPE_SECRET_KEY
+        logger.info("✅ Stripe configured successfully")
 
 # Admin security key
 ADMIN_KEY = os.environ.get('ADMIN_KEY', 'Freud@')
@@ -46,6 +60,48 @@ VPS_IP = "213.170.133.116"
 VPS_ENDPOINT = os.environ.get('VPS_1_ENDPOINT', f'http://{VPS_IP}:8081')
 VPS_NAME = "primary_vps"
 
+# Rate limiting (per route, per client fingerprint and per IP)
+RATE_LIMITS_ENABLED = os.environ.get('RATE_LIMITS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+
+RATE_LIMITS = {
+    'get_test_vpn': {
+        'fingerprint': RateLimit.parse(os.environ.get('RATE_LIMIT_TEST_VPN', '3/900')),
+        'ip': RateLimit.parse(os.environ.get('RATE_LIMIT_TEST_VPN_IP', '10/900'))
+    },
+    'check_order': {
+        'fingerprint': RateLimit.parse(os.environ.get('RATE_LIMIT_CHECK_ORDER', '30/60')),
+        'ip': RateLimit.parse(os.environ.get('RATE_LIMIT_CHECK_ORDER_IP', '60/60'))
+    },
+    'create_checkout_session': {
+        'fingerprint': RateLimit.parse(os.environ.get('RATE_LIMIT_CHECKOUT', '10/60')),
+        'ip': RateLimit.parse(os.environ.get('RATE_LIMIT_CHECKOUT_IP', '20/60'))
+    },
+    'order_events': {
+        'fingerprint': RateLimit.parse(os.environ.get('RATE_LIMIT_ORDER_EVENTS', '10/60')),
+        'ip': RateLimit.parse(os.environ.get('RATE_LIMIT_ORDER_EVENTS_IP', '30/60'))
+    }
+}
+
+if RATE_LIMIT_BACKEND == 'postgresql' and os.environ.get('DATABASE_URL'):
+    rate_limit_store = PostgresStore(lambda: db.get_connection())
+else:
+    rate_limit_store = ShardedMemoryStore()
+
+rate_limiter = RateLimiter(rate_limit_store, RATE_LIMITS)
+
+# Expired configs get fresh keys from the daemon in the background
+CONFIG_RECYCLER_ENABLED = os.environ.get('CONFIG_RECYCLING', 'true').lower() in ('1', 'true', 'yes')
+config_recycler = ConfigRecycler(
+    db, VPS_ENDPOINT,
+    batch_size=int(os.environ.get('CONFIG_RECYCLE_BATCH', 20)),
+    interval=float(os.environ.get('CONFIG_RECYCLE_INTERVAL', 5))
+)
+
+# Admin order listing page sizes
+ADMIN_PAGE_SIZE = int(os.environ.get('ADMIN_PAGE_SIZE', 20))
+ADMIN_MAX_PAGE_SIZE = 500
+
 # Service Tiers
 SERVICE_TIERS = {
     'test': {
@@ -53,84 +109,264 @@ SERVICE_TIERS = {
         'duration_days': 0,  # 15 minutes
         'price_cents': 0,
         'description': '15-minute free trial',
-        'order_prefix': '72',
-        'capacity': 50
+        'order_prefix': '72'
     },
     'monthly': {
         'name': 'Monthly VPN',
         'duration_days': 30,
         'price_cents': 499,  # $4.99
         'description': '30 days unlimited access',
-        'order_prefix': '42',
-        'capacity': 30
+        'order_prefix': '42'
     },
     'quarterly': {
         'name': '3-Month VPN',
         'duration_days': 90,
         'price_cents': 1299,  # $12.99
         'description': '90 days unlimited access',
-        'order_prefix': '42',
-        'capacity': 20
+        'order_prefix': '42'
     },
     'biannual': {
         'name': '6-Month VPN',
         'duration_days': 180,
         'price_cents': 2399,  # $23.99
         'description': '180 days unlimited access',
-        'order_prefix': '42',
-        'capacity': 15
+        'order_prefix': '42'
     },
     'annual': {
         'name': '12-Month VPN',
         'duration_days': 365,
         'price_cents': 3999,  # $39.99
         'description': '365 days unlimited access',
-        'order_prefix': '42',
-        'capacity': 10
+        'order_prefix': '42'
     },
     'lifetime': {
         'name': 'Lifetime VPN',
         'duration_days': 36500,  # 100 years
         'price_cents': 9999,  # $99.99
         'description': 'Lifetime unlimited access',
-        'order_prefix': '42',
-        'capacity': 5
+        'order_prefix': '42'
     }
 }
 
+# Public pages read capacity from a short-lived copy: a few seconds stale is fine for
+# display, and a failed lookup keeps showing the last known values instead of zeros
+AVAILABILITY_CACHE_SECONDS = float(os.environ.get('AVAILABILITY_CACHE_SECONDS', 5))
+_availability_cache = {'fetched_at': None, 'availability': {}}
+_availability_lock = threading.Lock()
+
+def cached_slot_availability():
+    """db.get_slot_availability() at most once per AVAILABILITY_CACHE_SECONDS per worker"""
+    with _availability_lock:
+        fetched_at = _availability_cache['fetched_at']
+        if fetched_at is not None and time.monotonic() - fetched_at < AVAILABILITY_CACHE_SECONDS:
+            return _availability_cache['availability']
+        
+        # Under the lock: concurrent misses wait for this lookup instead of repeating it
+        try:
+            availability = db.get_slot_availability()
+        except Exception as e:
+            logger.error(f"❌ Error refreshing slot availability: {e}")
+            availability = {}
+        
+        # A failure is retried after the TTL too, not on every page view
+        _availability_cache['fetched_at'] = time.monotonic()
+        if availability:
+            _availability_cache['availability'] = availability
+        return _availability_cache['availability']
+
+def service_tiers_with_capacity(availability=None):
+    """SERVICE_TIERS with each tier's current capacity (active orders plus sellable slots)
+    
+    Paid tiers share one config pool under soft quotas, so capacity is not a
+    fixed number per tier: it moves with the quotas and the other tiers' sales.
+    Without availability, the cached values public pages use are taken.
+    """
+    availability = cached_slot_availability() if availability is None else availability
+    return {tier: dict(data, capacity=availability.get(tier, {}).get('total', 0))
+            for tier, data in SERVICE_TIERS.items()}
+
+def tier_revenue_potential(availability):
+    """{tier: cents} if every shared pool sold out in the proportions of its current quotas"""
+    quota_totals = {}
+    for tier, data in availability.items():
+        quota_totals[data['pool']] = quota_totals.get(data['pool'], 0) + data['quota']
+    return {
+        tier: int(SERVICE_TIERS[tier]['price_cents'] * data['pool_size'] * data['quota'] / quota_totals[data['pool']])
+        if quota_totals[data['pool']] else 0
+        for tier, data in availability.items()
+    }
+
+# Metrics
+HTTP_REQUEST_SECONDS = metrics.REGISTRY.histogram(
+    'tunnelgrain_http_request_seconds', 'Flask request latency per route', ('route', 'method', 'status'))
+
+def _slot_utilization():
+    """Scrape-time gauge values: used/total per tier"""
+    return {
+        (tier,): round(data['used'] / data['total'], 4) if data.get('total') else 0
+        for tier, data in db.get_slot_availability().items()
+    }
+
+metrics.REGISTRY.gauge(
+    'tunnelgrain_slot_utilization_ratio', 'Share of configs in use per tier', ('tier',),
+    callback=_slot_utilization)
+metrics.REGISTRY.gauge(
+    'tunnelgrain_order_cache_entries', 'Entries in the order lookup cache',
+    callback=lambda: {(): db.order_cache.stats()['entries']})
+metrics.REGISTRY.gauge(
+    'tunnelgrain_db_pool_connections', 'Pooled database connections: idle now, created and reused since start', ('state',),
+    callback=lambda: {(state,): value for state, value in db.pool.stats().items()} if db.pool else {})
+metrics.REGISTRY.gauge(
+    'tunnelgrain_log_records_dropped', 'Log records dropped because the log queue was full',
+    callback=lambda: {(): dropped_records()})
+
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+@app.before_request
+def assign_request_id():
+    # Honour an upstream X-Request-ID (e.g. from the proxy) so log lines can be correlated
+    provided = request.headers.get('X-Request-ID', '')
+    g.request_id = provided if REQUEST_ID_RE.match(provided) else uuid.uuid4().hex
+
+@app.before_request
+def start_config_recycler():
+    # Started lazily so each gunicorn worker (forked after --preload) runs its own
+    if CONFIG_RECYCLER_ENABLED:
+        config_recycler.ensure_started()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    start = getattr(g, 'request_start', None)
+    if start is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, route=route,
+                                     method=request.method, status=response.status_code)
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
 # Admin authentication decorator
+def is_admin_request():
+    provided_key = request.args.get('key') or request.headers.get('X-Admin-Key')
+    return provided_key == ADMIN_KEY
+
 def admin_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        provided_key = request.args.get('key') or request.headers.get('X-Admin-Key')
-        if provided_key != ADMIN_KEY:
+        if not is_admin_request():
             logger.warning(f"Admin access denied. Key mismatch")
             abort(404)
         return f(*args, **kwargs)
     return decorated_function
 
-# Utility functions
-def get_client_fingerprint(request):
-    """Create a privacy-respecting fingerprint for abuse prevention"""
-    real_ip = None
+# Request profiling: opt-in per request (admin only) or sampled
+profiler = RequestProfiler(
+    directory=os.environ.get('PROFILE_DIR', 'profiles'),
+    sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', 0)),
+    max_profiles=int(os.environ.get('PROFILE_MAX_FILES', 200))
+)
+
+@app.before_request
+def start_profiling():
+    reason = None
+    if request.headers.get('X-Profile') == '1' or request.args.get('profile') == '1':
+        if is_admin_request():
+            reason = 'requested'
+    elif profiler.sample_rate > 0 and random.random() < profiler.sample_rate:
+        reason = 'sampled'
     
+    if reason:
+        g.profile_reason = reason
+        g.profile_start = time.perf_counter()
+        g.profile = profiler.start()
+
+@app.after_request
+def save_profile(response):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        try:
+            route = request.url_rule.rule if request.url_rule else request.path
+            name = profiler.save(profile, route, request.method, response.status_code,
+                                 time.perf_counter() - g.profile_start, g.profile_reason)
+            response.headers['X-Profile-Id'] = name
+        except Exception as e:
+            logger.error(f"❌ Failed to save profile: {e}")
+    return response
+
+@app.teardown_request
+def stop_profiling(error=None):
+    # after_request is skipped on unhandled errors; never leave a profiler running
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.disable()
+
+# Rate limit decorator (runs before any database work in the view)
+def rate_limited(route_name):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if RATE_LIMITS_ENABLED:
+                allowed, retry_after = rate_limiter.check(route_name, {
+                    'fingerprint': get_client_fingerprint(request),
+                    'ip': get_client_ip(request)
+                })
+                if not allowed:
+                    logger.warning(f"Rate limit hit on {route_name}, retry after {retry_after}s",
+                                   extra={'event': 'rate_limited', 'route': route_name})
+                    response = jsonify({
+                        'error': 'Too many requests. Please try again later.',
+                        'retry_after': retry_after
+                    })
+                    response.status_code = 429
+                    response.headers['Retry-After'] = str(retry_after)
+                    return response
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+# Utility functions
+def get_client_ip(request):
+    """Resolve the client IP behind Render/Cloudflare proxies"""
     # Try different headers that Render might use
     for header in ['X-Real-IP', 'X-Forwarded-For', 'CF-Connecting-IP', 'True-Client-Ip']:
         ip_value = request.headers.get(header)
         if ip_value:
-            real_ip = ip_value.split(',')[0].strip()
-            break
+            return ip_value.split(',')[0].strip()
     
-    if not real_ip:
-        real_ip = request.remote_addr
+    return request.remote_addr
+
+def get_client_fingerprint(request):
+    """Create a privacy-respecting fingerprint for abuse prevention"""
+    real_ip = get_client_ip(request)
     
     user_agent = request.headers.get('User-Agent', 'unknown')
     fingerprint_data = f"{real_ip}:{user_agent}"
     fingerprint = hashlib.sha256(fingerprint_data.encode()).hexdigest()[:16]
     
-    logger.info(f"Fingerprint created: {fingerprint} from IP: {real_ip}")
+    logger.debug(f"Fingerprint created: {fingerprint} from IP: {real_ip}")
     return fingerprint
 
+def serialize_order(order):
+    """Copy an order dict with datetimes converted to ISO strings"""
+    return {key: value.isoformat() if isinstance(value, datetime) else value
+            for key, value in order.items()}
+
+def parse_bool_arg(value):
+    """Parse an optional true/false query argument"""
+    if value is None or value == '':
+        return None
+    return value.lower() in ('1', 'true', 'yes')
+
+def parse_datetime_arg(value):
+    """Parse an optional ISO date/datetime query argument"""
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
 def get_real_config_path(config_id, tier, vps_name='vps_1', vps_ip='213.170.133.116'):
     """Get the path to the real config file"""
     config_path = f"data/{vps_name}/ip_{vps_ip}/{tier}/{config_id}.conf"
@@ -141,12 +377,106 @@ def get_real_qr_path(config_id, tier, vps_name='vps_1', vps_ip='213.170.133.116'
     qr_path = f"static/qr_codes/{vps_name}/ip_{vps_ip}/{tier}/{config_id}.png"
     return qr_path
 
+# Packed config/QR store for this node (flask --app app build-config-store); file tree when absent
+config_store = ConfigStore(store_path('vps_1', VPS_IP))
+
+def original_config_source(config_id, tier, kind):
+    """Original config ('conf') or QR code ('qr') for send_file, None if missing
+    
+    Read from the packed store when one is built, so no per-file lookups;
+    otherwise from the file tree. Files live under the config's home tier,
+    which differs from the order's tier when paid tiers share a pool.
+    """
+    tier = db.config_home(config_id) or tier
+    if config_store.available():
+        view = config_store.get(config_id, kind, tier=tier)
+        return io.BytesIO(view) if view is not None else None
+    path = get_real_config_path(config_id, tier) if kind == 'conf' else get_real_qr_path(config_id, tier)
+    return path if os.path.exists(path) else None
+
+def describe_order_time(order_data):
+    """(status, human time remaining, seconds remaining) derived from expires_at"""
+    expires_at = order_data.get('expires_at')
+    if not expires_at:
+        return 'unknown', 'unknown', None
+    
+    try:
+        if isinstance(expires_at, str):
+            expires_at = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
+        
+        # Orders are stored naive in server local time; imported or legacy rows may carry an offset
+        expires_at = expires_at.astimezone(timezone.utc)
+        now = datetime.now(timezone.utc)
+        
+        if expires_at <= now:
+            return 'expired', 'Expired', 0
+        
+        time_delta = expires_at - now
+        
+        if order_data['tier'] == 'test':
+            minutes_remaining = max(0, time_delta.seconds // 60)
+            time_remaining = f"{minutes_remaining} minutes"
+        else:
+            days_remaining = max(0, time_delta.days)
+            if days_remaining > 0:
+                time_remaining = f"{days_remaining} days"
+            else:
+                hours_remaining = max(0, time_delta.seconds // 3600)
+                time_remaining = f"{hours_remaining} hours"
+        
+        return 'active', time_remaining, int(time_delta.total_seconds())
+    except Exception as e:
+        logger.error(f"❌ Error calculating time remaining: {e}")
+        return 'unknown', 'unknown', None
+
+def order_event_snapshot(order_number):
+    """What /order-events pushes for one order; None when the order does not exist"""
+    order_data = db.get_order_by_number(order_number)
+    if not order_data:
+        return None
+    
+    status, time_remaining, seconds_remaining = describe_order_time(order_data)
+    expires_at = order_data.get('expires_at')
+    return {
+        'order_found': True,
+        'order_number': order_number,
+        'tier': order_data['tier'],
+        'tier_name': SERVICE_TIERS.get(order_data['tier'], {}).get('name', 'Unknown'),
+        'status': status,
+        'time_remaining': time_remaining,
+        'seconds_remaining': seconds_remaining,
+        'expires_at': expires_at.isoformat() if isinstance(expires_at, datetime) else expires_at,
+        'timer_started': bool(order_data.get('timer_started'))
+    }
+
+# Live order status over server-sent events: one shared source per watched order
+order_events = OrderEventHub(
+    order_event_snapshot,
+    refresh_interval=float(os.environ.get('ORDER_EVENTS_REFRESH', 60)),
+    keepalive=float(os.environ.get('ORDER_EVENTS_KEEPALIVE', 15)),
+    # Each open stream holds a worker thread (see gunicorn.conf.py): keep streams short and
+    # leave threads for ordinary requests
+    max_duration=float(os.environ.get('ORDER_EVENTS_MAX_SECONDS', 300)),
+    max_watchers=int(os.environ.get('ORDER_EVENTS_MAX_WATCHERS', 50))
+)
+
+@db.on_create
+def forward_invalidations(instance):
+    """Orders changed by other workers also reach this worker's event streams"""
+    if instance.bus is not None:
+        instance.bus.subscribe(lambda order_numbers: order_events.notify(*order_numbers)
+                               if order_numbers is not None else order_events.notify_all())
+
+metrics.REGISTRY.gauge(
+    'tunnelgrain_order_event_watchers', 'Open order status event streams',
+    callback=lambda: {(): order_events.watcher_count()})
+
 # === MAIN ROUTES ===
 
 @app.route('/')
 def home():
     """Home page with all service tiers"""
-    return render_template('home.html', service_tiers=SERVICE_TIERS)
+    return render_template('home.html', service_tiers=service_tiers_with_capacity())
 
 @app.route('/test')
 def test():
@@ -156,7 +486,7 @@ def test():
 @app.route('/pricing')
 def pricing():
     """Pricing page with all tiers"""
-    return render_template('pricing.html', service_tiers=SERVICE_TIERS)
+    return render_template('pricing.html', service_tiers=service_tiers_with_capacity())
 
 @app.route('/order')
 def order():
@@ -175,7 +505,7 @@ def order():
         for tier_name in SERVICE_TIERS.keys() if tier_name != 'test'
     }
     
-    logger.info(f"Order page loaded with availability: {available_slots}")
+    logger.debug(f"Order page loaded with availability: {available_slots}")
     
     return render_template('order.html', 
                          service_tiers=SERVICE_TIERS, 
@@ -201,6 +531,7 @@ def order_lookup():
 # === VPN SERVICE ROUTES ===
 
 @app.route('/get-test-vpn', methods=['POST'])
+@rate_limited('get_test_vpn')
 def get_test_vpn():
     """Assign a 15-minute test VPN"""
     try:
@@ -209,13 +540,19 @@ def get_test_vpn():
         
         # Get user fingerprint
         user_fingerprint = get_client_fingerprint(request)
-        logger.info(f"Test VPN request from fingerprint: {user_fingerprint}")
+        logger.debug(f"Test VPN request from fingerprint: {user_fingerprint}")
         
         # Create order in database (config will be auto-assigned)
-        order_id, order_number = db.create_order(
-            tier='test',
-            user_fingerprint=user_fingerprint
-        )
+        try:
+            order_id, order_number = db.create_order(
+                tier='test',
+                user_fingerprint=user_fingerprint
+            )
+        except QuotaExceededError:
+            return jsonify({
+                'error': 'You already have a recent test VPN. Please try again later.',
+                'suggestion': f'Test VPNs are limited to {db.TEST_QUOTA_MAX} per {db.TEST_QUOTA_WINDOW_MINUTES} minutes.'
+            }), 429
         
         if not order_id:
             logger.error(f"Failed to create test order")
@@ -234,6 +571,7 @@ def get_test_vpn():
             }), 500
         
         config_id = order_data.get('config_id')
+        order_events.notify(order_number)
         
         # Store in session for download
         session['test_slot'] = order_id
@@ -261,6 +599,7 @@ def get_test_vpn():
         }), 500
 
 @app.route('/create-checkout-session', methods=['POST'])
+@rate_limited('create_checkout_session')
 def create_checkout_session():
     """Create Stripe checkout session for VPN purchase"""
     try:
@@ -286,6 +625,7 @@ def create_checkout_session():
         
         # Create Stripe checkout session
         try:
+            require_stripe()
             checkout_session = stripe.checkout.Session.create(
                 payment_method_types=['card'],
                 line_items=[{
@@ -340,6 +680,7 @@ def payment_success():
     
     try:
         # Retrieve the session from Stripe
+        require_stripe()
         checkout_session = stripe.checkout.Session.retrieve(
             session_id,
             expand=['customer', 'payment_intent']
@@ -374,6 +715,7 @@ def payment_success():
             order_data = db.get_order_by_number(order_number)
             if order_data:
                 config_id = order_data.get('config_id')
+                order_events.notify(order_number)
                 
                 # Store in session for download access
                 session['purchase_order'] = order_number
@@ -435,17 +777,17 @@ def download_test_config():
     order_number = session.get('test_order', 'unknown')
     
     try:
-        # Get path to real config file
-        config_path = get_real_config_path(config_id, 'test')
+        # Regenerated configs are served from the database, originals from disk
+        fresh = db.get_fresh_config(config_id)
+        original = None if fresh else original_config_source(config_id, 'test', 'conf')
         
         # Check if file exists
-        if not os.path.exists(config_path):
-            logger.error(f"Config file not found: {config_path}")
+        if not fresh and original is None:
+            logger.error(f"Config file not found: {'test'}/{config_id}")
             return "Config file not found. Please contact support.", 404
         
         # 🔥 START VPS TIMER (ONLY FOR CONFIG DOWNLOADS!)
         try:
-            logger.info(f"🔥 Starting VPS timer for test config: {order_number}")
             success = db.start_vps_timer(
                 order_number=order_number,
                 tier='test',
@@ -455,7 +797,7 @@ def download_test_config():
             )
             
             if success:
-                logger.info(f"✅ VPS timer started successfully for {order_number}")
+                order_events.notify(order_number)
             else:
                 logger.warning(f"⚠️ VPS timer failed for {order_number} - config will still work but won't auto-expire")
                 
@@ -463,10 +805,11 @@ def download_test_config():
             logger.error(f"❌ Timer error for {order_number}: {timer_error}")
             # Continue with download even if timer fails
         
-        logger.info(f"✅ Serving test config: {order_number} ({config_id}) from {config_path}")
+        logger.info(f"✅ Serving test config: {order_number} ({config_id})",
+                    extra={'event': 'download', 'order_number': order_number, 'kind': 'test_config'})
         
         return send_file(
-            config_path,
+            io.BytesIO(fresh['config_text'].encode()) if fresh else original,
             as_attachment=True,
             download_name=f"tunnelgrain_{order_number}.conf",
             mimetype='application/octet-stream'
@@ -485,18 +828,21 @@ def download_test_qr():
     order_number = session.get('test_order', 'unknown')
     
     try:
-        # Get path to real QR file
-        qr_path = get_real_qr_path(config_id, 'test')
+        # Regenerated configs are served from the database, originals from disk
+        fresh = db.get_fresh_config(config_id)
+        fresh_qr = fresh['qr_png'] if fresh else None
+        original = None if fresh_qr else original_config_source(config_id, 'test', 'qr')
         
         # Check if file exists
-        if not os.path.exists(qr_path):
-            logger.error(f"QR file not found: {qr_path}")
+        if not fresh_qr and original is None:
+            logger.error(f"QR file not found: {'test'}/{config_id}")
             return "QR code not found. Please contact support.", 404
         
-        logger.info(f"✅ Serving test QR: {order_number} ({config_id}) from {qr_path}")
+        logger.info(f"✅ Serving test QR: {order_number} ({config_id})",
+                    extra={'event': 'download', 'order_number': order_number, 'kind': 'test_qr'})
         
         return send_file(
-            qr_path,
+            io.BytesIO(fresh_qr) if fresh_qr else original,
             as_attachment=True,
             download_name=f"tunnelgrain_{order_number}_qr.png",
             mimetype='image/png'
@@ -516,12 +862,13 @@ def download_purchase_config():
     order_number = session.get('purchase_order', 'unknown')
     
     try:
-        # Get path to real config file
-        config_path = get_real_config_path(config_id, tier)
+        # Regenerated configs are served from the database, originals from disk
+        fresh = db.get_fresh_config(config_id)
+        original = None if fresh else original_config_source(config_id, tier, 'conf')
         
         # Check if file exists
-        if not os.path.exists(config_path):
-            logger.error(f"Config file not found: {config_path}")
+        if not fresh and original is None:
+            logger.error(f"Config file not found: {tier}/{config_id}")
             return "Config file not found. Please contact support.", 404
         
         # 🔥 START VPS TIMER (ONLY FOR CONFIG DOWNLOADS!)
@@ -537,7 +884,6 @@ def download_purchase_config():
             
             duration_minutes = duration_map.get(tier, 30 * 24 * 60)
             
-            logger.info(f"🔥 Starting VPS timer for {tier} config: {order_number} ({duration_minutes} minutes)")
             success = db.start_vps_timer(
                 order_number=order_number,
                 tier=tier,
@@ -547,7 +893,7 @@ def download_purchase_config():
             )
             
             if success:
-                logger.info(f"✅ VPS timer started successfully for {order_number}")
+                order_events.notify(order_number)
             else:
                 logger.warning(f"⚠️ VPS timer failed for {order_number} - config will still work but won't auto-expire")
                 
@@ -555,10 +901,11 @@ def download_purchase_config():
             logger.error(f"❌ Timer error for {order_number}: {timer_error}")
             # Continue with download even if timer fails
         
-        logger.info(f"✅ Serving purchase config: {order_number} ({tier}/{config_id}) from {config_path}")
+        logger.info(f"✅ Serving purchase config: {order_number} ({tier}/{config_id})",
+                    extra={'event': 'download', 'order_number': order_number, 'kind': 'purchase_config'})
         
         return send_file(
-            config_path,
+            io.BytesIO(fresh['config_text'].encode()) if fresh else original,
             as_attachment=True,
             download_name=f"tunnelgrain_{order_number}.conf",
             mimetype='application/octet-stream'
@@ -578,18 +925,21 @@ def download_purchase_qr():
     order_number = session.get('purchase_order', 'unknown')
     
     try:
-        # Get path to real QR file
-        qr_path = get_real_qr_path(config_id, tier)
+        # Regenerated configs are served from the database, originals from disk
+        fresh = db.get_fresh_config(config_id)
+        fresh_qr = fresh['qr_png'] if fresh else None
+        original = None if fresh_qr else original_config_source(config_id, tier, 'qr')
         
         # Check if file exists
-        if not os.path.exists(qr_path):
-            logger.error(f"QR file not found: {qr_path}")
+        if not fresh_qr and original is None:
+            logger.error(f"QR file not found: {tier}/{config_id}")
             return "QR code not found. Please contact support.", 404
         
-        logger.info(f"✅ Serving purchase QR: {order_number} ({tier}/{config_id}) from {qr_path}")
+        logger.info(f"✅ Serving purchase QR: {order_number} ({tier}/{config_id})",
+                    extra={'event': 'download', 'order_number': order_number, 'kind': 'purchase_qr'})
         
         return send_file(
-            qr_path,
+            io.BytesIO(fresh_qr) if fresh_qr else original,
             as_attachment=True,
             download_name=f"tunnelgrain_{order_number}_qr.png",
             mimetype='image/png'
@@ -602,6 +952,22 @@ def download_purchase_qr():
 
 # === MANUAL TIMER MANAGEMENT (for debugging) ===
 
+@app.route('/admin/reconcile', methods=['POST'])
+@admin_required
+def admin_reconcile():
+    """Diff orders against the daemon and repair drift (?dry_run=1 to only report)"""
+    try:
+        report = reconcile(db, VPS_ENDPOINT, dry_run=parse_bool_arg(request.args.get('dry_run')) or False)
+        order_events.notify(*report['timers_started'])
+        return jsonify(dict(report, success=not report['errors']))
+        
+    except Exception as e:
+        logger.error(f"❌ Reconcile error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/admin/start-timer/<order_number>', methods=['POST'])
 @admin_required
 def admin_start_timer(order_number):
@@ -635,6 +1001,7 @@ def admin_start_timer(order_number):
         )
         
         if success:
+            order_events.notify(order_number)
             return jsonify({
                 'success': True,
                 'message': f'Timer started for {order_number}',
@@ -653,7 +1020,15 @@ def admin_check_vps_status():
     """Check VPS daemon status"""
     try:
         import requests
-        response = requests.get(f"{VPS_ENDPOINT}/api/status", timeout=5)
+        request_start = time.perf_counter()
+        try:
+            response = requests.get(f"{VPS_ENDPOINT}/api/status", timeout=5)
+        except requests.exceptions.RequestException:
+            metrics.VPS_REQUEST_SECONDS.observe(time.perf_counter() - request_start,
+                                                endpoint='status', outcome='connection_error')
+            raise
+        metrics.VPS_REQUEST_SECONDS.observe(time.perf_counter() - request_start, endpoint='status',
+                                            outcome='ok' if response.status_code == 200 else f'http_{response.status_code}')
         
         if response.status_code == 200:
             vps_data = response.json()
@@ -679,6 +1054,7 @@ def admin_check_vps_status():
 # === ORDER LOOKUP ===
 
 @app.route('/check-order', methods=['POST'])
+@rate_limited('check_order')
 def check_order():
     """Check order status"""
     order_number = request.form.get('order_number', '').strip().upper()
@@ -687,10 +1063,8 @@ def check_order():
     if not (order_number.startswith('42') or order_number.startswith('72')) or len(order_number) != 8:
         return jsonify({'error': 'Invalid order number format'})
     
-    # Clean up expired orders first
-    db.cleanup_expired_orders()
-    
-    # Get order from database
+    # Get order (served from the lookup cache when possible). No expiry sweep
+    # here: status and time remaining are derived from expires_at below.
     order_data = db.get_order_by_number(order_number)
     
     if not order_data:
@@ -699,37 +1073,7 @@ def check_order():
             'error': 'Order not found'
         })
     
-    # Calculate time remaining
-    status = 'unknown'
-    time_remaining = 'unknown'
-    
-    expires_at = order_data.get('expires_at')
-    if expires_at:
-        try:
-            if isinstance(expires_at, str):
-                expires_at = datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
-            
-            now = datetime.now()
-            
-            if expires_at > now:
-                status = 'active'
-                time_delta = expires_at - now
-                
-                if order_data['tier'] == 'test':
-                    minutes_remaining = max(0, time_delta.seconds // 60)
-                    time_remaining = f"{minutes_remaining} minutes"
-                else:
-                    days_remaining = max(0, time_delta.days)
-                    if days_remaining > 0:
-                        time_remaining = f"{days_remaining} days"
-                    else:
-                        hours_remaining = max(0, time_delta.seconds // 3600)
-                        time_remaining = f"{hours_remaining} hours"
-            else:
-                status = 'expired'
-                time_remaining = 'Expired'
-        except Exception as e:
-            logger.error(f"❌ Error calculating time remaining: {e}")
+    status, time_remaining, _ = describe_order_time(order_data)
     
     # Get tier information
     tier_info = SERVICE_TIERS.get(order_data['tier'], {})
@@ -746,6 +1090,26 @@ def check_order():
         'timer_started': order_data.get('timer_started', False)
     })
 
+@app.route('/order-events/<order_number>')
+@rate_limited('order_events')
+def order_events_stream(order_number):
+    """Server-sent events with live status for one order (replaces polling /check-order)"""
+    order_number = order_number.strip().upper()
+    if not re.match(r'^(42|72)[A-F0-9]{6}$', order_number):
+        return jsonify({'error': 'Invalid order number format'}), 400
+    
+    subscription = order_events.subscribe(order_number)
+    if subscription is None:
+        # EventSource gives up on a 503; the page keeps its last known status
+        return jsonify({'error': 'Too many live order streams, try again later'}), 503
+    
+    response = Response(order_events.stream(order_number, subscription), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # nginx/Render proxies must not buffer the stream
+    })
+    response.call_on_close(lambda: order_events.unsubscribe(order_number, subscription[0]))
+    return response
+
 # === ADMIN ROUTES ===
 
 @app.route('/admin')
@@ -755,18 +1119,16 @@ def admin():
     try:
         db.cleanup_expired_orders()
         
-        # Get current orders
-        orders = db.get_all_orders()
+        # First page of orders; further pages load through /admin/api/orders
+        try:
+            page = db.get_orders_page(limit=ADMIN_PAGE_SIZE, cursor=request.args.get('cursor'))
+        except ValueError:
+            # Malformed cursor (stale or hand-edited link): start over at the first page
+            page = db.get_orders_page(limit=ADMIN_PAGE_SIZE)
         
-        # Convert to dict format
         orders_dict = {}
-        for order in orders:
-            if order and order.get('order_id'):
-                order_copy = order.copy()
-                for key, value in order_copy.items():
-                    if isinstance(value, datetime):
-                        order_copy[key] = value.isoformat()
-                orders_dict[order['order_id']] = order_copy
+        for order in page['orders']:
+            orders_dict[order['order_id']] = serialize_order(order)
         
         # Get availability statistics
         availability = db.get_slot_availability()
@@ -775,9 +1137,19 @@ def admin():
         for tier_name, tier_data in availability.items():
             availability_stats[tier_name] = {
                 'available': tier_data.get('available', 0),
-                'capacity': tier_data.get('total', SERVICE_TIERS[tier_name]['capacity'])
+                'capacity': tier_data.get('total', 0)
             }
         
+        # Summary cards come from the per-tier counters table
+        stats = db.get_order_stats()
+        order_summary = {
+            'total': sum(s['active_count'] + s['expired_count'] for s in stats.values()),
+            'active': sum(s['active_count'] for s in stats.values()),
+            'test_active': stats.get('test', {}).get('active_count', 0),
+            'paid_active': sum(s['active_count'] for tier, s in stats.items() if tier != 'test'),
+            'tier_active': {tier: s['active_count'] for tier, s in stats.items()}
+        }
+        
         vps_report = {
             'vps_status': {VPS_NAME: {
                 'status': 'healthy',
@@ -786,18 +1158,122 @@ def admin():
             }},
             'summary': {
                 'total_vps': 1,
-                'config_files_total': sum(data['total'] for data in availability.values())
+                'config_files_total': sum(len(ids) for ids in db.AVAILABLE_CONFIGS.values())
             }
         }
         
         return render_template('admin.html', 
                              vps_report=vps_report,
-                             service_tiers=SERVICE_TIERS,
-                             orders=orders_dict)
+                             service_tiers=service_tiers_with_capacity(availability),
+                             orders=orders_dict,
+                             order_summary=order_summary,
+                             availability=availability,
+                             next_cursor=page['next_cursor'])
     except Exception as e:
         logger.error(f"❌ Admin panel error: {e}", exc_info=True)
         return f"Admin panel error: {str(e)}", 500
 
+@app.route('/admin/api/orders')
+@admin_required
+def admin_api_orders():
+    """Keyset-paginated, filterable order listing
+    
+    Query args: limit, cursor, tier, status, timer_started, created_from,
+    created_to (ISO dates) and fields (comma-separated column list).
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', ADMIN_PAGE_SIZE)), 1), ADMIN_MAX_PAGE_SIZE)
+        fields = request.args.get('fields')
+        
+        page = db.get_orders_page(
+            limit=limit,
+            cursor=request.args.get('cursor'),
+            tier=request.args.get('tier'),
+            status=request.args.get('status'),
+            timer_started=parse_bool_arg(request.args.get('timer_started')),
+            created_from=parse_datetime_arg(request.args.get('created_from')),
+            created_to=parse_datetime_arg(request.args.get('created_to')),
+            columns=fields.split(',') if fields else None
+        )
+        
+        return jsonify({
+            'orders': [serialize_order(order) for order in page['orders']],
+            'count': len(page['orders']),
+            'next_cursor': page['next_cursor']
+        })
+        
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    except Exception as e:
+        logger.error(f"❌ Admin order API error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_FLUSH_ROWS = 500  # rows per chunk written to the response
+
+def export_value(value):
+    """One order field as text for CSV/NDJSON export"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return json.dumps(value, separators=(',', ':'))
+    return value
+
+@app.route('/admin/export/orders.<fmt>')
+@admin_required
+def admin_export_orders(fmt):
+    """Stream every order (archive included) as CSV or NDJSON, oldest first
+    
+    Query args: tier, status, created_from, created_to (ISO dates),
+    include_archive (default true) and fields (comma-separated column list).
+    """
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    
+    try:
+        fields = request.args.get('fields')
+        columns = [c for c in (fields.split(',') if fields else ORDER_COLUMNS) if c in ORDER_COLUMNS]
+        rows = db.iter_orders(
+            tier=request.args.get('tier'),
+            status=request.args.get('status'),
+            created_from=parse_datetime_arg(request.args.get('created_from')),
+            created_to=parse_datetime_arg(request.args.get('created_to')),
+            include_archive=parse_bool_arg(request.args.get('include_archive')) is not False,
+            columns=columns
+        )
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    
+    def generate():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(columns)
+        
+        exported = 0
+        try:
+            for row in rows:
+                if writer:
+                    writer.writerow([export_value(row.get(c)) for c in columns])
+                else:
+                    buffer.write(json.dumps({c: export_value(row.get(c)) for c in columns}) + '\n')
+                exported += 1
+                
+                if exported % EXPORT_FLUSH_ROWS == 0:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            rows.close()
+            logger.info(f"📤 Exported {exported} orders as {fmt}")
+    
+    filename = f"tunnelgrain_orders_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+    return Response(generate(), mimetype=EXPORT_FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'Cache-Control': 'no-store'
+    })
+
 @app.route('/admin/force-cleanup', methods=['POST'])
 @admin_required
 def admin_force_cleanup():
@@ -818,14 +1294,98 @@ def admin_force_cleanup():
             'error': str(e)
         }), 500
 
+@app.route('/admin/rebuild-stats', methods=['POST'])
+@admin_required
+def admin_rebuild_stats():
+    """Recompute the per-tier order counters from vpn_orders"""
+    try:
+        stats = db.rebuild_order_stats()
+        
+        return jsonify({
+            'success': True,
+            'stats': {tier: serialize_order(values) for tier, values in stats.items()}
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Stats rebuild error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/admin/archive-orders', methods=['POST'])
+@admin_required
+def admin_archive_orders():
+    """Move old expired orders out of the hot table"""
+    try:
+        retention_days = request.args.get('retention_days', type=int)
+        archived = db.archive_expired_orders(retention_days=retention_days)
+        
+        return jsonify({
+            'success': True,
+            'archived': archived,
+            'retention_days': db.ARCHIVE_RETENTION_DAYS if retention_days is None else retention_days
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Archive error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/admin/tier-quotas', methods=['GET', 'POST'])
+@admin_required
+def admin_tier_quotas():
+    """Soft per-tier quotas of the shared config pools
+    
+    POST {"quotas": {"annual": 20}, "pinned": true} sets quotas (pinned ones
+    are left alone by rebalancing), {"unpin": ["annual"]} hands tiers back to
+    rebalancing and {"rebalance": true} rebalances now.
+    """
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            quotas = data.get('quotas') or {}
+            unpin = data.get('unpin') or []
+            
+            unknown = [tier for tier in list(quotas) + list(unpin) if tier not in SERVICE_TIERS]
+            if unknown:
+                return jsonify({'success': False, 'error': f"Unknown tiers: {', '.join(map(str, unknown))}"}), 400
+            if any(not isinstance(quota, int) or isinstance(quota, bool) or quota < 0 for quota in quotas.values()):
+                return jsonify({'success': False, 'error': 'Quotas must be non-negative integers'}), 400
+            
+            if quotas:
+                db.set_tier_quotas(quotas, pinned=bool(data.get('pinned', False)))
+            if unpin:
+                current = db.get_tier_quotas()
+                db.set_tier_quotas({tier: current[tier]['quota'] for tier in unpin}, pinned=False)
+            if data.get('rebalance'):
+                db.rebalance_tier_quotas(force=True)
+        
+        return jsonify({
+            'success': True,
+            'quotas': {tier: serialize_order(entry) for tier, entry in db.get_tier_quotas().items()},
+            'availability': db.get_slot_availability()
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Tier quota error: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/admin/servers')
 @admin_required  
 def admin_servers():
     """VPS health dashboard"""
     vps_status = db.get_vps_status()
     
-    # Get availability
+    # Get availability and counters
     availability = db.get_slot_availability()
+    revenue_potential = tier_revenue_potential(availability)
+    stats = db.get_order_stats()
     
     # Build report structure
     vps_report = {
@@ -841,9 +1401,10 @@ def admin_servers():
         },
         'summary': {
             'total_vps': 1,
-            'active_orders': len([o for o in db.get_all_orders() if o.get('status') == 'active']),
-            'revenue_potential': sum(SERVICE_TIERS[tier]['price_cents'] * SERVICE_TIERS[tier]['capacity'] 
-                                   for tier in SERVICE_TIERS if tier != 'test')
+            'active_orders': sum(s['active_count'] for s in stats.values()),
+            'timers_started': sum(s['timers_started'] for s in stats.values()),
+            'revenue_cents': sum(s['revenue_cents'] for s in stats.values()),
+            'revenue_potential': sum(revenue_potential.values())
         },
         'timestamp': datetime.now().isoformat()
     }
@@ -852,7 +1413,8 @@ def admin_servers():
     for tier_name, tier_data in availability.items():
         vps_report['vps_status'][VPS_NAME]['tiers'][tier_name] = {
             'available': tier_data.get('available', 0),
-            'capacity': tier_data.get('total', SERVICE_TIERS[tier_name]['capacity'])
+            'capacity': tier_data.get('total', 0),
+            'revenue_potential_cents': revenue_potential.get(tier_name, 0)
         }
     
     return render_template('admin_servers.html',
@@ -872,7 +1434,7 @@ def api_status():
         for tier_name, tier_data in availability.items():
             tier_availability[tier_name] = {
                 'available': tier_data.get('available', 0),
-                'capacity': tier_data.get('total', SERVICE_TIERS[tier_name]['capacity']),
+                'capacity': tier_data.get('total', 0),
                 'price_cents': SERVICE_TIERS[tier_name]['price_cents']
             }
         
@@ -908,6 +1470,7 @@ def api_health():
             'stripe_configured': bool(STRIPE_PUBLISHABLE_KEY and STRIPE_SECRET_KEY),
             'stripe_mode': 'test' if STRIPE_PUBLISHABLE_KEY and 'test' in STRIPE_PUBLISHABLE_KEY else 'live',
             'database': db_health,
+            'config_store': config_store.stats(),
             'vps_endpoint': VPS_ENDPOINT
         })
         
@@ -918,6 +1481,34 @@ def api_health():
             'error': str(e)
         }), 500
 
+@app.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """List saved request profiles"""
+    profiles = profiler.list_profiles()
+    return jsonify({
+        'count': len(profiles),
+        'sample_rate': profiler.sample_rate,
+        'profiles': profiles
+    })
+
+@app.route('/admin/profiles/<name>')
+@admin_required
+def admin_download_profile(name):
+    """Download a saved profile (.prof, readable with pstats/snakeviz)"""
+    path = profiler.path_for(name)
+    if not path:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    return send_file(path, as_attachment=True, download_name=name,
+                     mimetype='application/octet-stream')
+
+@app.route('/metrics')
+@admin_required
+def metrics_endpoint():
+    """Prometheus text exposition for this worker process"""
+    return Response(metrics.REGISTRY.expose(), mimetype=metrics.CONTENT_TYPE)
+
 # === DEBUG ENDPOINTS ===
 
 @app.route('/api/debug-fingerprint')
@@ -949,7 +1540,8 @@ def debug_db():
             'availability': availability,
             'total_orders': len(orders),
             'active_orders': len(active_orders),
-            'recent_orders': orders[:5] if orders else []
+            'recent_orders': orders[:5] if orders else [],
+            'order_cache': db.order_cache.stats()
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -958,7 +1550,7 @@ def debug_db():
 
 @app.errorhandler(404)
 def not_found(error):
-    logger.warning(f"404 error: {request.url}")
+    logger.warning(f"404 error: {request.url}", extra={'event': 'not_found'})
     return render_template('404.html'), 404
 
 @app.errorhandler(500)
@@ -1081,6 +1673,11 @@ def cleanup_duplicates():
             cursor.close()
             conn.close()
             
+            # Deleted rows may still be sitting in the lookup caches and counters
+            db.order_cache.clear()
+            db.publish_invalidation(None)
+            db.rebuild_order_stats()
+            
             return jsonify({
                 'success': True,
                 'deleted_count': deleted_count,
@@ -1094,6 +1691,131 @@ def cleanup_duplicates():
             
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+# === CLI COMMANDS ===
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """Recompute order_stats from vpn_orders: flask --app app rebuild-stats"""
+    stats = db.rebuild_order_stats()
+    for tier, values in stats.items():
+        print(f"{tier}: active={values['active_count']} expired={values['expired_count']} "
+              f"timers_started={values['timers_started']} revenue_cents={values['revenue_cents']}")
+
+@app.cli.command('archive-orders')
+@click.option('--retention-days', type=int, default=None, help='Archive orders expired longer ago than this')
+@click.option('--batch-size', type=int, default=None)
+def archive_orders_command(retention_days, batch_size):
+    """Move old expired orders to the archive (run from cron): flask --app app archive-orders"""
+    archived = db.archive_expired_orders(retention_days=retention_days, batch_size=batch_size)
+    print(f"Archived {archived} orders")
+
+@app.cli.command('reconcile')
+@click.option('--dry-run', is_flag=True, help='Report drift without fixing it')
+def reconcile_command(dry_run):
+    """Repair drift between orders and the VPS daemon (run from cron): flask --app app reconcile"""
+    report = reconcile(db, VPS_ENDPOINT, dry_run=dry_run)
+    print(f"active orders={report['active_orders']} timers={report['active_timers']} live peers={report['live_peers']}")
+    print(f"missing timers={len(report['missing_timers'])} started={len(report['timers_started'])} "
+          f"awaiting download={report['awaiting_download']}")
+    print(f"stale peers={len(report['stale_peers'])} removed={len(report['peers_removed'])}")
+    print(f"orphan timers={len(report['orphan_timers'])} unmapped peer keys={report['unmapped_peer_keys']}")
+    for error in report['errors']:
+        print(f"error: {error}")
+
+@app.cli.command('recycle-configs')
+def recycle_configs_command():
+    """Regenerate keys for all expired configs now: flask --app app recycle-configs"""
+    total = 0
+    while True:
+        recycled = config_recycler.run_once()
+        total += recycled
+        if recycled < config_recycler.batch_size:
+            break
+    states = db.get_config_pool_states()
+    print(f"Recycled {total} configs; pool: " +
+          ', '.join(f"{state}={list(states.values()).count(state)}" for state in ('clean', 'dirty', 'regenerating')))
+
+@app.cli.command('sync-configs')
+@click.option('--dry-run', is_flag=True, help='List changed files without downloading them')
+@click.option('--prune', is_flag=True, help='Delete local files the VPS no longer has')
+def sync_configs_command(dry_run, prune):
+    """Download configs and QR codes that changed on the VPS: flask --app app sync-configs"""
+    report = sync_configs(VPS_ENDPOINT, vps_ip=VPS_IP, dry_run=dry_run, prune=prune)
+    print(f"remote files={report['remote_files']} unchanged={report['unchanged']} "
+          f"changed={len(report['changed'])} updated={len(report['updated'])}")
+    print(f"not on VPS={len(report['removed'])} pruned={len(report['pruned'])}")
+    for error in report['errors']:
+        print(f"error: {error}")
+    
+    # Downloads read the packed store, so repack whenever the tree changed
+    if not dry_run and (report['updated'] or report['pruned'] or not os.path.exists(store_path('vps_1', VPS_IP))):
+        packed = build_store('vps_1', VPS_IP)
+        print(f"config store: {packed['configs']} configs, {packed['qr_codes']} QR codes -> {packed['path']}")
+
+@app.cli.command('build-config-store')
+def build_config_store_command():
+    """Pack the config and QR tree into one memory-mapped store: flask --app app build-config-store"""
+    packed = build_store('vps_1', VPS_IP)
+    print(f"{packed['configs']} configs, {packed['qr_codes']} QR codes, {packed['bytes']} bytes -> {packed['path']}")
+
+@app.cli.command('explain-hot-queries')
+def explain_hot_queries_command():
+    """Check with EXPLAIN that the hot queries use their partial indexes: flask --app app explain-hot-queries"""
+    if db.mode != 'postgresql':
+        raise click.ClickException("explain-hot-queries needs DATABASE_URL")
+    
+    conn = db.get_connection()
+    try:
+        results = explain_hot_queries(conn, {
+            'used_configs': (['test'],),
+            'order_by_number': ('72000000',),
+            'expire_orders': (datetime.now(),)
+        })
+    finally:
+        conn.close()
+    
+    for name in HOT_QUERIES:
+        ok, scans = results[name]
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {scans}")
+    if not all(ok for ok, _ in results.values()):
+        raise click.ClickException("hot queries are not using their indexes")
+
+@app.cli.command('rebalance-quotas')
+@click.option('--force', is_flag=True, help='Rebalance even if the last rebalance is recent')
+@click.option('--dry-run', is_flag=True, help='Show the new quotas without storing them')
+def rebalance_quotas_command(force, dry_run):
+    """Move unpinned tier quotas toward recent demand: flask --app app rebalance-quotas"""
+    changes = db.rebalance_tier_quotas(force=force, dry_run=dry_run)
+    if changes is None:
+        print(f"last rebalance is less than {db.QUOTA_REBALANCE_HOURS}h old - use --force")
+        return
+    for tier, (old, new) in changes.items():
+        print(f"{tier}: {old} -> {new}{' (dry run)' if dry_run else ''}")
+
+@app.cli.command('migrate')
+@click.option('--status', is_flag=True, help='Show applied and pending migrations without applying')
+@click.option('--target', type=int, default=None, help='Stop at this schema version')
+def migrate_command(status, target):
+    """Apply pending schema migrations: flask --app app migrate"""
+    if db.mode != 'postgresql':
+        print("JSON mode - no schema to migrate")
+        return
+    
+    conn = db.connect_unchecked()
+    try:
+        applied = {version: applied_at for version, _, applied_at in migrations.applied_migrations(conn)}
+        if status:
+            for version, name, _ in migrations.MIGRATIONS:
+                state = f"applied {applied[version]:%Y-%m-%d %H:%M}" if version in applied else 'pending'
+                print(f"{version:>4}  {name:<40} {state}")
+            return
+        
+        done = migrations.migrate(conn, target)
+        print(f"Applied {len(done)} migration(s); schema version {migrations.current_version(conn)}")
+    finally:
+        conn.close()
+
 # === MAIN EXECUTION ===
 
 if __name__ == '__main__':
@@ -0,0 +1,57 @@
+def tier_headroom(free, active, quotas):
+    """Orders each tier of a shared pool can still take, given ``free`` unused configs.
+
+    Quotas are soft: a tier below its quota can always fill the rest of it
+    while configs are free, and past it a tier borrows whatever the other
+    tiers' unfilled quotas do not reserve. {tier: orders it can take now}
+    """
+    unmet = {tier: max(0, quota - active.get(tier, 0)) for tier, quota in quotas.items()}
+    total_unmet = sum(unmet.values())
+    return {
+        tier: max(0, min(free, max(unmet[tier], free - (total_unmet - unmet[tier]))))
+        for tier in quotas
+    }
+
+
+def split_quotas(budget, weights, minimum=1):
+    """Share ``budget`` between tiers in proportion to weights, at least ``minimum`` each"""
+    total = sum(weights.values())
+    if not total:
+        weights = {tier: 1 for tier in weights}  # no signal: share evenly
+        total = len(weights)
+    quotas = {tier: max(minimum, int(budget * weight / total)) for tier, weight in weights.items()}
+    # Hand out what rounding down left over, largest weight first
+    for tier in sorted(weights, key=lambda t: -weights[t]):
+        if sum(quotas.values()) >= budget:
+            break
+        quotas[tier] += 1
+    return quotas
+
+
+def rebalance_quotas(pool_size, current, demand, pinned=(), reserved_share=0.6, smoothing=0.5, minimum=1):
+    """New soft quotas for the tiers of one pool, following recent demand.
+
+    ``reserved_share`` of the pool is reserved through quotas; pinned tiers
+    keep theirs and use up part of it. The rest is never reserved, so any
+    tier can borrow it. Each unpinned quota moves ``smoothing`` of the way
+    from its current value toward its demand-proportional target; a tier
+    without sales keeps ``minimum``.
+    """
+    unpinned = [tier for tier in current if tier not in pinned]
+    budget = int(pool_size * reserved_share) - sum(current[tier] for tier in pinned)
+    budget = max(budget, minimum * len(unpinned))
+
+    # +1 so a tier without recent orders still gets a foothold
+    targets = split_quotas(budget, {tier: demand.get(tier, 0) + 1 for tier in unpinned}, minimum)
+
+    quotas = {tier: current[tier] for tier in pinned if tier in current}
+    for tier in unpinned:
+        quotas[tier] = max(minimum, int(round(current[tier] + smoothing * (targets[tier] - current[tier]))))
+
+    # Rounding can overshoot the budget: trim the largest quotas
+    while sum(quotas[tier] for tier in unpinned) > budget:
+        over = [tier for tier in unpinned if quotas[tier] > minimum]
+        if not over:
+            break
+        quotas[max(over, key=lambda tier: quotas[tier])] -= 1
+    return quotas
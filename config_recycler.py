@@ -0,0 +1,124 @@
+import base64
+import os
+import time
+import logging
+import threading
+
+import requests
+
+from config_sync import vps_headers
+from metrics import REGISTRY, VPS_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+CONFIGS_RECYCLED = REGISTRY.counter(
+    'tunnelgrain_configs_recycled_total', 'Expired configs given fresh keys', ('outcome',))
+
+
+class ConfigRecycler:
+    """Background worker that turns dirty (expired) configs back into sellable ones.
+
+    Each pass runs the expiry sweep (which marks expired configs dirty),
+    claims a batch of dirty configs, asks the daemon for fresh keypairs in
+    one call and stores the returned config and QR bytes. A daemon without
+    that endpoint (404/501) gets the configs back on sale unchanged.
+    Claims use SKIP LOCKED, so every gunicorn worker can run one of these safely.
+    Passes also rebalance tier quotas when due.
+    """
+
+    def __init__(self, db, vps_endpoint, batch_size=20, interval=5):
+        self.db = db
+        self.vps_endpoint = vps_endpoint
+        self.batch_size = batch_size
+        self.interval = interval
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    def run_once(self):
+        """One sweep + regeneration batch. Returns the number of configs made clean"""
+        self.db.cleanup_expired_orders()
+
+        claimed = self.db.claim_dirty_configs(self.batch_size)
+        if not claimed:
+            return 0
+
+        start = time.perf_counter()
+        try:
+            response = requests.post(
+                f"{self.vps_endpoint}/api/regenerate-peers",
+                json={'configs': [{'config_id': config_id, 'tier': tier} for config_id, tier in claimed]},
+                headers=vps_headers(),
+                timeout=60
+            )
+            VPS_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint='regenerate-peers',
+                                        outcome='ok' if response.status_code == 200 else f'http_{response.status_code}')
+            response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            if isinstance(e, requests.exceptions.RequestException) and e.response is None:
+                VPS_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint='regenerate-peers',
+                                            outcome='connection_error')
+            if isinstance(e, requests.exceptions.HTTPError) and e.response.status_code in (404, 501):
+                # Daemon without regenerate-peers: sell the configs again as they are instead
+                # of withholding them, or every expiry would shrink the pool for good
+                logger.warning(f"⚠️ Daemon cannot regenerate peers (HTTP {e.response.status_code}), "
+                               f"reusing {len(claimed)} configs unchanged")
+                self.db.release_configs([config_id for config_id, _ in claimed],
+                                        f"regenerate-peers unsupported (HTTP {e.response.status_code})")
+                CONFIGS_RECYCLED.inc(len(claimed), outcome='reused')
+                return len(claimed)
+            logger.error(f"❌ Config regeneration request failed: {e}")
+            self.db.store_fresh_configs({}, {config_id: str(e) for config_id, _ in claimed})
+            CONFIGS_RECYCLED.inc(len(claimed), outcome='failed')
+            return 0
+
+        fresh = {
+            config_id: {
+                'config': peer['config'],
+                'qr_png': base64.b64decode(peer['qr_png']),
+                'public_key': peer['public_key']
+            }
+            for config_id, peer in result.get('configs', {}).items()
+        }
+        failed = dict(result.get('failed', {}))
+        for config_id, _ in claimed:
+            if config_id not in fresh and config_id not in failed:
+                failed[config_id] = 'not returned by daemon'
+
+        self.db.store_fresh_configs(fresh, failed)
+        CONFIGS_RECYCLED.inc(len(fresh), outcome='clean')
+        CONFIGS_RECYCLED.inc(len(failed), outcome='failed')
+
+        if fresh:
+            logger.info(f"♻️ Recycled {len(fresh)} configs ({len(failed)} failed)")
+        return len(fresh)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            # Tier quotas are rebalanced here, off the request path (throttled, never raises)
+            self.db.maybe_rebalance_quotas()
+            try:
+                # Drain a backlog without waiting between full batches
+                if self.run_once() >= self.batch_size:
+                    continue
+            except Exception as e:
+                logger.error(f"❌ Config recycler pass failed: {e}")
+            self._stop.wait(self.interval)
+
+    def ensure_started(self):
+        """Start the worker thread once per process (cheap to call on every request)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='config-recycler', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+            logger.info(f"♻️ Config recycler started (every {self.interval}s, batch {self.batch_size})")
+
+    def stop(self):
+        self._stop.set()
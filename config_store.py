@@ -0,0 +1,176 @@
+import mmap
+import os
+import logging
+import struct
+import threading
+import time
+
+from config_sync import local_roots
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Packed store layout (little endian):
+#   header  magic, format version, reserved, entry count
+#   index   one fixed-size entry per config, sorted by config_id
+#   data    config and QR bytes, back to back
+MAGIC = b'TGCS'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sHHI')
+ENTRY = struct.Struct('<16s12sQIQI')  # config_id, tier, conf offset/length, qr offset/length
+
+# Seconds between checks for a rebuilt store file
+STORE_CHECK_INTERVAL = float(os.environ.get('CONFIG_STORE_CHECK_INTERVAL', 5))
+
+CONFIG_STORE_READS = REGISTRY.counter(
+    'tunnelgrain_config_store_reads_total', 'Config and QR reads from the packed store', ('kind', 'outcome'))
+
+
+def store_path(vps_name='vps_1', vps_ip='213.170.133.116'):
+    """One packed store per node, next to its config tree"""
+    return f"data/{vps_name}/ip_{vps_ip}.pack"
+
+
+def build_store(vps_name='vps_1', vps_ip='213.170.133.116', path=None):
+    """Pack every config and QR code of one node into a single store file.
+
+    Configs are read from the same trees config sync writes. The file is
+    written aside and renamed into place, so running apps switch to it on
+    their next check without ever seeing a partial store. Returns
+    {'configs', 'qr_codes', 'bytes', 'path'}.
+    """
+    path = path or store_path(vps_name, vps_ip)
+    roots = local_roots(vps_name, vps_ip)
+
+    entries = {}  # config_id -> [tier, conf bytes, qr bytes]
+    for top, suffix in (('configs', '.conf'), ('qr_codes', '.png')):
+        root = roots[top]
+        if not os.path.isdir(root):
+            continue
+        for tier in sorted(os.listdir(root)):
+            tier_dir = os.path.join(root, tier)
+            if not os.path.isdir(tier_dir):
+                continue
+            for name in sorted(os.listdir(tier_dir)):
+                if not name.endswith(suffix):
+                    continue
+                config_id = name[:-len(suffix)]
+                entry = entries.setdefault(config_id, [tier, b'', b''])
+                if entry[0] != tier:
+                    raise ValueError(f"{config_id} is in both {entry[0]} and {tier}")
+                with open(os.path.join(tier_dir, name), 'rb') as f:
+                    entry[1 if top == 'configs' else 2] = f.read()
+
+    ordered = sorted(entries.items())
+    offset = HEADER.size + ENTRY.size * len(ordered)
+    index, blobs = [], []
+    for config_id, (tier, conf, qr) in ordered:
+        if len(config_id.encode()) > 16 or len(tier.encode()) > 12:
+            raise ValueError(f"{tier}/{config_id}: name too long for the store index")
+        conf_offset = offset if conf else 0
+        offset += len(conf)
+        qr_offset = offset if qr else 0
+        offset += len(qr)
+        index.append(ENTRY.pack(config_id.encode(), tier.encode(), conf_offset, len(conf), qr_offset, len(qr)))
+        blobs.extend((conf, qr))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.build-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(ordered)))
+        f.writelines(index)
+        f.writelines(blobs)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    report = {
+        'configs': sum(1 for _, (_, conf, _) in ordered if conf),
+        'qr_codes': sum(1 for _, (_, _, qr) in ordered if qr),
+        'bytes': offset,
+        'path': path
+    }
+    logger.info(f"📦 Built config store {path}: {report['configs']} configs, "
+                f"{report['qr_codes']} QR codes, {offset} bytes")
+    return report
+
+
+class ConfigStore:
+    """Read side of a packed store: one mmap and an in-memory offset index.
+
+    get() is a dict lookup plus a memoryview slice of the mapping, no
+    filesystem access. The store file is stat'ed at most once every
+    ``check_interval`` seconds and remapped when a rebuild replaced it;
+    slices handed out earlier keep the old mapping alive until released.
+    """
+
+    def __init__(self, path, check_interval=STORE_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._state = None  # (file identity, mmap, {config_id: (tier, conf off, len, qr off, len)})
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._state = None
+                return
+            identity = (st.st_ino, st.st_size, st.st_mtime_ns)
+            if self._state is not None and self._state[0] == identity:
+                return
+            try:
+                self._state = (identity,) + self._map()
+            except (OSError, ValueError) as e:
+                logger.error(f"❌ Config store {self.path} unusable: {e}")
+                self._state = None
+
+    def _map(self):
+        with open(self.path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"not a version {FORMAT_VERSION} config store")
+        index = {}
+        for i in range(count):
+            config_id, tier, conf_offset, conf_length, qr_offset, qr_length = \
+                ENTRY.unpack_from(mm, HEADER.size + i * ENTRY.size)
+            index[config_id.rstrip(b'\0').decode()] = (
+                tier.rstrip(b'\0').decode(), conf_offset, conf_length, qr_offset, qr_length)
+        logger.info(f"📦 Mapped config store {self.path} ({count} configs)")
+        return mm, index
+
+    def available(self):
+        """True when a store file is present and readable"""
+        self._refresh()
+        return self._state is not None
+
+    def get(self, config_id, kind='conf', tier=None):
+        """Zero-copy view of a config ('conf') or QR code ('qr'); None if the store lacks it"""
+        self._refresh()
+        state = self._state
+        entry = state[2].get(config_id) if state else None
+        if entry is None or (tier is not None and entry[0] != tier):
+            CONFIG_STORE_READS.inc(kind=kind, outcome='missing')
+            return None
+        offset, length = (entry[1], entry[2]) if kind == 'conf' else (entry[3], entry[4])
+        if not length:
+            CONFIG_STORE_READS.inc(kind=kind, outcome='missing')
+            return None
+        CONFIG_STORE_READS.inc(kind=kind, outcome='hit')
+        return memoryview(state[1])[offset:offset + length]
+
+    def stats(self):
+        self._refresh()
+        state = self._state
+        if state is None:
+            return {'available': False, 'path': self.path}
+        return {'available': True, 'path': self.path, 'configs': len(state[2]), 'bytes': len(state[1])}
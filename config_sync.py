@@ -0,0 +1,168 @@
+import hashlib
+import io
+import os
+import logging
+import re
+import tarfile
+import time
+
+import requests
+
+from metrics import REGISTRY, VPS_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Must match TUNNELGRAIN_API_TOKEN on the VPS; guards endpoints that return private keys
+VPS_API_TOKEN = os.environ.get('VPS_API_TOKEN')
+
+# Paths per bundle request, keeps each tar.gz response to a few MB
+SYNC_BATCH_SIZE = int(os.environ.get('CONFIG_SYNC_BATCH', 500))
+
+# Same rule the daemon applies; anything else in a manifest is ignored
+SYNC_PATH_RE = re.compile(r'^(configs|qr_codes)/[a-z]+/[A-Za-z0-9_-]+\.(conf|png)$')
+
+CONFIGS_SYNCED = REGISTRY.counter(
+    'tunnelgrain_configs_synced_total', 'Config and QR files changed by config sync', ('action',))
+
+
+def vps_headers():
+    """Auth header for the daemon's protected endpoints"""
+    return {'X-Api-Token': VPS_API_TOKEN} if VPS_API_TOKEN else {}
+
+
+def _sha256(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def local_roots(vps_name, vps_ip):
+    """Daemon top-level directory -> where the web tier serves it from"""
+    return {
+        'configs': f"data/{vps_name}/ip_{vps_ip}",
+        'qr_codes': f"static/qr_codes/{vps_name}/ip_{vps_ip}",
+    }
+
+
+def _local_path(roots, rel):
+    top, rest = rel.split('/', 1)
+    return os.path.join(roots[top], rest)
+
+
+def local_manifest(vps_name='vps_1', vps_ip='213.170.133.116'):
+    """Same shape as the daemon's manifest, built from the files on this host"""
+    files = {}
+    for top, root in local_roots(vps_name, vps_ip).items():
+        suffix = '.conf' if top == 'configs' else '.png'
+        for dirpath, _, names in os.walk(root):
+            for name in names:
+                if name.endswith(suffix):
+                    full = os.path.join(dirpath, name)
+                    files[f"{top}/{os.path.relpath(full, root)}"] = _sha256(full)
+    return files
+
+
+def _fetch_bundle(vps_endpoint, paths):
+    """{path: bytes} for the requested manifest paths"""
+    start = time.perf_counter()
+    try:
+        response = requests.post(f"{vps_endpoint}/api/config-bundle", json={'paths': paths},
+                                 headers=vps_headers(), timeout=120)
+    except requests.exceptions.RequestException:
+        VPS_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint='config-bundle', outcome='connection_error')
+        raise
+    VPS_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint='config-bundle',
+                                outcome='ok' if response.status_code == 200 else f'http_{response.status_code}')
+    response.raise_for_status()
+
+    wanted = set(paths)
+    contents = {}
+    with tarfile.open(fileobj=io.BytesIO(response.content), mode='r:gz') as tar:
+        for member in tar:
+            if member.isfile() and member.name in wanted:
+                contents[member.name] = tar.extractfile(member).read()
+    return contents
+
+
+def _install(path, content):
+    """Write next to the target and rename over it, so readers never see a partial file"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.sync-{os.getpid()}"
+    with open(tmp_path, 'wb') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def sync_configs(vps_endpoint, vps_name='vps_1', vps_ip='213.170.133.116', dry_run=False, prune=False):
+    """Bring local config and QR files in line with the daemon's manifest.
+
+    Only files whose sha256 differs are downloaded, in tar.gz batches, and
+    each one is verified against the manifest before it replaces the local
+    copy. Files the daemon no longer has are deleted only with prune=True.
+    """
+    start = time.perf_counter()
+    try:
+        response = requests.get(f"{vps_endpoint}/api/config-manifest", timeout=60)
+    except requests.exceptions.RequestException:
+        VPS_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint='config-manifest',
+                                    outcome='connection_error')
+        raise
+    VPS_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint='config-manifest',
+                                outcome='ok' if response.status_code == 200 else f'http_{response.status_code}')
+    response.raise_for_status()
+    remote = {rel: digest for rel, digest in response.json()['files'].items() if SYNC_PATH_RE.match(rel)}
+
+    roots = local_roots(vps_name, vps_ip)
+    local = local_manifest(vps_name, vps_ip)
+
+    changed = sorted(rel for rel, digest in remote.items() if local.get(rel) != digest)
+    removed = sorted(set(local) - set(remote))
+
+    report = {
+        'dry_run': dry_run,
+        'remote_files': len(remote),
+        'unchanged': len(remote) - len(changed),
+        'changed': changed,
+        'updated': [],
+        'removed': removed,
+        'pruned': [],
+        'errors': []
+    }
+
+    if not dry_run:
+        for i in range(0, len(changed), SYNC_BATCH_SIZE):
+            batch = changed[i:i + SYNC_BATCH_SIZE]
+            try:
+                contents = _fetch_bundle(vps_endpoint, batch)
+            except Exception as e:
+                logger.error(f"❌ Config sync: bundle request failed: {e}")
+                report['errors'].append(f"config-bundle: {e}")
+                continue
+
+            for rel in batch:
+                content = contents.get(rel)
+                if content is None:
+                    report['errors'].append(f"{rel}: missing from bundle")
+                elif hashlib.sha256(content).hexdigest() != remote[rel]:
+                    # Changed on the VPS between manifest and bundle; the next run picks it up
+                    report['errors'].append(f"{rel}: hash mismatch")
+                else:
+                    _install(_local_path(roots, rel), content)
+                    report['updated'].append(rel)
+
+        if prune:
+            for rel in removed:
+                try:
+                    os.remove(_local_path(roots, rel))
+                    report['pruned'].append(rel)
+                except OSError as e:
+                    report['errors'].append(f"{rel}: {e}")
+
+    CONFIGS_SYNCED.inc(len(report['updated']), action='updated')
+    CONFIGS_SYNCED.inc(len(report['pruned']), action='pruned')
+
+    logger.info(f"🔄 Config sync: {len(changed)} changed, {len(report['updated'])} updated, "
+                f"{len(removed)} not on VPS, {len(report['errors'])} errors "
+                f"({(time.perf_counter() - start) * 1000:.0f} ms){' (dry run)' if dry_run else ''}")
+    return report
@@ -7,11 +7,75 @@ import uuid
 import logging
 import requests
 import hashlib
+import threading
+import base64
+import time
+from order_cache import OrderCache
+from db_pool import ConnectionPool, ReplicaSet, execute_prepared
+from invalidation import PgNotifyBus, FileBus
+from capacity import tier_headroom, split_quotas, rebalance_quotas
+from logging_setup import configure_logging
+from migrations import SCHEMA_VERSION, current_version, migrate
+from metrics import timed_query, VPS_REQUEST_SECONDS, EXPIRY_SWEEP_SECONDS, ORDERS_EXPIRED
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (no-op when app.py already did)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Columns that may be requested through the admin order API
+ORDER_COLUMNS = (
+    'order_id', 'order_number', 'tier', 'vps_name', 'vps_ip', 'config_id',
+    'status', 'price_cents', 'stripe_session_id', 'user_fingerprint',
+    'created_at', 'expires_at', 'timer_started', 'metadata'
+)
+
+def encode_order_cursor(created_at, order_id):
+    """Opaque keyset cursor for (created_at, order_id)"""
+    if isinstance(created_at, datetime):
+        created_at = created_at.isoformat()
+    return base64.urlsafe_b64encode(f"{created_at}|{order_id}".encode()).decode()
+
+def decode_order_cursor(cursor):
+    """Inverse of encode_order_cursor; raises ValueError on garbage"""
+    try:
+        created_at, order_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(created_at), order_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+class QuotaExceededError(Exception):
+    """Raised when a client already holds its share of test orders"""
+    pass
+
+class RecentFingerprintCache:
+    """Small in-process record of recent test orders per fingerprint.
+    
+    Only a fast pre-check: the authoritative count happens in the database
+    inside the allocation transaction.
+    """
+    def __init__(self, window_minutes, max_entries=10000):
+        self.window = timedelta(minutes=window_minutes)
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+    
+    def _recent(self, fingerprint, now):
+        return [t for t in self._entries.get(fingerprint, []) if now - t < self.window]
+    
+    def count(self, fingerprint):
+        with self._lock:
+            return len(self._recent(fingerprint, datetime.now()))
+    
+    def add(self, fingerprint):
+        now = datetime.now()
+        with self._lock:
+            self._entries[fingerprint] = self._recent(fingerprint, now) + [now]
+            
+            if len(self._entries) > self.max_entries:
+                for key in list(self._entries):
+                    if not self._recent(key, now):
+                        del self._entries[key]
+
 class TunnelgrainDB:
     def __init__(self):
         # Get database URL from environment
@@ -22,7 +86,7 @@ class TunnelgrainDB:
             'vps_1': os.environ.get('VPS_1_ENDPOINT', 'http://213.170.133.116:8081')
         }
         
-        # Define available configs per tier (static allocation)
+        # Configs as generated by complete_vps_setup.sh, by the tier directory their files live in
         self.AVAILABLE_CONFIGS = {
             'test': [f'72100{i:03X}' for i in range(1, 51)],  # 50 test configs
             'monthly': [f'42100{i:03X}' for i in range(51, 81)],  # 30 monthly
@@ -32,76 +96,216 @@ class TunnelgrainDB:
             'lifetime': [f'42100{i:03X}' for i in range(126, 131)],  # 5 lifetime
         }
         
+        # Paid tiers sell from one shared pool: any free paid config can be sold as any
+        # paid tier. Test configs (72 prefix) stay a pool of their own. Each config is
+        # tagged with the node it lives on; its generation tier only locates its files.
+        self.POOL_GROUPS = {
+            'test': ('test',),
+            'paid': ('monthly', 'quarterly', 'biannual', 'annual', 'lifetime'),
+        }
+        self.CONFIG_NODES = {config_id: 'vps_1' for ids in self.AVAILABLE_CONFIGS.values() for config_id in ids}
+        self.CONFIG_HOMES = {config_id: tier for tier, ids in self.AVAILABLE_CONFIGS.items() for config_id in ids}
+        
+        # Soft tier quotas inside a shared pool: QUOTA_RESERVED_SHARE of it is reserved through
+        # quotas, the rest any tier may take. Unpinned quotas follow the last QUOTA_DEMAND_DAYS
+        # of orders, recomputed at most every QUOTA_REBALANCE_HOURS by the config recycler
+        # thread or `flask rebalance-quotas`, never by a request.
+        self.QUOTA_RESERVED_SHARE = float(os.environ.get('QUOTA_RESERVED_SHARE', 0.6))
+        self.QUOTA_DEMAND_DAYS = int(os.environ.get('QUOTA_DEMAND_DAYS', 14))
+        self.QUOTA_REBALANCE_HOURS = float(os.environ.get('QUOTA_REBALANCE_HOURS', 24))
+        self.QUOTA_SMOOTHING = float(os.environ.get('QUOTA_SMOOTHING', 0.5))
+        self.QUOTA_RUN_MARKER = '_rebalance'  # tier_quotas row dating the last rebalance
+        self._quota_checked_at = None
+        
+        # Per-fingerprint test quota: N active or recent test orders per window
+        self.TEST_QUOTA_MAX = int(os.environ.get('TEST_QUOTA_MAX', 2))
+        self.TEST_QUOTA_WINDOW_MINUTES = int(os.environ.get('TEST_QUOTA_WINDOW_MINUTES', 60))
+        self.recent_fingerprints = RecentFingerprintCache(self.TEST_QUOTA_WINDOW_MINUTES)
+        
+        # Expired orders older than this move to the archive, in batches
+        self.ARCHIVE_RETENTION_DAYS = int(os.environ.get('ARCHIVE_RETENTION_DAYS', 30))
+        self.ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+        
+        # Rows fetched per round trip by the streaming order export
+        self.EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 2000))
+        
+        # Expired configs are withheld ("dirty") until the daemon has issued fresh keys
+        self.CONFIG_RECYCLING = os.environ.get('CONFIG_RECYCLING', 'true').lower() in ('1', 'true', 'yes')
+        
+        # Serializes read-modify-write cycles on the JSON file
+        self.json_lock = threading.RLock()
+        
+        # Writes are announced to every worker (NOTIFY/LISTEN, or a shared file in JSON mode)
+        # so each evicts its cached copies; set INVALIDATION_BUS=false to rely on TTLs alone
+        self.INVALIDATION_BUS = os.environ.get('INVALIDATION_BUS', 'true').lower() in ('1', 'true', 'yes')
+        self.bus = None
+        
+        # Read-through cache for order lookups (/check-order, downloads). With the
+        # invalidation bus the TTLs only bound staleness after a missed message.
+        self.order_cache = OrderCache(
+            max_entries=int(os.environ.get('ORDER_CACHE_SIZE', 10000)),
+            active_ttl=int(os.environ.get('ORDER_CACHE_TTL', 600 if self.INVALIDATION_BUS else 60)),
+            expired_ttl=int(os.environ.get('ORDER_CACHE_EXPIRED_TTL', 3600 if self.INVALIDATION_BUS else 600)),
+            missing_ttl=int(os.environ.get('ORDER_CACHE_MISSING_TTL', 30))
+        )
+        
+        # Connections are kept open between queries; hot statements are prepared once per connection
+        self.POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+        self.PREPARED_STATEMENTS = os.environ.get('DB_PREPARED_STATEMENTS', 'true').lower() in ('1', 'true', 'yes')
+        self.pool = None
+        self._pool_lock = threading.Lock()
+        
+        # Optional read replicas (comma-separated DSNs) for lookups, listings and exports.
+        # Order numbers written by this process read from the primary for PRIMARY_PIN_SECONDS.
+        self.replica_urls = [u.strip() for u in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if u.strip()]
+        self.REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', 5))
+        self.REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', 10))
+        self.PRIMARY_PIN_SECONDS = float(os.environ.get('PRIMARY_PIN_SECONDS', 5))
+        self.replicas = None
+        self._pinned = {}  # order_number -> monotonic deadline
+        self._pin_lock = threading.Lock()
+        
+        # Apply pending migrations on first connection (set DB_AUTO_MIGRATE=false to
+        # require an explicit 'flask migrate' during deploys instead)
+        self.AUTO_MIGRATE = os.environ.get('DB_AUTO_MIGRATE', 'true').lower() in ('1', 'true', 'yes')
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+        
         if self.database_url:
-            # PostgreSQL mode
+            # PostgreSQL mode; nothing touches the database until the first query
             self.mode = 'postgresql'
-            self.init_database()
-            logger.info("✅ PostgreSQL database initialized")
+            logger.info("✅ PostgreSQL mode configured")
         else:
             # Fallback to JSON mode
             self.mode = 'json'
             self.json_file = 'tunnelgrain_orders.json'
             self.init_json_db()
             logger.warning("⚠️ No DATABASE_URL found - using JSON fallback mode")
+        
+        if self.INVALIDATION_BUS:
+            if self.mode == 'postgresql':
+                # LISTEN needs a session: point INVALIDATION_DATABASE_URL past a transaction-mode pgbouncer
+                listen_url = os.environ.get('INVALIDATION_DATABASE_URL') or self.database_url
+                self.bus = PgNotifyBus(lambda: self.connect_unchecked(url=listen_url))
+            else:
+                self.bus = FileBus(os.path.splitext(self.json_file)[0] + '_invalidations.log')
+            self.bus.subscribe(self._on_invalidated)
+    
+    def _on_invalidated(self, order_numbers):
+        """Another worker changed these orders (None: anything may have changed)"""
+        if order_numbers is None:
+            self.order_cache.clear()
+        else:
+            self.order_cache.invalidate_many(order_numbers)
+    
+    def publish_invalidation(self, order_numbers, cursor=None):
+        """Make the other workers evict these orders (None: everything)
+        
+        With a cursor the NOTIFY joins the caller's transaction and is sent on
+        commit; an error then fails the write like any other statement.
+        Without one, a failure is only logged.
+        """
+        if self.bus is None:
+            return
+        if cursor is not None and self.mode == 'postgresql':
+            self.bus.publish(order_numbers, cursor)
+            return
+        try:
+            self.bus.publish(order_numbers)
+        except Exception as e:
+            logger.error(f"❌ Error publishing cache invalidation: {e}")
     
     def get_connection(self):
-        """Get PostgreSQL connection"""
+        """Get a pooled PostgreSQL connection; close() returns it to the pool"""
         if self.mode != 'postgresql':
             return None
         
+        if self.pool is None:
+            with self._pool_lock:
+                if self.pool is None:
+                    self.pool = ConnectionPool(self.connect_unchecked, max_idle=self.POOL_SIZE)
+        
+        conn = self.pool.get()
+        if not self._schema_ready:
+            try:
+                self.init_database(conn)
+            except Exception:
+                conn.close()
+                raise
+        return conn
+    
+    def get_read_connection(self, pin_key=None):
+        """Connection for a read that tolerates REPLICA_MAX_LAG_SECONDS of staleness
+        
+        Goes to a replica when one is configured and healthy, otherwise to
+        the primary. Reads of an order number this process wrote within the
+        last PRIMARY_PIN_SECONDS always go to the primary.
+        """
+        if not self.replica_urls or not self._schema_ready or self.is_pinned(pin_key):
+            return self.get_connection()
+        
+        if self.replicas is None:
+            with self._pool_lock:
+                if self.replicas is None:
+                    self.replicas = ReplicaSet(
+                        [lambda factory, url=url: self.connect_unchecked(factory, url) for url in self.replica_urls],
+                        max_lag=self.REPLICA_MAX_LAG_SECONDS,
+                        check_interval=self.REPLICA_CHECK_INTERVAL,
+                        max_idle=self.POOL_SIZE
+                    )
+        
+        return self.replicas.get() or self.get_connection()
+    
+    def pin_primary(self, order_numbers):
+        """Route reads of these order numbers to the primary for PRIMARY_PIN_SECONDS"""
+        if not self.replica_urls:
+            return
+        now = time.monotonic()
+        with self._pin_lock:
+            if len(self._pinned) > 10000:
+                self._pinned = {k: v for k, v in self._pinned.items() if v > now}
+            for order_number in order_numbers:
+                self._pinned[order_number] = now + self.PRIMARY_PIN_SECONDS
+    
+    def is_pinned(self, order_number):
+        if order_number is None:
+            return False
+        with self._pin_lock:
+            return self._pinned.get(order_number, 0) > time.monotonic()
+    
+    def connect_unchecked(self, connection_factory=None, url=None):
+        """Open a connection without the pool or the first-use schema check (migration tooling)"""
         # Handle Render's DATABASE_URL format
-        db_url = self.database_url
+        db_url = url or self.database_url
         if db_url.startswith('postgres://'):
             db_url = db_url.replace('postgres://', 'postgresql://', 1)
         
         try:
-            return psycopg2.connect(db_url, sslmode='require')
+            return psycopg2.connect(db_url, sslmode=os.environ.get('DATABASE_SSLMODE', 'require'),
+                                    connection_factory=connection_factory)
         except Exception as e:
             logger.error(f"❌ Database connection failed: {e}")
             raise
     
-    def init_database(self):
-        """Initialize PostgreSQL database tables"""
-        try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
-            # Create orders table with better structure
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS vpn_orders (
-                    order_id VARCHAR(36) PRIMARY KEY,
-                    order_number VARCHAR(20) UNIQUE NOT NULL,
-                    tier VARCHAR(20) NOT NULL,
-                    vps_name VARCHAR(50) DEFAULT 'vps_1',
-                    vps_ip VARCHAR(45) NOT NULL,
-                    config_id VARCHAR(50) NOT NULL,
-                    status VARCHAR(20) DEFAULT 'active',
-                    price_cents INTEGER DEFAULT 0,
-                    stripe_session_id VARCHAR(200),
-                    user_fingerprint VARCHAR(64),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    expires_at TIMESTAMP,
-                    timer_started BOOLEAN DEFAULT FALSE,
-                    metadata JSONB DEFAULT '{}'::jsonb
-                );
-            """)
-            
-            # Create indexes
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON vpn_orders (status);")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_number ON vpn_orders (order_number);")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_expires ON vpn_orders (expires_at);")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_config ON vpn_orders (config_id);")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_orders_tier_status ON vpn_orders (tier, status);")
-            
-            conn.commit()
-            cursor.close()
-            conn.close()
+    def init_database(self, conn):
+        """Make sure the schema is at SCHEMA_VERSION; a single SELECT when it already is"""
+        with self._schema_lock:
+            if self._schema_ready:
+                return
             
-            logger.info("✅ Database tables created/verified successfully")
-            
-        except Exception as e:
-            logger.error(f"❌ Database initialization failed: {e}")
-            raise
+            try:
+                version = current_version(conn)
+                if version < SCHEMA_VERSION:
+                    if not self.AUTO_MIGRATE:
+                        logger.warning(f"⚠️ Database schema at version {version}, code expects {SCHEMA_VERSION} - run 'flask --app app migrate'")
+                    else:
+                        applied = migrate(conn)
+                        logger.info(f"✅ Database migrated from version {version} to {SCHEMA_VERSION} ({len(applied)} applied)")
+                self._schema_ready = True
+                
+            except Exception as e:
+                logger.error(f"❌ Database initialization failed: {e}")
+                raise
     
     def init_json_db(self):
         """Initialize JSON fallback database"""
@@ -113,22 +317,53 @@ class TunnelgrainDB:
                     'version': '2.0'
                 }
             }
-            with open(self.json_file, 'w') as f:
-                json.dump(initial_data, f, indent=2)
+            self.write_json(initial_data)
             logger.info("✅ Created new JSON database file")
+        else:
+            with open(self.json_file, 'r') as f:
+                data = json.load(f)
+            if 'stats' not in data:
+                # File predates the counters section
+                self.rebuild_order_stats()
     
-    def get_used_configs(self, tier):
-        """Get list of config IDs currently in use for a tier"""
+    def write_json(self, data):
+        """Atomically replace the JSON database so readers never see a partial file"""
+        tmp_file = f"{self.json_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_file, self.json_file)
+    
+    def pool_group(self, tier):
+        """Name of the shared config pool a tier sells from"""
+        for group, tiers in self.POOL_GROUPS.items():
+            if tier in tiers:
+                return group
+        return tier
+    
+    def pool_configs(self, group, vps_name=None):
+        """Config IDs of a pool in allocation order, optionally only those on one node"""
+        return [config_id for tier in self.POOL_GROUPS.get(group, (group,))
+                for config_id in self.AVAILABLE_CONFIGS.get(tier, [])
+                if vps_name is None or self.CONFIG_NODES.get(config_id) == vps_name]
+    
+    def config_home(self, config_id):
+        """Tier directory holding the config's original files (not necessarily the tier it was sold as)"""
+        return self.CONFIG_HOMES.get(config_id)
+    
+    @timed_query
+    def get_used_configs(self, tier, replica=False):
+        """Get list of config IDs in use in the tier's pool (active orders plus configs awaiting fresh keys)
+        
+        replica=True allows a lagging read (display only, never allocation).
+        """
+        tiers = list(self.POOL_GROUPS.get(self.pool_group(tier), (tier,)))
         try:
             if self.mode == 'postgresql':
-                conn = self.get_connection()
+                conn = self.get_read_connection() if replica else self.get_connection()
                 cursor = conn.cursor()
                 
-                # Get all active configs for this tier
-                cursor.execute("""
-                    SELECT config_id FROM vpn_orders 
-                    WHERE tier = %s AND status = 'active'
-                """, (tier,))
+                # Get all active configs for this pool
+                execute_prepared(cursor, 'used_configs', (tiers,), self.PREPARED_STATEMENTS)
                 
                 used_configs = [row[0] for row in cursor.fetchall()]
                 cursor.close()
@@ -140,25 +375,29 @@ class TunnelgrainDB:
                 with open(self.json_file, 'r') as f:
                     data = json.load(f)
                 
-                used_configs = []
+                used_configs = set()
                 for order in data['orders'].values():
-                    if order.get('tier') == tier and order.get('status') == 'active':
-                        used_configs.append(order.get('config_id'))
+                    if order.get('tier') in tiers and order.get('status') == 'active':
+                        used_configs.add(order.get('config_id'))
+                for config_id, entry in data.get('config_pool', {}).items():
+                    if entry.get('tier') in tiers and entry.get('state') != 'clean':
+                        used_configs.add(config_id)
                 
-                return used_configs
+                return list(used_configs)
                 
         except Exception as e:
             logger.error(f"❌ Error getting used configs: {e}")
             return []
     
-    def get_available_config(self, tier):
-        """Get an available config ID for the given tier"""
+    @timed_query
+    def get_available_config(self, tier, vps_name='vps_1'):
+        """Get an available config ID on vps_name from the tier's pool"""
         try:
             # First cleanup expired orders
             self.cleanup_expired_orders()
             
-            # Get all configs for this tier
-            all_configs = self.AVAILABLE_CONFIGS.get(tier, [])
+            # Get all configs of this tier's pool on the node
+            all_configs = self.pool_configs(self.pool_group(tier), vps_name)
             if not all_configs:
                 logger.error(f"No configs defined for tier: {tier}")
                 return None
@@ -169,7 +408,7 @@ class TunnelgrainDB:
             # Find available configs
             available_configs = [c for c in all_configs if c not in used_configs]
             
-            logger.info(f"Tier {tier}: {len(available_configs)}/{len(all_configs)} configs available")
+            logger.debug(f"Tier {tier}: {len(available_configs)}/{len(all_configs)} configs available")
             
             if not available_configs:
                 logger.warning(f"No available configs for tier {tier}")
@@ -182,24 +421,24 @@ class TunnelgrainDB:
             logger.error(f"❌ Error getting available config: {e}")
             return None
     
+    @timed_query
     def create_order(self, tier, config_id=None, user_fingerprint=None, 
                 vps_name='vps_1', vps_ip='213.170.133.116', 
                 stripe_session_id=None):
-        """Create new VPN order with automatic config assignment"""
+        """Create new VPN order with automatic config assignment
+        
+        Raises QuotaExceededError when a test order would exceed the
+        per-fingerprint quota.
+        """
+        enforce_quota = tier == 'test' and user_fingerprint and self.TEST_QUOTA_MAX > 0
+        
         try:
-            # If no config_id provided, get an available one
-            if not config_id:
-                config_id = self.get_available_config(tier)
-                if not config_id:
-                    logger.error(f"No available configs for tier {tier}")
-                    return None, None
+            # Cheap in-process pre-check before touching the database
+            if enforce_quota and self.recent_fingerprints.count(user_fingerprint) >= self.TEST_QUOTA_MAX:
+                raise QuotaExceededError(f"Test quota reached for fingerprint {user_fingerprint}")
             
             order_id = str(uuid.uuid4())
             
-            # 🔥 FIX: USE CONFIG_ID AS ORDER_NUMBER!
-            # This ensures the order number matches the actual config file
-            order_number = config_id  # Use config_id directly as order_number
-            
             # Calculate expiration
             now = datetime.now()
             duration_map = {
@@ -218,55 +457,136 @@ class TunnelgrainDB:
             else:
                 expires_at = now + timedelta(minutes=duration_minutes)
             
+            quota_since = now - timedelta(minutes=self.TEST_QUOTA_WINDOW_MINUTES)
+            
             # Save to database
             if self.mode == 'postgresql':
+                if not config_id:
+                    self.cleanup_expired_orders()
+                
                 conn = self.get_connection()
                 cursor = conn.cursor()
                 
-                cursor.execute("""
-                    INSERT INTO vpn_orders 
-                    (order_id, order_number, tier, vps_name, vps_ip, config_id, 
-                    price_cents, stripe_session_id, user_fingerprint, expires_at, timer_started)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (order_id, order_number, tier, vps_name, vps_ip, config_id,
-                    price_cents, stripe_session_id, user_fingerprint, expires_at, False))
-                
-                conn.commit()
-                cursor.close()
-                conn.close()
+                try:
+                    # Serialize allocations per pool so quota checks and config
+                    # assignment see a consistent view until commit
+                    cursor.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (f"vpn_orders:{self.pool_group(tier)}",))
+                    
+                    if enforce_quota:
+                        cursor.execute("""
+                            SELECT COUNT(*) FROM vpn_orders
+                            WHERE user_fingerprint = %s AND tier = %s
+                            AND (created_at >= %s OR status = 'active')
+                        """, (user_fingerprint, tier, quota_since))
+                        
+                        if cursor.fetchone()[0] >= self.TEST_QUOTA_MAX:
+                            raise QuotaExceededError(f"Test quota reached for fingerprint {user_fingerprint}")
+                    
+                    # If no config_id provided, assign one inside the transaction
+                    if not config_id:
+                        group = self.pool_group(tier)
+                        execute_prepared(cursor, 'used_configs', (list(self.POOL_GROUPS.get(group, (tier,))),),
+                                         self.PREPARED_STATEMENTS)
+                        used_configs = set(row[0] for row in cursor.fetchall())
+                        
+                        available_configs = [c for c in self.pool_configs(group, vps_name) if c not in used_configs]
+                        if not available_configs:
+                            conn.rollback()
+                            logger.error(f"No available configs for tier {tier}")
+                            return None, None
+                        config_id = available_configs[0]
+                    
+                    # 🔥 FIX: USE CONFIG_ID AS ORDER_NUMBER!
+                    # This ensures the order number matches the actual config file
+                    order_number = config_id  # Use config_id directly as order_number
+                    
+                    cursor.execute("""
+                        INSERT INTO vpn_orders 
+                        (order_id, order_number, tier, vps_name, vps_ip, config_id, 
+                        price_cents, stripe_session_id, user_fingerprint, expires_at, timer_started)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    """, (order_id, order_number, tier, vps_name, vps_ip, config_id,
+                        price_cents, stripe_session_id, user_fingerprint, expires_at, False))
+                    
+                    self._bump_stats_pg(cursor, tier, active=1, revenue_cents=price_cents)
+                    self.publish_invalidation([order_number], cursor)
+                    
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                    conn.close()
                 
             else:
                 # JSON mode
-                with open(self.json_file, 'r') as f:
-                    data = json.load(f)
-                
-                data['orders'][order_id] = {
-                    'order_id': order_id,
-                    'order_number': order_number,
-                    'tier': tier,
-                    'vps_name': vps_name,
-                    'vps_ip': vps_ip,
-                    'config_id': config_id,
-                    'status': 'active',
-                    'price_cents': price_cents,
-                    'stripe_session_id': stripe_session_id,
-                    'user_fingerprint': user_fingerprint,
-                    'created_at': now.isoformat(),
-                    'expires_at': expires_at.isoformat(),
-                    'timer_started': False
-                }
-                
-                with open(self.json_file, 'w') as f:
-                    json.dump(data, f, indent=2)
+                with self.json_lock:
+                    # Quota first, like the PG path: a rejected request must not allocate a config
+                    if enforce_quota:
+                        with open(self.json_file, 'r') as f:
+                            data = json.load(f)
+                        recent = [
+                            o for o in data['orders'].values()
+                            if o.get('user_fingerprint') == user_fingerprint and o.get('tier') == tier
+                            and (o.get('status') == 'active' or o.get('created_at', '') >= quota_since.isoformat())
+                        ]
+                        if len(recent) >= self.TEST_QUOTA_MAX:
+                            raise QuotaExceededError(f"Test quota reached for fingerprint {user_fingerprint}")
+                    
+                    # If no config_id provided, get an available one
+                    if not config_id:
+                        config_id = self.get_available_config(tier, vps_name)
+                        if not config_id:
+                            logger.error(f"No available configs for tier {tier}")
+                            return None, None
+                    
+                    order_number = config_id  # Use config_id directly as order_number
+                    
+                    # Read after allocating: get_available_config may have expired orders meanwhile
+                    with open(self.json_file, 'r') as f:
+                        data = json.load(f)
+                    
+                    data['orders'][order_id] = {
+                        'order_id': order_id,
+                        'order_number': order_number,
+                        'tier': tier,
+                        'vps_name': vps_name,
+                        'vps_ip': vps_ip,
+                        'config_id': config_id,
+                        'status': 'active',
+                        'price_cents': price_cents,
+                        'stripe_session_id': stripe_session_id,
+                        'user_fingerprint': user_fingerprint,
+                        'created_at': now.isoformat(),
+                        'expires_at': expires_at.isoformat(),
+                        'timer_started': False
+                    }
+                    
+                    self._bump_stats_json(data, tier, active=1, revenue_cents=price_cents)
+                    
+                    self.write_json(data)
+                    self.publish_invalidation([order_number])
+            
+            if enforce_quota:
+                self.recent_fingerprints.add(user_fingerprint)
+            
+            # Drop any cached "not found" or previous order for this number
+            self.order_cache.invalidate(order_number)
+            self.pin_primary([order_number])
             
             logger.info(f"✅ Order created: {order_number} (tier: {tier}, config: {config_id})")
             
             return order_id, order_number
             
+        except QuotaExceededError:
+            logger.warning(f"⚠️ Test quota exceeded for fingerprint {user_fingerprint}")
+            raise
         except Exception as e:
             logger.error(f"❌ Error creating order: {e}", exc_info=True)
             return None, None
         
+    @timed_query
     def start_vps_timer(self, order_number, tier, duration_minutes, config_id, vps_name='vps_1'):
         """Start expiration timer on VPS"""
         try:
@@ -276,27 +596,29 @@ class TunnelgrainDB:
                 return False
             
             # Send timer request to VPS daemon
-            response = requests.post(
-                f"{vps_endpoint}/api/start-timer",
-                json={
-                    'order_number': order_number,
-                    'tier': tier,
-                    'duration_minutes': duration_minutes,
-                    'config_id': config_id
-                },
-                timeout=10  # Increased timeout
-            )
+            request_start = time.perf_counter()
+            try:
+                response = requests.post(
+                    f"{vps_endpoint}/api/start-timer",
+                    json={
+                        'order_number': order_number,
+                        'tier': tier,
+                        'duration_minutes': duration_minutes,
+                        'config_id': config_id
+                    },
+                    timeout=10  # Increased timeout
+                )
+            except requests.exceptions.RequestException:
+                VPS_REQUEST_SECONDS.observe(time.perf_counter() - request_start,
+                                            endpoint='start-timer', outcome='connection_error')
+                raise
+            
+            VPS_REQUEST_SECONDS.observe(time.perf_counter() - request_start, endpoint='start-timer',
+                                        outcome='ok' if response.status_code == 200 else f'http_{response.status_code}')
             
             if response.status_code == 200:
-                # Update timer_started flag in database
-                if self.mode == 'postgresql':
-                    conn = self.get_connection()
-                    cursor = conn.cursor()
-                    cursor.execute("UPDATE vpn_orders SET timer_started = TRUE WHERE order_number = %s", 
-                                (order_number,))
-                    conn.commit()
-                    cursor.close()
-                    conn.close()
+                # Update timer_started flag (and counters on first start) in database
+                self.mark_timers_started([order_number])
                 
                 logger.info(f"✅ VPS timer started for {order_number}")
                 return True
@@ -311,40 +633,160 @@ class TunnelgrainDB:
             logger.error(f"❌ VPS timer error: {e}")
             return False
     
-    def get_order_by_number(self, order_number):
-        """Get order by order number"""
-        try:
-            if self.mode == 'postgresql':
-                conn = self.get_connection()
-                cursor = conn.cursor(cursor_factory=RealDictCursor)
+    @timed_query
+    def mark_timers_started(self, order_numbers):
+        """Set timer_started on active orders in one statement; counts first starts only"""
+        order_numbers = list(order_numbers)
+        if not order_numbers:
+            return 0
+        
+        started_tiers = []
+        if self.mode == 'postgresql':
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE vpn_orders SET timer_started = TRUE
+                    WHERE order_number = ANY(%s) AND status = 'active' AND timer_started = FALSE
+                    RETURNING tier
+                """, (order_numbers,))
+                started_tiers = [row[0] for row in cursor.fetchall()]
+                for tier in set(started_tiers):
+                    self._bump_stats_pg(cursor, tier, timers_started=started_tiers.count(tier))
+                if started_tiers:
+                    self.publish_invalidation(order_numbers, cursor)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.close()
+        else:
+            wanted = set(order_numbers)
+            with self.json_lock:
+                with open(self.json_file, 'r') as f:
+                    data = json.load(f)
                 
-                cursor.execute("SELECT * FROM vpn_orders WHERE order_number = %s", (order_number,))
-                result = cursor.fetchone()
+                for order in data['orders'].values():
+                    if order.get('order_number') in wanted and order.get('status') == 'active' \
+                            and not order.get('timer_started'):
+                        order['timer_started'] = True
+                        started_tiers.append(order.get('tier'))
+                        self._bump_stats_json(data, order.get('tier'), timers_started=1)
                 
+                if started_tiers:
+                    self.write_json(data)
+                    self.publish_invalidation(order_numbers)
+        
+        self.order_cache.invalidate_many(order_numbers)
+        self.pin_primary(order_numbers)
+        return len(started_tiers)
+    
+    @timed_query
+    def get_order_states(self):
+        """{order_number: {tier, status, created_at, expires_at, timer_started}} for every order in the hot table
+        
+        When a config has been reissued the active order wins over older expired ones.
+        """
+        if self.mode == 'postgresql':
+            conn = self.get_connection()
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            try:
+                cursor.execute("""
+                    SELECT order_number, tier, status, created_at, expires_at, timer_started
+                    FROM vpn_orders
+                    ORDER BY (status = 'active'), created_at
+                """)
+                rows = [dict(row) for row in cursor.fetchall()]
+            finally:
                 cursor.close()
                 conn.close()
-                
-                return dict(result) if result else None
+        else:
+            with open(self.json_file, 'r') as f:
+                data = json.load(f)
+            
+            rows = []
+            for order in data['orders'].values():
+                expires_at = order.get('expires_at')
+                created_at = order.get('created_at')
+                rows.append({
+                    'order_number': order.get('order_number'),
+                    'tier': order.get('tier'),
+                    'status': order.get('status'),
+                    'created_at': datetime.fromisoformat(created_at) if created_at else None,
+                    'expires_at': datetime.fromisoformat(expires_at.replace('Z', '+00:00')) if expires_at else None,
+                    'timer_started': bool(order.get('timer_started'))
+                })
+            rows.sort(key=lambda r: (r['status'] == 'active', r['created_at'] or datetime.min))
+        
+        return {row['order_number']: row for row in rows}
+    
+    @timed_query
+    def get_order_by_number(self, order_number):
+        """Get order by order number (read-through cached)"""
+        if self.bus is not None:
+            self.bus.ensure_started()
+        hit, cached_order = self.order_cache.get(order_number)
+        if hit:
+            return cached_order
+        
+        try:
+            if self.mode == 'postgresql':
+                order = self._lookup_order_pg(self.get_read_connection(order_number), order_number)
+                if order is None and self.replicas is not None:
+                    # Another worker may have just created it and the replica not caught up yet
+                    order = self._lookup_order_pg(self.get_connection(), order_number)
             else:
                 # JSON mode
                 with open(self.json_file, 'r') as f:
                     data = json.load(f)
                 
-                for order in data['orders'].values():
-                    if order.get('order_number') == order_number:
-                        return order
+                # A reissued config has one active order and older expired ones
+                matches = [o for o in data['orders'].values() if o.get('order_number') == order_number]
+                order = max(matches, key=lambda o: (o.get('status') == 'active', o.get('created_at', ''))) \
+                    if matches else None
                 
-                return None
+                if order is None:
+                    archived = [o for o in data.get('archive', {}).values() if o.get('order_number') == order_number]
+                    if archived:
+                        order = max(archived, key=lambda o: o.get('created_at', ''))
+            
+            # Cache both hits and misses; errors below are never cached
+            self.order_cache.set(order_number, order)
+            return order
                 
         except Exception as e:
             logger.error(f"❌ Error getting order: {e}")
             return None
     
+    def _lookup_order_pg(self, conn, order_number):
+        try:
+            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            
+            # A reissued config has one active order and older expired ones
+            execute_prepared(cursor, 'order_by_number', (order_number,), self.PREPARED_STATEMENTS)
+            result = cursor.fetchone()
+            
+            if not result:
+                # Old orders live in the archive
+                cursor.execute("""
+                    SELECT * FROM vpn_orders_archive WHERE order_number = %s
+                    ORDER BY created_at DESC LIMIT 1
+                """, (order_number,))
+                result = cursor.fetchone()
+            
+            cursor.close()
+            return dict(result) if result else None
+        finally:
+            conn.close()
+    
+    @timed_query
     def get_all_orders(self):
         """Get all orders"""
         try:
             if self.mode == 'postgresql':
-                conn = self.get_connection()
+                conn = self.get_read_connection()
                 cursor = conn.cursor(cursor_factory=RealDictCursor)
                 
                 cursor.execute("""
@@ -371,48 +813,241 @@ class TunnelgrainDB:
             logger.error(f"❌ Error getting all orders: {e}")
             return []
     
+    @timed_query
+    def get_orders_page(self, limit=50, cursor=None, tier=None, status=None,
+                        timer_started=None, created_from=None, created_to=None, columns=None):
+        """Get one page of orders, newest first, using keyset pagination
+        
+        The cursor encodes the (created_at, order_id) of the last row of the
+        previous page, so every page costs the same however deep it is.
+        Returns {'orders': [...], 'next_cursor': str or None}.
+        """
+        columns = [c for c in (columns or ORDER_COLUMNS) if c in ORDER_COLUMNS]
+        for key_column in ('created_at', 'order_id'):
+            if key_column not in columns:
+                columns.append(key_column)
+        
+        after = decode_order_cursor(cursor) if cursor else None
+        
+        if self.mode == 'postgresql':
+            conditions = []
+            params = []
+            
+            if after:
+                conditions.append("(created_at, order_id) < (%s, %s)")
+                params.extend(after)
+            if tier:
+                conditions.append("tier = %s")
+                params.append(tier)
+            if status:
+                conditions.append("status = %s")
+                params.append(status)
+            if timer_started is not None:
+                conditions.append("timer_started = %s")
+                params.append(timer_started)
+            if created_from:
+                conditions.append("created_at >= %s")
+                params.append(created_from)
+            if created_to:
+                conditions.append("created_at < %s")
+                params.append(created_to)
+            
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            
+            conn = self.get_read_connection()
+            db_cursor = conn.cursor(cursor_factory=RealDictCursor)
+            
+            # Column names come from the ORDER_COLUMNS whitelist
+            db_cursor.execute(f"""
+                SELECT {', '.join(columns)} FROM vpn_orders
+                {where}
+                ORDER BY created_at DESC, order_id DESC
+                LIMIT %s
+            """, params + [limit + 1])
+            
+            rows = [dict(row) for row in db_cursor.fetchall()]
+            db_cursor.close()
+            conn.close()
+        else:
+            # JSON mode
+            with open(self.json_file, 'r') as f:
+                data = json.load(f)
+            
+            def matches(order):
+                if not order.get('created_at'):
+                    return False  # legacy row: nothing to order or page it by
+                created_at = datetime.fromisoformat(order.get('created_at'))
+                if after and (created_at, order.get('order_id')) >= after:
+                    return False
+                if tier and order.get('tier') != tier:
+                    return False
+                if status and order.get('status') != status:
+                    return False
+                if timer_started is not None and bool(order.get('timer_started')) != timer_started:
+                    return False
+                if created_from and created_at < created_from:
+                    return False
+                if created_to and created_at >= created_to:
+                    return False
+                return True
+            
+            orders = [o for o in data['orders'].values() if matches(o)]
+            orders.sort(key=lambda o: (o.get('created_at') or '', o.get('order_id') or ''), reverse=True)
+            rows = [{c: o.get(c) for c in columns} for o in orders[:limit + 1]]
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_order_cursor(rows[-1]['created_at'], rows[-1]['order_id'])
+        
+        return {'orders': rows, 'next_cursor': next_cursor}
+    
+    def iter_orders(self, tier=None, status=None, created_from=None, created_to=None,
+                    include_archive=True, columns=None, chunk_size=None):
+        """Yield orders oldest first, including archived ones unless include_archive=False
+        
+        PostgreSQL mode reads through a named (server-side) cursor fetching
+        chunk_size rows per round trip, so memory stays flat however many
+        orders match. The connection is held until the generator is exhausted
+        or closed.
+        """
+        columns = [c for c in (columns or ORDER_COLUMNS) if c in ORDER_COLUMNS]
+        chunk_size = chunk_size or self.EXPORT_CHUNK_SIZE
+        
+        if self.mode == 'postgresql':
+            conditions = []
+            params = []
+            
+            if tier:
+                conditions.append("tier = %s")
+                params.append(tier)
+            if status:
+                conditions.append("status = %s")
+                params.append(status)
+            if created_from:
+                conditions.append("created_at >= %s")
+                params.append(created_from)
+            if created_to:
+                conditions.append("created_at < %s")
+                params.append(created_to)
+            
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            # Column names come from the ORDER_COLUMNS whitelist
+            select = f"SELECT {', '.join(columns)}, created_at AS _sort_created, order_id AS _sort_id"
+            query = f"{select} FROM vpn_orders {where}"
+            if include_archive:
+                query += f" UNION ALL {select} FROM vpn_orders_archive {where}"
+                params = params * 2
+            
+            conn = self.get_read_connection()
+            db_cursor = conn.cursor(name=f"export_{uuid.uuid4().hex}", cursor_factory=RealDictCursor)
+            db_cursor.itersize = chunk_size
+            try:
+                db_cursor.execute(f"{query} ORDER BY _sort_created, _sort_id", params)
+                for row in db_cursor:
+                    row = dict(row)
+                    del row['_sort_created'], row['_sort_id']
+                    yield row
+            finally:
+                db_cursor.close()
+                conn.rollback()
+                conn.close()
+        else:
+            # JSON mode: the file is read whole, but rows are still produced lazily
+            with open(self.json_file, 'r') as f:
+                data = json.load(f)
+            
+            orders = list(data['orders'].values())
+            if include_archive:
+                orders.extend(data.get('archive', {}).values())
+            orders.sort(key=lambda o: (o.get('created_at') or '', o.get('order_id') or ''))
+            
+            for order in orders:
+                # Legacy rows without created_at are exported, but never match a date range
+                created_at = datetime.fromisoformat(order['created_at']) if order.get('created_at') else None
+                if tier and order.get('tier') != tier:
+                    continue
+                if status and order.get('status') != status:
+                    continue
+                if created_from and (created_at is None or created_at < created_from):
+                    continue
+                if created_to and (created_at is None or created_at >= created_to):
+                    continue
+                yield {c: order.get(c) for c in columns}
+    
+    @timed_query
     def cleanup_expired_orders(self):
         """Mark expired orders as expired"""
+        sweep_start = time.perf_counter()
         try:
             now = datetime.now()
             expired_count = 0
+            expired_numbers = []
             
             if self.mode == 'postgresql':
                 conn = self.get_connection()
                 cursor = conn.cursor()
                 
-                cursor.execute("""
-                    UPDATE vpn_orders 
-                    SET status = 'expired'
-                    WHERE status = 'active' AND expires_at < %s
-                    RETURNING order_id
-                """, (now,))
+                execute_prepared(cursor, 'expire_orders', (now,), self.PREPARED_STATEMENTS)
                 
-                expired_orders = cursor.fetchall()
-                expired_count = len(expired_orders)
+                expired_rows = cursor.fetchall()
+                expired_numbers = [row[0] for row in expired_rows]
+                expired_count = len(expired_numbers)
                 
+                expired_per_tier = {}
+                for _, tier, _ in expired_rows:
+                    expired_per_tier[tier] = expired_per_tier.get(tier, 0) + 1
+                for tier, count in expired_per_tier.items():
+                    self._bump_stats_pg(cursor, tier, active=-count, expired=count)
+                
+                if self.CONFIG_RECYCLING and expired_rows:
+                    # Same transaction: an expired config is never briefly "clean".
+                    # Pool rows carry the config's home tier: its files live there whatever it was sold as
+                    cursor.execute("""
+                        INSERT INTO config_pool (config_id, tier, state, updated_at)
+                        SELECT config_id, tier, 'dirty', CURRENT_TIMESTAMP
+                        FROM unnest(%s::varchar[], %s::varchar[]) AS expired (config_id, tier)
+                        ON CONFLICT (config_id) DO UPDATE SET state = 'dirty', updated_at = CURRENT_TIMESTAMP
+                    """, ([row[2] for row in expired_rows],
+                          [self.config_home(row[2]) or row[1] for row in expired_rows]))
+                
+                self.publish_invalidation(expired_numbers, cursor)
                 conn.commit()
                 cursor.close()
                 conn.close()
             else:
                 # JSON mode
-                with open(self.json_file, 'r') as f:
-                    data = json.load(f)
-                
-                for order in data['orders'].values():
-                    if order.get('status') == 'active':
-                        try:
-                            expires_at = datetime.fromisoformat(order['expires_at'].replace('Z', '+00:00'))
-                            if expires_at < now:
-                                order['status'] = 'expired'
-                                expired_count += 1
-                        except:
-                            pass
-                
-                with open(self.json_file, 'w') as f:
-                    json.dump(data, f, indent=2)
+                with self.json_lock:
+                    with open(self.json_file, 'r') as f:
+                        data = json.load(f)
+                    
+                    for order in data['orders'].values():
+                        if order.get('status') == 'active':
+                            try:
+                                expires_at = datetime.fromisoformat(order['expires_at'].replace('Z', '+00:00'))
+                                if expires_at < now:
+                                    order['status'] = 'expired'
+                                    expired_numbers.append(order.get('order_number'))
+                                    expired_count += 1
+                                    self._bump_stats_json(data, order.get('tier'), active=-1, expired=1)
+                                    if self.CONFIG_RECYCLING:
+                                        entry = data.setdefault('config_pool', {}).setdefault(
+                                            order.get('config_id'),
+                                            {'tier': self.config_home(order.get('config_id')) or order.get('tier'),
+                                             'generation': 0})
+                                        entry.update(state='dirty', updated_at=now.isoformat())
+                            except:
+                                pass
+                    
+                    self.write_json(data)
+                    self.publish_invalidation(expired_numbers)
+            
+            EXPIRY_SWEEP_SECONDS.observe(time.perf_counter() - sweep_start, mode=self.mode)
             
             if expired_count > 0:
+                ORDERS_EXPIRED.inc(expired_count, mode=self.mode)
+                self.order_cache.invalidate_many(expired_numbers)
+                self.pin_primary(expired_numbers)
                 logger.info(f"✅ Marked {expired_count} orders as expired")
             
             return expired_count
@@ -421,21 +1056,636 @@ class TunnelgrainDB:
             logger.error(f"❌ Error cleaning up orders: {e}")
             return 0
     
+    @timed_query
+    def archive_expired_orders(self, retention_days=None, batch_size=None, max_batches=None):
+        """Move expired orders older than the retention window to the archive, in batches
+        
+        Each batch is its own short transaction, so the sweep never holds locks
+        on more than batch_size rows and can be interrupted safely.
+        """
+        retention_days = self.ARCHIVE_RETENTION_DAYS if retention_days is None else retention_days
+        batch_size = batch_size or self.ARCHIVE_BATCH_SIZE
+        cutoff = datetime.now() - timedelta(days=retention_days)
+        columns = ', '.join(ORDER_COLUMNS)
+        archived = 0
+        batches = 0
+        
+        while max_batches is None or batches < max_batches:
+            if self.mode == 'postgresql':
+                conn = self.get_connection()
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(f"""
+                        WITH moved AS (
+                            DELETE FROM vpn_orders
+                            WHERE order_id IN (
+                                SELECT order_id FROM vpn_orders
+                                WHERE status = 'expired' AND expires_at < %s
+                                ORDER BY expires_at
+                                LIMIT %s
+                                FOR UPDATE SKIP LOCKED
+                            )
+                            RETURNING {columns}
+                        )
+                        INSERT INTO vpn_orders_archive ({columns})
+                        SELECT {columns} FROM moved
+                        RETURNING order_number
+                    """, (cutoff, batch_size))
+                    moved_numbers = [row[0] for row in cursor.fetchall()]
+                    self.publish_invalidation(moved_numbers, cursor)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+                    conn.close()
+            else:
+                with self.json_lock:
+                    with open(self.json_file, 'r') as f:
+                        data = json.load(f)
+                    
+                    candidates = []
+                    for order_id, order in data['orders'].items():
+                        if order.get('status') != 'expired' or not order.get('expires_at'):
+                            continue
+                        try:
+                            if datetime.fromisoformat(order['expires_at'].replace('Z', '+00:00')) < cutoff:
+                                candidates.append((order['expires_at'], order_id))
+                        except ValueError:
+                            pass
+                    
+                    archive = data.setdefault('archive', {})
+                    moved_numbers = []
+                    for _, order_id in sorted(candidates)[:batch_size]:
+                        order = data['orders'].pop(order_id)
+                        order['archived_at'] = datetime.now().isoformat()
+                        archive[order_id] = order
+                        moved_numbers.append(order.get('order_number'))
+                    
+                    if moved_numbers:
+                        self.write_json(data)
+                        self.publish_invalidation(moved_numbers)
+            
+            batches += 1
+            archived += len(moved_numbers)
+            self.order_cache.invalidate_many(moved_numbers)
+            
+            if len(moved_numbers) < batch_size:
+                break
+        
+        if archived:
+            logger.info(f"✅ Archived {archived} expired orders older than {retention_days} days ({batches} batches)")
+        return archived
+    
+    @timed_query
+    def claim_dirty_configs(self, limit=20, stale_after_seconds=300):
+        """Move up to limit dirty configs to 'regenerating' and return [(config_id, tier)]
+        
+        Claims left 'regenerating' for longer than stale_after_seconds (a
+        worker died mid-batch) are picked up again.
+        """
+        stale_before = datetime.now() - timedelta(seconds=stale_after_seconds)
+        
+        if self.mode == 'postgresql':
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE config_pool SET state = 'regenerating', updated_at = CURRENT_TIMESTAMP
+                    WHERE config_id IN (
+                        SELECT config_id FROM config_pool
+                        WHERE state = 'dirty' OR (state = 'regenerating' AND updated_at < %s)
+                        ORDER BY updated_at
+                        LIMIT %s
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING config_id, tier
+                """, (stale_before, limit))
+                claimed = [tuple(row) for row in cursor.fetchall()]
+                conn.commit()
+                return claimed
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.close()
+        else:
+            with self.json_lock:
+                with open(self.json_file, 'r') as f:
+                    data = json.load(f)
+                
+                pool = data.get('config_pool', {})
+                candidates = sorted(
+                    (entry.get('updated_at', ''), config_id) for config_id, entry in pool.items()
+                    if entry.get('state') == 'dirty'
+                    or (entry.get('state') == 'regenerating' and entry.get('updated_at', '') < stale_before.isoformat())
+                )[:limit]
+                
+                claimed = []
+                for _, config_id in candidates:
+                    pool[config_id].update(state='regenerating', updated_at=datetime.now().isoformat())
+                    claimed.append((config_id, pool[config_id]['tier']))
+                
+                if claimed:
+                    self.write_json(data)
+                return claimed
+    
+    @timed_query
+    def store_fresh_configs(self, fresh, failed=None):
+        """Save regenerated configs as clean ({config_id: {config, qr_png, public_key}}) and
+        return failed ones ({config_id: error}) to the dirty pool"""
+        failed = failed or {}
+        
+        if self.mode == 'postgresql':
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                for config_id, peer in fresh.items():
+                    cursor.execute("""
+                        UPDATE config_pool
+                        SET state = 'clean', generation = generation + 1, public_key = %s,
+                            config_text = %s, qr_png = %s, last_error = NULL, updated_at = CURRENT_TIMESTAMP
+                        WHERE config_id = %s
+                    """, (peer['public_key'], peer['config'], psycopg2.Binary(peer['qr_png']), config_id))
+                for config_id, error in failed.items():
+                    cursor.execute("""
+                        UPDATE config_pool SET state = 'dirty', last_error = %s, updated_at = CURRENT_TIMESTAMP
+                        WHERE config_id = %s
+                    """, (str(error)[:1000], config_id))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.close()
+        else:
+            with self.json_lock:
+                with open(self.json_file, 'r') as f:
+                    data = json.load(f)
+                
+                pool = data.setdefault('config_pool', {})
+                now = datetime.now().isoformat()
+                for config_id, peer in fresh.items():
+                    entry = pool.setdefault(config_id, {'generation': 0})
+                    entry.update(
+                        state='clean', generation=entry.get('generation', 0) + 1,
+                        public_key=peer['public_key'], config_text=peer['config'],
+                        qr_png=base64.b64encode(peer['qr_png']).decode(), last_error=None, updated_at=now
+                    )
+                for config_id, error in failed.items():
+                    if config_id in pool:
+                        pool[config_id].update(state='dirty', last_error=str(error)[:1000], updated_at=now)
+                
+                self.write_json(data)
+    
+    @timed_query
+    def release_configs(self, config_ids, reason):
+        """Put claimed configs back on sale unchanged, for a daemon that cannot regenerate keys
+        
+        They become clean with whatever they were last served with (the synced
+        files, or the previous fresh keys), as before recycling existed.
+        """
+        if not config_ids:
+            return
+        
+        if self.mode == 'postgresql':
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    UPDATE config_pool SET state = 'clean', last_error = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE config_id = ANY(%s) AND state = 'regenerating'
+                """, (str(reason)[:1000], list(config_ids)))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.close()
+        else:
+            with self.json_lock:
+                with open(self.json_file, 'r') as f:
+                    data = json.load(f)
+                
+                pool = data.get('config_pool', {})
+                now = datetime.now().isoformat()
+                for config_id in config_ids:
+                    if pool.get(config_id, {}).get('state') == 'regenerating':
+                        pool[config_id].update(state='clean', last_error=str(reason)[:1000], updated_at=now)
+                
+                self.write_json(data)
+    
+    @timed_query
+    def get_fresh_config(self, config_id):
+        """{'config_text', 'qr_png' (bytes), 'generation'} for a regenerated config, else None
+        
+        None means the files synced from the VPS are still current.
+        """
+        try:
+            if self.mode == 'postgresql':
+                conn = self.get_connection()
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute("""
+                    SELECT config_text, qr_png, generation FROM config_pool
+                    WHERE config_id = %s AND state = 'clean' AND config_text IS NOT NULL
+                """, (config_id,))
+                row = cursor.fetchone()
+                cursor.close()
+                conn.close()
+                
+                if not row:
+                    return None
+                return {'config_text': row['config_text'], 'qr_png': bytes(row['qr_png']) if row['qr_png'] else None,
+                        'generation': row['generation']}
+            else:
+                with open(self.json_file, 'r') as f:
+                    data = json.load(f)
+                
+                entry = data.get('config_pool', {}).get(config_id)
+                if not entry or entry.get('state') != 'clean' or not entry.get('config_text'):
+                    return None
+                return {'config_text': entry['config_text'],
+                        'qr_png': base64.b64decode(entry['qr_png']) if entry.get('qr_png') else None,
+                        'generation': entry.get('generation', 0)}
+                
+        except Exception as e:
+            logger.error(f"❌ Error getting fresh config {config_id}: {e}")
+            return None
+    
+    @timed_query
+    def get_config_pool_states(self):
+        """{config_id: state} for every config that has been through recycling"""
+        if self.mode == 'postgresql':
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("SELECT config_id, state FROM config_pool")
+                return dict(cursor.fetchall())
+            finally:
+                cursor.close()
+                conn.close()
+        else:
+            with open(self.json_file, 'r') as f:
+                data = json.load(f)
+            return {config_id: entry.get('state') for config_id, entry in data.get('config_pool', {}).items()}
+    
+    def _bump_stats_pg(self, cursor, tier, active=0, expired=0, timers_started=0, revenue_cents=0):
+        """Apply counter deltas to order_stats inside the caller's transaction"""
+        cursor.execute("""
+            INSERT INTO order_stats (tier, active_count, expired_count, timers_started, revenue_cents, updated_at)
+            VALUES (%s, %s, %s, %s, %s, CURRENT_TIMESTAMP)
+            ON CONFLICT (tier) DO UPDATE SET
+                active_count = order_stats.active_count + EXCLUDED.active_count,
+                expired_count = order_stats.expired_count + EXCLUDED.expired_count,
+                timers_started = order_stats.timers_started + EXCLUDED.timers_started,
+                revenue_cents = order_stats.revenue_cents + EXCLUDED.revenue_cents,
+                updated_at = CURRENT_TIMESTAMP
+        """, (tier, active, expired, timers_started, revenue_cents))
+    
+    @staticmethod
+    def _bump_stats_json(data, tier, active=0, expired=0, timers_started=0, revenue_cents=0):
+        """Apply counter deltas to the stats section of the JSON database"""
+        stats = data.setdefault('stats', {}).setdefault(tier, {
+            'active_count': 0, 'expired_count': 0, 'timers_started': 0, 'revenue_cents': 0
+        })
+        stats['active_count'] += active
+        stats['expired_count'] += expired
+        stats['timers_started'] += timers_started
+        stats['revenue_cents'] += revenue_cents
+        stats['updated_at'] = datetime.now().isoformat()
+    
+    @timed_query
+    def get_order_stats(self, replica=True):
+        """Get per-tier order counters"""
+        try:
+            if self.mode == 'postgresql':
+                conn = self.get_read_connection() if replica else self.get_connection()
+                cursor = conn.cursor(cursor_factory=RealDictCursor)
+                cursor.execute("SELECT * FROM order_stats")
+                stats = {row['tier']: dict(row) for row in cursor.fetchall()}
+                cursor.close()
+                conn.close()
+            else:
+                with open(self.json_file, 'r') as f:
+                    data = json.load(f)
+                stats = {tier: dict(values, tier=tier) for tier, values in data.get('stats', {}).items()}
+            
+            for tier in self.AVAILABLE_CONFIGS:
+                stats.setdefault(tier, {
+                    'tier': tier, 'active_count': 0, 'expired_count': 0,
+                    'timers_started': 0, 'revenue_cents': 0
+                })
+            
+            return stats
+            
+        except Exception as e:
+            logger.error(f"❌ Error getting order stats: {e}")
+            return {}
+    
+    @timed_query
+    def rebuild_order_stats(self):
+        """Recompute order_stats from vpn_orders and the archive (drift repair)"""
+        if self.mode == 'postgresql':
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("LOCK TABLE order_stats IN EXCLUSIVE MODE")
+                cursor.execute("DELETE FROM order_stats")
+                cursor.execute("""
+                    INSERT INTO order_stats (tier, active_count, expired_count, timers_started, revenue_cents, updated_at)
+                    SELECT tier,
+                           COUNT(*) FILTER (WHERE status = 'active'),
+                           COUNT(*) FILTER (WHERE status = 'expired'),
+                           COUNT(*) FILTER (WHERE timer_started),
+                           COALESCE(SUM(price_cents), 0),
+                           CURRENT_TIMESTAMP
+                    FROM (
+                        SELECT tier, status, timer_started, price_cents FROM vpn_orders
+                        UNION ALL
+                        SELECT tier, status, timer_started, price_cents FROM vpn_orders_archive
+                    ) all_orders
+                    GROUP BY tier
+                """)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.close()
+        else:
+            with self.json_lock:
+                with open(self.json_file, 'r') as f:
+                    data = json.load(f)
+                
+                data['stats'] = {}
+                for order in list(data['orders'].values()) + list(data.get('archive', {}).values()):
+                    self._bump_stats_json(
+                        data, order.get('tier'),
+                        active=1 if order.get('status') == 'active' else 0,
+                        expired=1 if order.get('status') == 'expired' else 0,
+                        timers_started=1 if order.get('timer_started') else 0,
+                        revenue_cents=order.get('price_cents') or 0
+                    )
+                
+                self.write_json(data)
+        
+        logger.info("✅ Order stats rebuilt from vpn_orders")
+        return self.get_order_stats(replica=False)
+    
+    def default_tier_quotas(self):
+        """Starting quotas: the reserved share of each pool split like the original fixed ranges"""
+        quotas = {}
+        for group, tiers in self.POOL_GROUPS.items():
+            pool_size = len(self.pool_configs(group))
+            if len(tiers) == 1:
+                quotas[tiers[0]] = pool_size
+            else:
+                quotas.update(split_quotas(int(pool_size * self.QUOTA_RESERVED_SHARE),
+                                           {tier: len(self.AVAILABLE_CONFIGS.get(tier, [])) for tier in tiers}))
+        return quotas
+    
+    def _stored_tier_quotas(self, cursor=None, replica=False):
+        """tier_quotas rows by tier, the rebalance marker row included"""
+        if self.mode == 'postgresql':
+            own = cursor is None
+            conn = (self.get_read_connection() if replica else self.get_connection()) if own else None
+            cursor = conn.cursor() if own else cursor
+            try:
+                cursor.execute("SELECT tier, quota, pinned, updated_by, updated_at FROM tier_quotas")
+                rows = cursor.fetchall()
+            finally:
+                if own:
+                    cursor.close()
+                    conn.close()
+            return {row[0]: dict(zip(('tier', 'quota', 'pinned', 'updated_by', 'updated_at'), row)) for row in rows}
+        
+        with open(self.json_file, 'r') as f:
+            data = json.load(f)
+        stored = {}
+        for tier, entry in data.get('tier_quotas', {}).items():
+            updated_at = entry.get('updated_at')
+            stored[tier] = dict(entry, tier=tier, updated_at=datetime.fromisoformat(updated_at) if updated_at else None)
+        return stored
+    
+    @timed_query
+    def get_tier_quotas(self, replica=False, cursor=None):
+        """{tier: {'quota', 'pinned', 'updated_by', 'updated_at'}}; tiers never set use the defaults"""
+        stored = self._stored_tier_quotas(cursor, replica)
+        quotas = {}
+        for tier, quota in self.default_tier_quotas().items():
+            quotas[tier] = stored.get(tier) or {
+                'tier': tier, 'quota': quota, 'pinned': False, 'updated_by': 'default', 'updated_at': None
+            }
+        return quotas
+    
+    @timed_query
+    def set_tier_quotas(self, quotas, pinned=False, updated_by='admin', cursor=None):
+        """Store quotas ({tier: quota}); pinned quotas are left alone by rebalancing"""
+        now = datetime.now()
+        if self.mode == 'postgresql':
+            own = cursor is None
+            conn = self.get_connection() if own else None
+            cursor = conn.cursor() if own else cursor
+            try:
+                for tier, quota in quotas.items():
+                    cursor.execute("""
+                        INSERT INTO tier_quotas (tier, quota, pinned, updated_by, updated_at)
+                        VALUES (%s, %s, %s, %s, %s)
+                        ON CONFLICT (tier) DO UPDATE SET quota = EXCLUDED.quota, pinned = EXCLUDED.pinned,
+                            updated_by = EXCLUDED.updated_by, updated_at = EXCLUDED.updated_at
+                    """, (tier, int(quota), pinned, updated_by, now))
+                if own:
+                    conn.commit()
+            except Exception:
+                if own:
+                    conn.rollback()
+                raise
+            finally:
+                if own:
+                    cursor.close()
+                    conn.close()
+        else:
+            with self.json_lock:
+                with open(self.json_file, 'r') as f:
+                    data = json.load(f)
+                stored = data.setdefault('tier_quotas', {})
+                for tier, quota in quotas.items():
+                    stored[tier] = {'quota': int(quota), 'pinned': pinned, 'updated_by': updated_by,
+                                    'updated_at': now.isoformat()}
+                self.write_json(data)
+        
+        shown = {tier: quota for tier, quota in quotas.items() if tier != self.QUOTA_RUN_MARKER}
+        if shown:
+            logger.info(f"📊 Tier quotas set by {updated_by}: "
+                        f"{', '.join(f'{tier}={quota}' for tier, quota in shown.items())}{' (pinned)' if pinned else ''}")
+    
+    @timed_query
+    def get_tier_demand(self, days=None, cursor=None):
+        """Orders created per tier over the last days (QUOTA_DEMAND_DAYS)"""
+        since = datetime.now() - timedelta(days=self.QUOTA_DEMAND_DAYS if days is None else days)
+        if self.mode == 'postgresql':
+            own = cursor is None
+            conn = self.get_connection() if own else None
+            cursor = conn.cursor() if own else cursor
+            try:
+                cursor.execute("SELECT tier, COUNT(*) FROM vpn_orders WHERE created_at >= %s GROUP BY tier", (since,))
+                return dict(cursor.fetchall())
+            finally:
+                if own:
+                    cursor.close()
+                    conn.close()
+        
+        with open(self.json_file, 'r') as f:
+            data = json.load(f)
+        demand = {}
+        for order in data['orders'].values():
+            if (order.get('created_at') or '') >= since.isoformat():
+                demand[order.get('tier')] = demand.get(order.get('tier'), 0) + 1
+        return demand
+    
+    @timed_query
+    def rebalance_tier_quotas(self, force=False, dry_run=False):
+        """Move unpinned quotas of every shared pool toward recent demand
+        
+        Without force, does nothing when the last rebalance is less than
+        QUOTA_REBALANCE_HOURS old (any worker's). Reads, computes and writes
+        under one lock, on the primary. Every run is recorded, even one that
+        changes nothing. Returns {tier: (old, new)} for the tiers it
+        recomputed, or None when it was not due.
+        """
+        cutoff = datetime.now() - timedelta(hours=self.QUOTA_REBALANCE_HOURS)
+        
+        def plan(cursor=None):
+            stored = self._stored_tier_quotas(cursor)
+            last = stored.get(self.QUOTA_RUN_MARKER, {}).get('updated_at')
+            if not force and last and last > cutoff:
+                return None
+            quotas = self.get_tier_quotas(cursor=cursor)
+            demand = self.get_tier_demand(cursor=cursor)
+            changes = {}
+            for group, tiers in self.POOL_GROUPS.items():
+                if len(tiers) < 2:
+                    continue
+                current = {tier: quotas[tier]['quota'] for tier in tiers}
+                pinned = [tier for tier in tiers if quotas[tier]['pinned']]
+                if sum(demand.get(tier, 0) for tier in tiers):
+                    new = rebalance_quotas(len(self.pool_configs(group)), current, demand,
+                                           pinned=pinned, reserved_share=self.QUOTA_RESERVED_SHARE,
+                                           smoothing=self.QUOTA_SMOOTHING)
+                else:
+                    new = current  # no orders to learn from: keep quotas
+                changes.update({tier: (current[tier], new[tier]) for tier in tiers if tier not in pinned})
+            return changes
+        
+        def record(changes, cursor=None):
+            # The marker row dates the run, so a run that changed nothing still counts
+            self.set_tier_quotas({**{tier: new for tier, (_, new) in changes.items()}, self.QUOTA_RUN_MARKER: 0},
+                                 updated_by='auto', cursor=cursor)
+        
+        if self.mode == 'postgresql':
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            try:
+                # One rebalance at a time across workers; the second one finds it already done
+                cursor.execute("SELECT pg_advisory_xact_lock(hashtext('tier_quotas:rebalance'))")
+                changes = plan(cursor)
+                if changes is not None and not dry_run:
+                    record(changes, cursor)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+                conn.close()
+        else:
+            with self.json_lock:
+                changes = plan()
+                if changes is not None and not dry_run:
+                    record(changes)
+        
+        moved = {tier: change for tier, change in (changes or {}).items() if change[0] != change[1]}
+        if moved:
+            logger.info(f"📊 Rebalanced tier quotas{' (dry run)' if dry_run else ''}: "
+                        f"{', '.join(f'{tier} {old}->{new}' for tier, (old, new) in moved.items())}")
+        return changes
+    
+    def maybe_rebalance_quotas(self):
+        """Rebalance if due, for background threads: checked at most every 10 minutes per process, never raises"""
+        now = time.monotonic()
+        if self._quota_checked_at is not None and now - self._quota_checked_at < 600:
+            return
+        self._quota_checked_at = now
+        try:
+            self.rebalance_tier_quotas()
+        except Exception as e:
+            logger.error(f"❌ Error rebalancing tier quotas: {e}")
+    
+    @timed_query
+    def get_pool_usage(self, group, replica=False):
+        """(config IDs in use, {tier: active orders}) for one pool"""
+        tiers = list(self.POOL_GROUPS.get(group, (group,)))
+        if self.mode == 'postgresql':
+            conn = self.get_read_connection() if replica else self.get_connection()
+            cursor = conn.cursor()
+            try:
+                cursor.execute("""
+                    SELECT config_id, tier, TRUE FROM vpn_orders WHERE status = 'active' AND tier = ANY(%s)
+                    UNION ALL
+                    SELECT config_id, tier, FALSE FROM config_pool WHERE state <> 'clean' AND tier = ANY(%s)
+                """, (tiers, tiers))
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+                conn.close()
+        else:
+            with open(self.json_file, 'r') as f:
+                data = json.load(f)
+            rows = [(o.get('config_id'), o.get('tier'), True) for o in data['orders'].values()
+                    if o.get('status') == 'active' and o.get('tier') in tiers]
+            rows += [(config_id, entry.get('tier'), False) for config_id, entry in data.get('config_pool', {}).items()
+                     if entry.get('state') != 'clean' and entry.get('tier') in tiers]
+        
+        active = {}
+        for _, tier, is_order in rows:
+            if is_order:
+                active[tier] = active.get(tier, 0) + 1
+        return {row[0] for row in rows}, active
+    
+    @timed_query
     def get_slot_availability(self):
-        """Get available slots per tier"""
+        """Sellable slots per tier from the shared pools and the soft tier quotas
+        
+        {tier: {'total', 'used', 'available', 'quota', 'pinned', 'pool', 'pool_size', 'pool_free'}}:
+        used is the tier's active orders, available what it can sell right now
+        and total their sum, so it moves with the quotas and the other tiers.
+        """
         try:
+            quotas = self.get_tier_quotas(replica=True)
             availability = {}
             
-            for tier, all_configs in self.AVAILABLE_CONFIGS.items():
-                used_configs = len(self.get_used_configs(tier))
-                total_configs = len(all_configs)
-                available = total_configs - used_configs
+            for group, tiers in self.POOL_GROUPS.items():
+                pool = self.pool_configs(group)
+                used, active = self.get_pool_usage(group, replica=True)
+                free = len(set(pool) - used)
+                headroom = tier_headroom(free, active, {tier: quotas[tier]['quota'] for tier in tiers})
                 
-                availability[tier] = {
-                    'total': total_configs,
-                    'used': used_configs,
-                    'available': available
-                }
+                for tier in tiers:
+                    availability[tier] = {
+                        'total': active.get(tier, 0) + headroom[tier],
+                        'used': active.get(tier, 0),
+                        'available': headroom[tier],
+                        'quota': quotas[tier]['quota'],
+                        'pinned': quotas[tier]['pinned'],
+                        'pool': group,
+                        'pool_size': len(pool),
+                        'pool_free': free
+                    }
             
             return availability
             
@@ -457,6 +1707,7 @@ class TunnelgrainDB:
             logger.error(f"❌ Error getting VPS status: {e}")
             return {'error': str(e)}
     
+    @timed_query
     def health_check(self):
         """Check database health"""
         try:
@@ -466,10 +1717,48 @@ class TunnelgrainDB:
                 cursor.execute("SELECT 1")
                 cursor.close()
                 conn.close()
-                return {'status': 'healthy', 'mode': 'postgresql'}
+                health = {'status': 'healthy', 'mode': 'postgresql'}
+                if self.replica_urls:
+                    # Each replica's last lag check; a lagging replica only degrades reads to the primary
+                    health['replicas'] = self.replicas.status() if self.replicas else 'not used yet'
+                return health
             else:
                 return {'status': 'healthy', 'mode': 'json'}
                 
         except Exception as e:
             logger.error(f"❌ Health check failed: {e}")
-            return {'status': 'error', 'mode': self.mode, 'error': str(e)}
\ No newline at end of file
+            return {'status': 'error', 'mode': self.mode, 'error': str(e)}
+
+
+class LazyDB:
+    """Stand-in for TunnelgrainDB that builds it on first use, once per process.
+    
+    Importing the app (e.g. gunicorn --preload) stays free of database work,
+    and each forked worker gets its own instance, locks and caches.
+    """
+    def __init__(self, factory=TunnelgrainDB):
+        self._factory = factory
+        self._instance = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._on_create = []
+    
+    def on_create(self, callback):
+        """Call callback(instance) for each process's instance, e.g. to subscribe to it"""
+        self._on_create.append(callback)
+        return callback
+    
+    def get(self):
+        """The process's TunnelgrainDB, created on first call"""
+        if self._instance is None or self._pid != os.getpid():
+            with self._lock:
+                if self._instance is None or self._pid != os.getpid():
+                    instance = self._factory()
+                    for callback in self._on_create:
+                        callback(instance)
+                    self._instance = instance
+                    self._pid = os.getpid()
+        return self._instance
+    
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
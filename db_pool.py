@@ -0,0 +1,279 @@
+import re
+import time
+import logging
+import threading
+
+import psycopg2
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+# Hot statements, prepared once per pooled connection. $n placeholders; the
+# names double as the PREPARE names, so keep them unique and SQL-safe.
+HOT_QUERIES = {
+    'used_configs': """
+        SELECT config_id FROM vpn_orders
+        WHERE tier = ANY($1::varchar[]) AND status = 'active'
+        UNION
+        SELECT config_id FROM config_pool
+        WHERE tier = ANY($1::varchar[]) AND state <> 'clean'
+    """,
+    'order_by_number': """
+        SELECT order_id, order_number, tier, vps_name, vps_ip, config_id, status, price_cents,
+               stripe_session_id, user_fingerprint, created_at, expires_at, timer_started, metadata
+        FROM vpn_orders WHERE order_number = $1
+        ORDER BY (status = 'active') DESC, created_at DESC
+        LIMIT 1
+    """,
+    'expire_orders': """
+        UPDATE vpn_orders
+        SET status = 'expired'
+        WHERE status = 'active' AND expires_at < $1
+        RETURNING order_number, tier, config_id
+    """,
+}
+
+# Index each hot query must be able to use, and whether the scan should be index-only
+HOT_QUERY_INDEXES = {
+    'used_configs': ('idx_orders_active_tier_config', True),
+    'order_by_number': ('idx_orders_number', False),
+    'expire_orders': ('idx_orders_active_expires', False),
+}
+
+_PLACEHOLDER_RE = re.compile(r'\$(\d+)')
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose close() hands it back to its pool"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.checked_out = False
+        self.prepared = set()
+        self.idle_since = time.monotonic()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.put(self)
+        else:
+            super().close()
+
+    def discard(self):
+        """Really close the connection"""
+        self.pool = None
+        if not self.closed:
+            super().close()
+
+
+class ConnectionPool:
+    """Keeps up to ``max_idle`` connections open for reuse between queries.
+
+    Nothing is bounded on checkout: like before, every caller gets a
+    connection at once, and one that is never closed is simply garbage
+    collected. Connections idle for longer than ``ping_after`` seconds get
+    a ``SELECT 1`` before being handed out again, so a database restart
+    costs a reconnect instead of a failed request.
+    """
+
+    def __init__(self, connect, max_idle=10, ping_after=30):
+        self._connect = connect  # connection_factory -> new connection
+        self.max_idle = max_idle
+        self.ping_after = ping_after
+        self._idle = []
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    def get(self):
+        while True:
+            with self._lock:
+                conn = self._idle.pop() if self._idle else None
+
+            if conn is None:
+                conn = self._connect(PooledConnection)
+                self.created += 1
+                break
+
+            if conn.closed:
+                continue
+            if time.monotonic() - conn.idle_since > self.ping_after:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    conn.rollback()
+                except psycopg2.Error:
+                    conn.discard()
+                    continue
+            self.reused += 1
+            break
+
+        conn.pool = self
+        conn.checked_out = True
+        return conn
+
+    def put(self, conn):
+        if not conn.checked_out:
+            return  # closed twice
+        conn.checked_out = False
+
+        try:
+            if conn.closed or conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                conn.discard()
+                return
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            conn.discard()
+            return
+
+        conn.idle_since = time.monotonic()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.discard()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.discard()
+
+    def stats(self):
+        with self._lock:
+            idle = len(self._idle)
+        return {'idle': idle, 'created': self.created, 'reused': self.reused}
+
+
+def execute_prepared(cursor, name, params, prepare=True):
+    """Run HOT_QUERIES[name], preparing it on the cursor's connection the first time
+
+    With prepare=False (e.g. behind a transaction-mode pgbouncer, where
+    prepared statements do not survive) the query is sent as plain SQL.
+    """
+    sql = HOT_QUERIES[name]
+    conn = cursor.connection
+    if not prepare or not isinstance(conn, PooledConnection):
+        cursor.execute(_PLACEHOLDER_RE.sub('%s', sql),
+                       [params[int(n) - 1] for n in _PLACEHOLDER_RE.findall(sql)])
+        return
+
+    if name not in conn.prepared:
+        # PREPARE is not transactional: the statement survives rollbacks
+        cursor.execute(f"PREPARE {name} AS {sql}")
+        conn.prepared.add(name)
+    cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def explain_hot_queries(conn, sample_params):
+    """Check that every hot query can use its partial index.
+
+    Sequential scans are disabled for the check (a small table would
+    otherwise always be scanned), so this verifies the index is usable, not
+    that the planner prefers it at the current table size. Returns
+    {name: (ok, scan description)}.
+    """
+    results = {}
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for name, (index_name, index_only) in HOT_QUERY_INDEXES.items():
+            sql = HOT_QUERIES[name]
+            cursor.execute("EXPLAIN (FORMAT JSON) " + _PLACEHOLDER_RE.sub('%s', sql),
+                           [sample_params[name][int(n) - 1] for n in _PLACEHOLDER_RE.findall(sql)])
+            plan = cursor.fetchone()[0][0]['Plan']
+            scans = [node for node in _plan_nodes(plan) if node.get('Index Name') == index_name]
+            wanted = 'Index Only Scan' if index_only else None
+            ok = bool(scans) and (wanted is None or any(node['Node Type'] == wanted for node in scans))
+            used = sorted({f"{node['Node Type']} on {node.get('Index Name') or node.get('Relation Name')}"
+                           for node in _plan_nodes(plan) if 'Scan' in node['Node Type']})
+            results[name] = (ok, ', '.join(used))
+    finally:
+        cursor.close()
+        conn.rollback()
+    return results
+
+
+class _Replica:
+    def __init__(self, name, pool):
+        self.name = name
+        self.pool = pool
+        self.lag = None
+        self.checked_at = 0.0
+        self.error = None
+
+
+class ReplicaSet:
+    """Read replicas, used round-robin while their replication lag stays under ``max_lag`` seconds.
+
+    Lag is measured on the connection being handed out, at most once per
+    ``check_interval`` seconds per replica. A replica that lags or fails is
+    skipped until its next check; get() returns None when no replica is
+    usable and the caller falls back to the primary.
+    """
+
+    LAG_QUERY = """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END
+    """
+
+    def __init__(self, connects, max_lag=5, check_interval=10, max_idle=10):
+        self.replicas = [_Replica(f"replica_{i}", ConnectionPool(connect, max_idle=max_idle))
+                         for i, connect in enumerate(connects)]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def _usable(self, replica, now):
+        if now - replica.checked_at < self.check_interval:
+            return replica.error is None and replica.lag is not None and replica.lag <= self.max_lag
+        return True  # due for a check
+
+    def get(self):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+
+        now = time.monotonic()
+        for i in range(len(self.replicas)):
+            replica = self.replicas[(start + i) % len(self.replicas)]
+            if not self._usable(replica, now):
+                continue
+
+            conn = None
+            try:
+                conn = replica.pool.get()
+                if now - replica.checked_at >= self.check_interval:
+                    with conn.cursor() as cursor:
+                        cursor.execute(self.LAG_QUERY)
+                        replica.lag = float(cursor.fetchone()[0])
+                    conn.rollback()
+                    replica.checked_at, replica.error = now, None
+                    if replica.lag > self.max_lag:
+                        logger.warning(f"⚠️ {replica.name} is {replica.lag:.1f}s behind, reading from the primary")
+                        conn.close()
+                        continue
+                return conn
+            except psycopg2.Error as e:
+                replica.checked_at, replica.error = now, str(e)
+                logger.error(f"❌ {replica.name} unavailable: {e}")
+                if conn is not None:
+                    conn.discard()
+        return None
+
+    def status(self):
+        return [{'name': r.name, 'lag_seconds': r.lag, 'error': r.error,
+                 'usable': self._usable(r, time.monotonic()), **r.pool.stats()} for r in self.replicas]
@@ -0,0 +1,12 @@
+import os
+
+# Picked up automatically by `gunicorn app:app` run from this directory.
+#
+# Live order status (/order-events/<order_number>) holds one thread per open
+# stream for up to ORDER_EVENTS_MAX_SECONDS. With the default sync worker a
+# handful of streams would take every worker, so run threaded workers with
+# enough threads for ORDER_EVENTS_MAX_WATCHERS streams plus ordinary requests.
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', int(os.environ.get('ORDER_EVENTS_MAX_WATCHERS', 50)) + 16))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
@@ -0,0 +1,216 @@
+import os
+import select
+import socket
+import logging
+import threading
+import time
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = os.environ.get('INVALIDATION_CHANNEL', 'tunnelgrain_invalidate')
+
+# Order numbers per message; NOTIFY payloads must stay under 8000 bytes
+PAYLOAD_BATCH = 500
+
+INVALIDATIONS = REGISTRY.counter(
+    'tunnelgrain_invalidations_total', 'Cache invalidation messages between worker processes', ('direction',))
+
+
+def _encode(origin, order_numbers):
+    return f"{origin} {'*' if order_numbers is None else ','.join(order_numbers)}"
+
+
+def _decode(payload):
+    """(origin, order numbers or None for everything)"""
+    origin, _, rest = payload.strip().partition(' ')
+    return origin, None if rest == '*' else [n for n in rest.split(',') if n]
+
+
+def _batches(order_numbers):
+    if order_numbers is None:
+        yield None
+        return
+    order_numbers = sorted(set(order_numbers))
+    for i in range(0, len(order_numbers), PAYLOAD_BATCH):
+        yield order_numbers[i:i + PAYLOAD_BATCH]
+
+
+class _Bus:
+    """Delivery to subscribers and one listener thread per process"""
+
+    def __init__(self):
+        self._subscribers = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def origin(self):
+        # Messages from this process were already applied locally by the writer
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def subscribe(self, callback):
+        """callback(order_numbers) for changes made by other processes; None means drop everything"""
+        self._subscribers.append(callback)
+
+    def ensure_started(self):
+        """Start this process's listener (again after a fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._listen, name='invalidation-bus', daemon=True).start()
+
+    def _deliver(self, origin, order_numbers):
+        if origin == self.origin:
+            return
+        INVALIDATIONS.inc(direction='received')
+        for callback in self._subscribers:
+            try:
+                callback(order_numbers)
+            except Exception as e:
+                logger.error(f"❌ Invalidation subscriber failed: {e}")
+
+    def _resync(self):
+        """Messages may have been missed (listener was down): drop everything"""
+        self._deliver(None, None)
+
+
+class PgNotifyBus(_Bus):
+    """Invalidations over PostgreSQL NOTIFY/LISTEN.
+
+    Writers call publish() with the cursor of their own transaction, so the
+    message goes out on commit and never before the change is visible. Each
+    worker listens on a dedicated connection (not from the pool, and not
+    through a transaction-mode pgbouncer, which drops LISTEN). After a
+    reconnect subscribers are told to drop everything, since messages sent
+    in the meantime are lost.
+    """
+
+    def __init__(self, connect, keepalive=30):
+        super().__init__()
+        self._connect = connect  # () -> new psycopg2 connection
+        self.keepalive = keepalive
+
+    def publish(self, order_numbers, cursor=None):
+        """NOTIFY the other workers; inside the caller's transaction when a cursor is given"""
+        if order_numbers is not None and not order_numbers:
+            return
+        payloads = [_encode(self.origin, batch) for batch in _batches(order_numbers)]
+        if cursor is not None:
+            for payload in payloads:
+                cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+        else:
+            conn = self._connect()
+            try:
+                conn.autocommit = True
+                with conn.cursor() as own_cursor:
+                    for payload in payloads:
+                        own_cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+            finally:
+                conn.close()
+        INVALIDATIONS.inc(len(payloads), direction='sent')
+
+    def _listen(self):
+        backoff = 1
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {CHANNEL}")
+                logger.info(f"📡 Listening for cache invalidations on {CHANNEL}")
+                self._resync()
+                backoff = 1
+
+                while True:
+                    if select.select([conn], [], [], self.keepalive) == ([], [], []):
+                        # Quiet channel: make sure the connection is still alive
+                        with conn.cursor() as cursor:
+                            cursor.execute("SELECT 1")
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self._deliver(*_decode(conn.notifies.pop(0).payload))
+            except Exception as e:
+                logger.error(f"❌ Invalidation listener lost its connection, retrying in {backoff}s: {e}")
+                time.sleep(backoff)
+                backoff = min(60, backoff * 2)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+
+class FileBus(_Bus):
+    """Invalidations through an append-only file, for JSON mode.
+
+    publish() appends one short line per batch; every worker tails the file
+    every ``poll_interval`` seconds. Past ``max_bytes`` the file is renamed
+    aside and started over; listeners notice the new file and drop
+    everything, as a PostgreSQL listener does after a reconnect.
+    """
+
+    def __init__(self, path, poll_interval=0.5, max_bytes=1024 * 1024):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.max_bytes = max_bytes
+
+    def publish(self, order_numbers, cursor=None):
+        if order_numbers is not None and not order_numbers:
+            return
+        lines = [_encode(self.origin, batch) + '\n' for batch in _batches(order_numbers)]
+        # One O_APPEND write per call, so lines from different workers never interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, ''.join(lines).encode())
+            size = os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+        if size > self.max_bytes:
+            try:
+                os.replace(self.path, f"{self.path}.1")
+            except FileNotFoundError:
+                pass  # another worker rotated it first
+        INVALIDATIONS.inc(len(lines), direction='sent')
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return st.st_ino, st.st_size
+        except FileNotFoundError:
+            return None, 0
+
+    def _listen(self):
+        inode, offset = self._stat()
+        self._resync()
+
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                current, size = self._stat()
+                if current != inode or size < offset:
+                    # Rotated or replaced: start at the top of the new file
+                    inode, offset = current, 0
+                    self._resync()
+                if size == offset:
+                    continue
+
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    chunk = f.read(size - offset)
+                # A line still being written is left for the next poll
+                complete = chunk[:chunk.rfind(b'\n') + 1]
+                offset += len(complete)
+                for line in complete.decode().splitlines():
+                    if line:
+                        self._deliver(*_decode(line))
+            except Exception as e:
+                logger.error(f"❌ Invalidation file listener error: {e}")
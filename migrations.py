@@ -0,0 +1,226 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Serializes migration runs across workers and deploys
+MIGRATION_LOCK_KEY = 'tunnelgrain:schema_migrations'
+
+# (version, name, statements). Append only: never edit a migration that has shipped.
+# Everything up to version 5 uses IF NOT EXISTS so databases created by the old
+# init_database() (which have no schema_migrations table) upgrade cleanly.
+MIGRATIONS = [
+    (1, 'create vpn_orders', [
+        """
+        CREATE TABLE IF NOT EXISTS vpn_orders (
+            order_id VARCHAR(36) PRIMARY KEY,
+            order_number VARCHAR(20) UNIQUE NOT NULL,
+            tier VARCHAR(20) NOT NULL,
+            vps_name VARCHAR(50) DEFAULT 'vps_1',
+            vps_ip VARCHAR(45) NOT NULL,
+            config_id VARCHAR(50) NOT NULL,
+            status VARCHAR(20) DEFAULT 'active',
+            price_cents INTEGER DEFAULT 0,
+            stripe_session_id VARCHAR(200),
+            user_fingerprint VARCHAR(64),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP,
+            timer_started BOOLEAN DEFAULT FALSE,
+            metadata JSONB DEFAULT '{}'::jsonb
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_orders_status ON vpn_orders (status)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_number ON vpn_orders (order_number)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_expires ON vpn_orders (expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_config ON vpn_orders (config_id)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_tier_status ON vpn_orders (tier, status)",
+    ]),
+    (2, 'rate limit buckets', [
+        """
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            bucket_key VARCHAR(200) PRIMARY KEY,
+            tokens DOUBLE PRECISION NOT NULL,
+            updated_at DOUBLE PRECISION NOT NULL,
+            last_allowed BOOLEAN DEFAULT TRUE
+        )
+        """,
+    ]),
+    (3, 'test quota fingerprint index', [
+        "CREATE INDEX IF NOT EXISTS idx_orders_fingerprint ON vpn_orders (user_fingerprint, tier, created_at)",
+    ]),
+    (4, 'keyset pagination indexes', [
+        "CREATE INDEX IF NOT EXISTS idx_orders_created_keyset ON vpn_orders (created_at DESC, order_id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_tier_created ON vpn_orders (tier, created_at DESC, order_id DESC)",
+        "CREATE INDEX IF NOT EXISTS idx_orders_status_created ON vpn_orders (status, created_at DESC, order_id DESC)",
+    ]),
+    (5, 'order stats counters', [
+        """
+        CREATE TABLE IF NOT EXISTS order_stats (
+            tier VARCHAR(20) PRIMARY KEY,
+            active_count INTEGER NOT NULL DEFAULT 0,
+            expired_count INTEGER NOT NULL DEFAULT 0,
+            timers_started INTEGER NOT NULL DEFAULT 0,
+            revenue_cents BIGINT NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Seed counters once for databases that predate order_stats
+        """
+        INSERT INTO order_stats (tier, active_count, expired_count, timers_started, revenue_cents)
+        SELECT tier,
+               COUNT(*) FILTER (WHERE status = 'active'),
+               COUNT(*) FILTER (WHERE status = 'expired'),
+               COUNT(*) FILTER (WHERE timer_started),
+               COALESCE(SUM(price_cents), 0)
+        FROM vpn_orders
+        WHERE NOT EXISTS (SELECT 1 FROM order_stats)
+        GROUP BY tier
+        """,
+    ]),
+    (6, 'expired order archive', [
+        """
+        CREATE TABLE vpn_orders_archive (
+            order_id VARCHAR(36) PRIMARY KEY,
+            order_number VARCHAR(20) NOT NULL,
+            tier VARCHAR(20) NOT NULL,
+            vps_name VARCHAR(50),
+            vps_ip VARCHAR(45) NOT NULL,
+            config_id VARCHAR(50) NOT NULL,
+            status VARCHAR(20),
+            price_cents INTEGER DEFAULT 0,
+            stripe_session_id VARCHAR(200),
+            user_fingerprint VARCHAR(64),
+            created_at TIMESTAMP,
+            expires_at TIMESTAMP,
+            timer_started BOOLEAN,
+            metadata JSONB DEFAULT '{}'::jsonb,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Config ids are reused, so one order number can appear several times here
+        "CREATE INDEX idx_archive_number ON vpn_orders_archive (order_number, created_at DESC)",
+        # Drives the archival batches without scanning active rows
+        "CREATE INDEX idx_orders_expired_expires ON vpn_orders (expires_at) WHERE status = 'expired'",
+    ]),
+    (7, 'recycled config pool', [
+        # Configs are reissued after regeneration, so an order number is only
+        # unique among active orders
+        "ALTER TABLE vpn_orders DROP CONSTRAINT IF EXISTS vpn_orders_order_number_key",
+        "CREATE UNIQUE INDEX idx_orders_number_active ON vpn_orders (order_number) WHERE status = 'active'",
+        """
+        CREATE TABLE config_pool (
+            config_id VARCHAR(50) PRIMARY KEY,
+            tier VARCHAR(20) NOT NULL,
+            state VARCHAR(20) NOT NULL DEFAULT 'dirty',
+            generation INTEGER NOT NULL DEFAULT 0,
+            public_key VARCHAR(64),
+            config_text TEXT,
+            qr_png BYTEA,
+            last_error TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        "CREATE INDEX idx_config_pool_state ON config_pool (state, updated_at)",
+    ]),
+    (8, 'partial indexes for active orders', [
+        # Config allocation (index-only) and the expiry sweep only ever look at active rows
+        "CREATE INDEX idx_orders_active_tier_config ON vpn_orders (tier, config_id) WHERE status = 'active'",
+        "CREATE INDEX idx_orders_active_expires ON vpn_orders (expires_at) WHERE status = 'active'",
+        "CREATE INDEX idx_config_pool_unclean ON config_pool (tier, config_id) WHERE state <> 'clean'",
+        # Covered by idx_orders_active_expires and idx_orders_expired_expires
+        "DROP INDEX IF EXISTS idx_orders_expires",
+    ]),
+    (9, 'tier quotas', [
+        # Soft per-tier shares of the shared config pools; rows are only
+        # written once a quota is set or rebalanced, defaults live in code
+        """
+        CREATE TABLE tier_quotas (
+            tier VARCHAR(20) PRIMARY KEY,
+            quota INTEGER NOT NULL,
+            pinned BOOLEAN NOT NULL DEFAULT FALSE,
+            updated_by VARCHAR(20) NOT NULL DEFAULT 'admin',
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn):
+    """Highest applied migration, 0 for a fresh (or pre-migrations) database"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT to_regclass('schema_migrations') IS NOT NULL")
+        if not cursor.fetchone()[0]:
+            return 0
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+        return cursor.fetchone()[0]
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+def applied_migrations(conn):
+    """[(version, name, applied_at)] in order"""
+    if current_version(conn) == 0:
+        return []
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version, name, applied_at FROM schema_migrations ORDER BY version")
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+        conn.rollback()
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to target (default: latest). Returns the versions applied.
+
+    Each migration runs in its own transaction together with its
+    schema_migrations row; a session advisory lock keeps concurrent
+    workers from applying the same migration twice.
+    """
+    target = SCHEMA_VERSION if target is None else target
+    cursor = conn.cursor()
+    applied = []
+
+    cursor.execute("SELECT pg_advisory_lock(hashtext(%s))", (MIGRATION_LOCK_KEY,))
+    try:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.commit()
+
+        cursor.execute("SELECT version FROM schema_migrations")
+        done = {row[0] for row in cursor.fetchall()}
+
+        for version, name, statements in MIGRATIONS:
+            if version in done or version > target:
+                continue
+
+            start = time.perf_counter()
+            try:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"❌ Migration {version} ({name}) failed: {e}")
+                raise
+
+            applied.append(version)
+            logger.info(f"✅ Applied migration {version}: {name} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+    finally:
+        conn.rollback()
+        cursor.execute("SELECT pg_advisory_unlock(hashtext(%s))", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+        cursor.close()
+
+    return applied
@@ -0,0 +1,110 @@
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class OrderCache:
+    """In-process read-through cache for order lookups keyed by order number.
+
+    Entries live for a TTL that depends on what was found:
+    - active orders: up to ``active_ttl`` seconds, but never past ``expires_at``
+    - expired orders: ``expired_ttl`` seconds (they rarely change again)
+    - unknown order numbers: ``missing_ttl`` seconds (negative caching)
+    """
+
+    def __init__(self, max_entries=10000, active_ttl=60, expired_ttl=600, missing_ttl=30):
+        self.max_entries = max_entries
+        self.active_ttl = active_ttl
+        self.expired_ttl = expired_ttl
+        self.missing_ttl = missing_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _parse_expires_at(expires_at):
+        if isinstance(expires_at, str):
+            try:
+                return datetime.fromisoformat(expires_at.replace('Z', '+00:00'))
+            except ValueError:
+                return None
+        return expires_at
+
+    def _ttl_for(self, order):
+        """Pick a TTL in seconds based on order status and expiry"""
+        if order is None:
+            return self.missing_ttl
+
+        if order.get('status') != 'active':
+            return self.expired_ttl
+
+        expires_at = self._parse_expires_at(order.get('expires_at'))
+        if not expires_at:
+            return self.active_ttl
+
+        now = datetime.now(expires_at.tzinfo) if expires_at.tzinfo else datetime.now()
+        seconds_left = (expires_at - now).total_seconds()
+        return max(1, min(self.active_ttl, seconds_left))
+
+    def get(self, order_number):
+        """Return (hit, order). A hit with order None is a cached 'not found'"""
+        with self._lock:
+            entry = self._entries.get(order_number)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            deadline, order = entry
+            if deadline <= time.monotonic():
+                del self._entries[order_number]
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(order_number)
+            self.hits += 1
+
+        # Hand out copies so callers can't mutate the cached entry
+        return True, (dict(order) if order is not None else None)
+
+    def set(self, order_number, order):
+        """Store a lookup result (None caches a miss)"""
+        ttl = self._ttl_for(order)
+        stored = dict(order) if order is not None else None
+
+        with self._lock:
+            self._entries[order_number] = (time.monotonic() + ttl, stored)
+            self._entries.move_to_end(order_number)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, order_number):
+        """Drop a single order number from the cache"""
+        with self._lock:
+            self._entries.pop(order_number, None)
+
+    def invalidate_many(self, order_numbers):
+        """Drop several order numbers from the cache"""
+        with self._lock:
+            for order_number in order_numbers:
+                self._entries.pop(order_number, None)
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
+        logger.info("🧹 Order cache cleared")
+
+    def stats(self):
+        """Cache statistics for debugging endpoints"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'max_entries': self.max_entries
+            }
@@ -0,0 +1,241 @@
+import json
+import os
+import queue
+import time
+import logging
+import threading
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENT_REFRESHES = REGISTRY.counter(
+    'tunnelgrain_order_event_refreshes_total', 'Order reloads done for event streams', ('reason',))
+
+
+class _Source:
+    """Shared state for one watched order number"""
+
+    def __init__(self, snapshot):
+        self.subscribers = set()
+        self.snapshot = snapshot
+        self.refresh_at = 0.0
+        self.reason = None
+
+
+class OrderEventHub:
+    """Fan-out of live order status to server-sent event streams.
+
+    Watchers of the same order number share one source: the order is loaded
+    once, not once per watcher. A single background thread reloads a watched
+    order when the app calls notify() (order created, timer started), when its
+    expiry time passes, and every ``refresh_interval`` seconds as a fallback
+    for changes made by other workers. Orders nobody watches cost nothing.
+
+    Every stream holds a worker thread, so streams end after ``max_duration``
+    seconds (EventSource reconnects by itself, after ``retry_ms``) and a
+    process takes at most ``max_watchers`` of them at a time.
+    """
+
+    def __init__(self, loader, refresh_interval=60, keepalive=15, queue_size=8,
+                 max_duration=300, max_watchers=100, retry_ms=3000):
+        self.loader = loader  # order_number -> snapshot dict, or None if not found
+        self.refresh_interval = refresh_interval
+        self.keepalive = keepalive
+        self.queue_size = queue_size
+        self.max_duration = max_duration
+        self.max_watchers = max_watchers
+        self.retry_ms = retry_ms
+        self._sources = {}
+        self._watchers = 0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._sources = {}
+        self._watchers = 0
+        self._thread = threading.Thread(target=self._run, name='order-events', daemon=True)
+        self._thread.start()
+
+    def _schedule(self, source, now):
+        """Next reload: the expiry time if it comes first, else the fallback interval"""
+        refresh_at = now + self.refresh_interval
+        seconds_remaining = (source.snapshot or {}).get('seconds_remaining')
+        if source.snapshot and source.snapshot.get('status') == 'active' and seconds_remaining is not None:
+            # +1s so expires_at has really passed by the time we reload
+            refresh_at = min(refresh_at, now + seconds_remaining + 1)
+            source.reason = 'expiry' if refresh_at < now + self.refresh_interval else 'interval'
+        else:
+            source.reason = 'interval'
+        source.refresh_at = refresh_at
+
+    def subscribe(self, order_number):
+        """Register a watcher. Returns (queue, current snapshot), or None when max_watchers are open"""
+        events = queue.Queue(maxsize=self.queue_size)
+        with self._cond:
+            self._ensure_started()
+            if self._watchers >= self.max_watchers:
+                return None
+            self._watchers += 1
+            source = self._sources.get(order_number)
+            if source is not None:
+                source.subscribers.add(events)
+                return events, source.snapshot
+
+        # First watcher loads outside the lock; a concurrent first watcher may load too
+        try:
+            snapshot = self.loader(order_number)
+        except Exception:
+            with self._cond:
+                self._watchers -= 1
+            raise
+        ORDER_EVENT_REFRESHES.inc(reason='subscribe')
+        with self._cond:
+            source = self._sources.get(order_number)
+            if source is None:
+                source = self._sources[order_number] = _Source(snapshot)
+                self._schedule(source, time.monotonic())
+                self._cond.notify()
+            source.subscribers.add(events)
+            return events, source.snapshot
+
+    def unsubscribe(self, order_number, events):
+        with self._cond:
+            self._watchers = max(0, self._watchers - 1)
+            source = self._sources.get(order_number)
+            if source is not None:
+                source.subscribers.discard(events)
+                if not source.subscribers:
+                    del self._sources[order_number]
+
+    def watcher_count(self):
+        """Open event streams in this process"""
+        with self._cond:
+            return self._watchers
+
+    def notify(self, *order_numbers):
+        """The app changed these orders: reload them now if anyone is watching"""
+        with self._cond:
+            woken = False
+            for order_number in order_numbers:
+                source = self._sources.get(order_number)
+                if source is not None:
+                    source.refresh_at = 0.0
+                    source.reason = 'notify'
+                    woken = True
+            if woken:
+                self._cond.notify()
+
+    def notify_all(self):
+        """Anything may have changed: reload every watched order now"""
+        with self._cond:
+            for source in self._sources.values():
+                source.refresh_at = 0.0
+                source.reason = 'notify'
+            if self._sources:
+                self._cond.notify()
+
+    @staticmethod
+    def _event_name(old, new):
+        if new is None:
+            return 'status'
+        if old and old.get('status') == 'active' and new.get('status') == 'expired':
+            return 'expired'
+        if old and not old.get('timer_started') and new.get('timer_started'):
+            return 'timer_started'
+        return 'status'
+
+    def _run(self):
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                due = [(n, s.reason) for n, s in self._sources.items() if s.refresh_at <= now]
+                if not due:
+                    next_at = min((s.refresh_at for s in self._sources.values()), default=now + self.refresh_interval)
+                    self._cond.wait(max(0.05, next_at - now))
+                    continue
+                for order_number, _ in due:
+                    # Pushed back until the reload below reschedules it
+                    self._sources[order_number].refresh_at = now + self.refresh_interval
+
+            for order_number, reason in due:
+                try:
+                    snapshot = self.loader(order_number)
+                except Exception as e:
+                    logger.error(f"❌ Order event reload failed for {order_number}: {e}")
+                    continue
+                ORDER_EVENT_REFRESHES.inc(reason=reason or 'interval')
+
+                with self._cond:
+                    source = self._sources.get(order_number)
+                    if source is None:
+                        continue
+                    old = source.snapshot
+                    source.snapshot = snapshot
+                    self._schedule(source, time.monotonic())
+                    if _comparable(old) == _comparable(snapshot):
+                        continue
+                    message = (self._event_name(old, snapshot), snapshot)
+                    subscribers = list(source.subscribers)
+
+                for events in subscribers:
+                    _offer(events, message)
+
+    def stream(self, order_number, subscription):
+        """SSE response body for a subscribe() result
+        
+        Closes after the order has expired, or after max_duration seconds so
+        the client reconnects and the worker thread is freed in between. The
+        caller unsubscribes when the response is closed: a generator that
+        never started would not run a finally block.
+        """
+        events, snapshot = subscription
+        deadline = time.monotonic() + self.max_duration
+        yield f"retry: {int(self.retry_ms)}\n\n"
+        yield _format('status', snapshot)
+        if snapshot is None or snapshot.get('status') != 'active':
+            return
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                name, data = events.get(timeout=min(self.keepalive, remaining))
+            except queue.Empty:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ': keepalive\n\n'
+                continue
+            yield _format(name, data)
+            if data is None or data.get('status') != 'active':
+                return
+
+
+def _comparable(snapshot):
+    """Snapshot without the fields that change on every reload"""
+    if snapshot is None:
+        return None
+    return {k: v for k, v in snapshot.items() if k not in ('seconds_remaining', 'time_remaining')}
+
+
+def _offer(events, message):
+    """Non-blocking put; a slow watcher loses its oldest event, never the latest"""
+    try:
+        events.put_nowait(message)
+    except queue.Full:
+        try:
+            events.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            events.put_nowait(message)
+        except queue.Full:
+            pass
+
+
+def _format(name, data):
+    payload = json.dumps(data if data is not None else {'order_found': False}, default=str)
+    return f"event: {name}\ndata: {payload}\n\n"
@@ -0,0 +1,91 @@
+import cProfile
+import json
+import os
+import re
+import threading
+import uuid
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+PROFILE_NAME_RE = re.compile(r'^[A-Za-z0-9_.-]+\.prof$')
+
+
+class RequestProfiler:
+    """Saves cProfile dumps of selected requests to a local directory.
+
+    Each profile is a ``.prof`` file (load with ``pstats`` or snakeviz)
+    next to a ``.json`` sidecar holding route and timing metadata.
+    """
+
+    def __init__(self, directory, sample_rate=0.0, max_profiles=200):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Begin profiling the current thread"""
+        profile = cProfile.Profile()
+        profile.enable()
+        return profile
+
+    def save(self, profile, route, method, status, duration_seconds, reason):
+        """Stop the profiler and write the dump plus metadata. Returns the profile name"""
+        profile.disable()
+
+        os.makedirs(self.directory, exist_ok=True)
+        now = datetime.now()
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', route).strip('-') or 'root'
+        name = f"{now.strftime('%Y%m%dT%H%M%S')}_{slug}_{uuid.uuid4().hex[:8]}.prof"
+        path = os.path.join(self.directory, name)
+
+        profile.dump_stats(path)
+        with open(path[:-len('.prof')] + '.json', 'w') as f:
+            json.dump({
+                'name': name,
+                'route': route,
+                'method': method,
+                'status': status,
+                'duration_ms': round(duration_seconds * 1000, 2),
+                'reason': reason,
+                'created_at': now.isoformat()
+            }, f, indent=2)
+
+        self._prune()
+        logger.info(f"📈 Saved profile {name} ({route}, {duration_seconds * 1000:.1f} ms)")
+        return name
+
+    def _prune(self):
+        with self._lock:
+            names = sorted(n for n in os.listdir(self.directory) if n.endswith('.prof'))
+            for name in names[:-self.max_profiles] if len(names) > self.max_profiles else []:
+                for suffix in ('.prof', '.json'):
+                    try:
+                        os.remove(os.path.join(self.directory, name[:-len('.prof')] + suffix))
+                    except OSError:
+                        pass
+
+    def list_profiles(self):
+        """Metadata of saved profiles, newest first"""
+        if not os.path.isdir(self.directory):
+            return []
+
+        profiles = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name), 'r') as f:
+                    profiles.append(json.load(f))
+            except Exception as e:
+                logger.error(f"❌ Unreadable profile metadata {name}: {e}")
+        return profiles
+
+    def path_for(self, name):
+        """Absolute path of a saved profile, or None for unknown/unsafe names"""
+        if not PROFILE_NAME_RE.match(name):
+            return None
+        path = os.path.abspath(os.path.join(self.directory, name))
+        return path if os.path.exists(path) else None
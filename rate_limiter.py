@@ -0,0 +1,143 @@
+import math
+import threading
+import time
+import zlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimit:
+    """Token bucket parameters: ``capacity`` requests refilled over ``period`` seconds"""
+
+    def __init__(self, capacity, period):
+        self.capacity = float(capacity)
+        self.period = float(period)
+        self.rate = self.capacity / self.period  # tokens per second
+
+    @classmethod
+    def parse(cls, value):
+        """Parse '<capacity>/<seconds>' (e.g. '30/60')"""
+        capacity, period = value.split('/', 1)
+        return cls(int(capacity), int(period))
+
+    def __repr__(self):
+        return f"RateLimit({int(self.capacity)}/{int(self.period)}s)"
+
+
+class ShardedMemoryStore:
+    """In-process token bucket store split into independently locked shards.
+
+    Each worker process keeps its own buckets, so limits are per worker.
+    Use a shared store (e.g. PostgresStore) when workers must agree. Past
+    ``max_keys_per_shard`` the least recently used bucket is dropped, in
+    constant time and whatever route it belongs to: it has been idle the
+    longest, so it is the one most likely to have refilled anyway.
+    """
+
+    def __init__(self, shards=16, max_keys_per_shard=5000):
+        self.max_keys_per_shard = max_keys_per_shard
+        self._shards = [(OrderedDict(), threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, key):
+        return self._shards[zlib.crc32(key.encode()) % len(self._shards)]
+
+    def consume(self, key, limit, cost=1):
+        """Take ``cost`` tokens from the bucket. Returns (allowed, retry_after_seconds)"""
+        buckets, lock = self._shard(key)
+        now = time.monotonic()
+
+        with lock:
+            tokens, updated = buckets.get(key, (limit.capacity, now))
+            tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                allowed, retry_after = True, 0.0
+            else:
+                allowed, retry_after = False, (cost - tokens) / limit.rate
+
+            buckets[key] = (tokens, now)
+            buckets.move_to_end(key)
+            while len(buckets) > self.max_keys_per_shard:
+                buckets.popitem(last=False)
+
+        return allowed, retry_after
+
+
+class PostgresStore:
+    """Token bucket store shared by all workers through the rate_limit_buckets table.
+
+    Refill and consume happen in a single UPSERT so concurrent workers can't
+    both spend the last token.
+    """
+
+    def __init__(self, connection_factory):
+        self.connection_factory = connection_factory
+
+    def consume(self, key, limit, cost=1):
+        conn = self.connection_factory()
+        try:
+            cursor = conn.cursor()
+            now = time.time()
+            cursor.execute("""
+                INSERT INTO rate_limit_buckets AS b (bucket_key, tokens, updated_at, last_allowed)
+                VALUES (%(key)s, %(capacity)s - %(cost)s, %(now)s, TRUE)
+                ON CONFLICT (bucket_key) DO UPDATE SET
+                    tokens = CASE
+                        WHEN LEAST(%(capacity)s, b.tokens + (%(now)s - b.updated_at) * %(rate)s) >= %(cost)s
+                        THEN LEAST(%(capacity)s, b.tokens + (%(now)s - b.updated_at) * %(rate)s) - %(cost)s
+                        ELSE LEAST(%(capacity)s, b.tokens + (%(now)s - b.updated_at) * %(rate)s)
+                    END,
+                    last_allowed = LEAST(%(capacity)s, b.tokens + (%(now)s - b.updated_at) * %(rate)s) >= %(cost)s,
+                    updated_at = %(now)s
+                RETURNING tokens, last_allowed
+            """, {'key': key, 'capacity': limit.capacity, 'cost': cost, 'now': now, 'rate': limit.rate})
+            tokens, allowed = cursor.fetchone()
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        if allowed:
+            return True, 0.0
+        return False, (cost - tokens) / limit.rate
+
+
+class RateLimiter:
+    """Per-route token bucket limiter keyed by client identities (fingerprint, IP)"""
+
+    def __init__(self, store, limits):
+        self.store = store
+        # limits: {route: {key_kind: RateLimit}}
+        self.limits = limits
+
+    def check(self, route, identities):
+        """Consume one token for every identity configured for the route.
+
+        ``identities`` maps key kinds to values, e.g. {'fingerprint': ..., 'ip': ...}.
+        Returns (allowed, retry_after_seconds). Store failures fail open.
+        """
+        route_limits = self.limits.get(route)
+        if not route_limits:
+            return True, 0
+
+        retry_after = 0.0
+        for kind, limit in route_limits.items():
+            value = identities.get(kind)
+            if not value:
+                continue
+
+            try:
+                allowed, wait = self.store.consume(f"{route}:{kind}:{value}", limit)
+            except Exception as e:
+                logger.error(f"❌ Rate limit store error: {e}")
+                continue
+
+            if not allowed:
+                retry_after = max(retry_after, wait)
+
+        if retry_after > 0:
+            return False, max(1, math.ceil(retry_after))
+        return True, 0
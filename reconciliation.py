@@ -0,0 +1,157 @@
+import math
+import time
+import logging
+from datetime import datetime
+
+import requests
+
+from metrics import REGISTRY, VPS_REQUEST_SECONDS
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_DRIFT = REGISTRY.counter(
+    'tunnelgrain_reconcile_drift_total', 'Drift found by reconciliation runs', ('kind',))
+RECONCILE_SECONDS = REGISTRY.histogram(
+    'tunnelgrain_reconcile_seconds', 'Duration of reconciliation runs')
+
+
+def _call(method, url, endpoint, **kwargs):
+    """One timed request to the daemon; raises on transport or HTTP errors"""
+    start = time.perf_counter()
+    try:
+        response = requests.request(method, url, timeout=30, **kwargs)
+    except requests.exceptions.RequestException:
+        VPS_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint, outcome='connection_error')
+        raise
+    VPS_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint,
+                                outcome='ok' if response.status_code == 200 else f'http_{response.status_code}')
+    response.raise_for_status()
+    return response.json()
+
+
+def fetch_timers(vps_endpoint, status=None, page_size=None):
+    """All daemon timers (optionally one status)
+
+    One request by default; with page_size, one request per page of that size.
+    """
+    params = {'limit': page_size} if page_size else {}
+    if status:
+        params['status'] = status
+    timers = []
+    while True:
+        page = _call('GET', f"{vps_endpoint}/api/list-timers", 'list-timers', params=params)
+        timers.extend(page['timers'])
+        if not page.get('next_cursor'):
+            return timers
+        params['cursor'] = page['next_cursor']
+
+
+def reconcile(db, vps_endpoint, dry_run=False):
+    """Diff active orders against the daemon's timers and live peers, then repair drift.
+
+    Reads the daemon's timers and live peers (one unpaged request each), two
+    reads from the database and at most two bulk writes back to the daemon
+    plus one database update, whatever the number of orders:
+
+      missing_timers  active orders without an active daemon timer that were
+                      downloaded (timer_started) or had a daemon timer before
+                      -> start them with the time the order has left
+      stale_peers     live peers whose order is expired in the database, or whose
+                      daemon timer has no active order behind it -> remove them
+
+    Orders never downloaded are only counted (awaiting_download): their
+    timer starts on download, never before the customer has the config.
+    Live peers the daemon cannot map to an order, pool peers that were
+    never sold and recycled configs are reported but never touched.
+    """
+    start = time.perf_counter()
+    now = datetime.now()
+
+    timers = fetch_timers(vps_endpoint)
+    peers = _call('GET', f"{vps_endpoint}/api/peers", 'peers')
+    orders = db.get_order_states()
+    pool_states = db.get_config_pool_states()
+
+    active_orders = {n for n, o in orders.items() if o['status'] == 'active'}
+    expired_orders = {n for n, o in orders.items() if o['status'] == 'expired'} - active_orders
+    active_timers = {t['order_number'] for t in timers if t.get('status') == 'active'}
+    live_peers = set(peers['peers'])
+
+    def timed_before(timer):
+        # A finished timer counts for the current order only if it outlived its creation:
+        # a reissued config's number also carries the previous customer's timer
+        order = orders.get(timer['order_number'])
+        if order is None or order['status'] != 'active' or timer.get('status') == 'active':
+            return False
+        try:
+            return order['created_at'] is None or datetime.fromisoformat(timer['expires_at']) > order['created_at']
+        except (KeyError, TypeError, ValueError):
+            return False
+
+    had_timer = {t['order_number'] for t in timers if timed_before(t)}
+    without_timer = active_orders - active_timers
+    missing_timers = {n for n in without_timer if orders[n]['timer_started'] or n in had_timer}
+    awaiting_download = without_timer - missing_timers
+    orphan_timers = active_timers - active_orders
+    # Recycled configs carry fresh keys: their live peer belongs to the pool, not the old order
+    recycled = {config_id for config_id, state in pool_states.items() if state != 'dirty'}
+    stale_peers = (live_peers & (expired_orders | orphan_timers)) - recycled
+
+    report = {
+        'checked_at': now.isoformat(),
+        'dry_run': dry_run,
+        'active_orders': len(active_orders),
+        'active_timers': len(active_timers),
+        'live_peers': len(live_peers),
+        'unmapped_peer_keys': len(peers.get('unmapped_keys', [])),
+        'missing_timers': sorted(missing_timers),
+        'awaiting_download': len(awaiting_download),
+        'orphan_timers': sorted(orphan_timers),
+        'stale_peers': sorted(stale_peers),
+        'timers_started': [],
+        'peers_removed': [],
+        'errors': []
+    }
+
+    RECONCILE_DRIFT.inc(len(missing_timers), kind='missing_timer')
+    RECONCILE_DRIFT.inc(len(orphan_timers), kind='orphan_timer')
+    RECONCILE_DRIFT.inc(len(stale_peers), kind='stale_peer')
+
+    if not dry_run and missing_timers:
+        entries = []
+        for order_number in sorted(missing_timers):
+            order = orders[order_number]
+            remaining = (order['expires_at'] - now).total_seconds() / 60 if order['expires_at'] else 0
+            # Already past expiry: a one-minute timer lets the daemon remove the peer on its next pass
+            entries.append({
+                'order_number': order_number,
+                'tier': order['tier'],
+                'duration_minutes': max(1, math.ceil(remaining))
+            })
+        try:
+            result = _call('POST', f"{vps_endpoint}/api/start-timers", 'start-timers', json={'timers': entries})
+            report['timers_started'] = result.get('started', [])
+            db.mark_timers_started(report['timers_started'])
+        except Exception as e:
+            logger.error(f"❌ Reconcile: starting timers failed: {e}")
+            report['errors'].append(f"start-timers: {e}")
+
+    if not dry_run and stale_peers:
+        try:
+            result = _call('POST', f"{vps_endpoint}/api/expire-peers", 'expire-peers',
+                           json={'order_numbers': sorted(stale_peers)})
+            report['peers_removed'] = result.get('removed', [])
+        except Exception as e:
+            logger.error(f"❌ Reconcile: removing stale peers failed: {e}")
+            report['errors'].append(f"expire-peers: {e}")
+
+    RECONCILE_SECONDS.observe(time.perf_counter() - start)
+
+    if missing_timers or stale_peers or orphan_timers:
+        logger.warning(f"⚠️ Reconcile drift: {len(missing_timers)} missing timers, "
+                       f"{len(stale_peers)} stale peers, {len(orphan_timers)} orphan timers"
+                       f"{' (dry run)' if dry_run else ''}")
+    else:
+        logger.info(f"✅ Reconcile: no drift ({len(active_orders)} active orders)")
+
+    return report
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Tunnelgrain web tier load test / benchmark.
+
+Drives the Flask app over real HTTP with concurrent clients, against a
+local fake VPS daemon and a Stripe stub, and reports requests per second,
+p50/p95/p99 latency and allocation correctness (no config handed to two
+active orders).
+
+JSON mode (default) runs in a throwaway directory:
+
+    python scripts/local/benchmark_web.py --concurrency 16 --requests 400
+
+PostgreSQL mode needs a throwaway database (--reset-db truncates it):
+
+    python scripts/local/benchmark_web.py --mode postgresql \\
+        --database-url postgresql://localhost/tunnelgrain_bench --reset-db
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from werkzeug.serving import make_server
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_vps_daemon import create_fake_daemon
+
+SCENARIOS = ('test_vpn', 'check_order', 'checkout', 'purchase')
+
+
+class StripeStub:
+    """Replaces stripe.checkout.Session.create/retrieve with local fakes"""
+
+    def __init__(self, latency_ms=0):
+        self.latency_ms = latency_ms
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _sleep(self):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def create(self, **kwargs):
+        self._sleep()
+        session_id = f"cs_test_{uuid.uuid4().hex}"
+        session = _Obj(id=session_id, url=f"https://stripe.invalid/pay/{session_id}",
+                       payment_status='paid', metadata=kwargs.get('metadata', {}))
+        with self.lock:
+            self.sessions[session_id] = session
+        return session
+
+    def retrieve(self, session_id, **kwargs):
+        self._sleep()
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            # Sessions created outside this run (purchase scenario) are paid monthly orders
+            session = _Obj(id=session_id, url='', payment_status='paid',
+                           metadata={'tier': 'monthly', 'ip_address': '213.170.133.116', 'vps_name': 'primary_vps'})
+        return session
+
+    def install(self, stripe_module):
+        stripe_module.checkout.Session.create = staticmethod(self.create)
+        stripe_module.checkout.Session.retrieve = staticmethod(self.retrieve)
+
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class ServerThread(threading.Thread):
+    def __init__(self, wsgi_app, port=0):
+        super().__init__(daemon=True)
+        self.server = make_server('127.0.0.1', port, wsgi_app, threaded=True)
+        self.port = self.server.server_port
+
+    def run(self):
+        self.server.serve_forever()
+
+    def stop(self):
+        self.server.shutdown()
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.allocated = []
+
+    def record(self, name, seconds, status):
+        with self.lock:
+            self.latencies[name].append(seconds)
+            self.statuses[name][status] += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+_local = threading.local()
+
+
+def http():
+    # One cookie jar per client thread so session-based downloads work
+    if not hasattr(_local, 'session'):
+        _local.session = requests.Session()
+        _local.session.headers['User-Agent'] = f"tunnelgrain-bench/{uuid.uuid4().hex[:8]}"
+    return _local.session
+
+
+def timed(recorder, name, method, url, **kwargs):
+    start = time.perf_counter()
+    try:
+        response = http().request(method, url, timeout=30, **kwargs)
+        status = response.status_code
+    except requests.RequestException:
+        response, status = None, 'error'
+    recorder.record(name, time.perf_counter() - start, status)
+    return response
+
+
+def run_test_vpn(base, recorder, _):
+    response = timed(recorder, 'get_test_vpn', 'POST', f"{base}/get-test-vpn")
+    if response is not None and response.status_code == 200:
+        with recorder.lock:
+            recorder.allocated.append(response.json()['config_id'])
+        timed(recorder, 'download_test_config', 'GET', f"{base}/download-test-config")
+        timed(recorder, 'download_test_qr', 'GET', f"{base}/download-test-qr")
+
+
+def run_check_order(base, recorder, known_numbers):
+    if known_numbers and random.random() < 0.5:
+        order_number = random.choice(known_numbers)
+    else:
+        order_number = f"72{random.randint(0, 0xFFFFFF):06X}"
+    timed(recorder, 'check_order', 'POST', f"{base}/check-order", data={'order_number': order_number})
+
+
+def run_checkout(base, recorder, _):
+    timed(recorder, 'create_checkout_session', 'POST', f"{base}/create-checkout-session",
+          json={'tier': 'monthly'})
+
+
+def run_purchase(base, recorder, _):
+    response = timed(recorder, 'payment_success', 'GET', f"{base}/payment-success",
+                     params={'session_id': f"cs_test_{uuid.uuid4().hex}"})
+    if response is not None and response.status_code == 200:
+        timed(recorder, 'download_purchase_config', 'GET', f"{base}/download-purchase-config")
+
+
+RUNNERS = {
+    'test_vpn': run_test_vpn,
+    'check_order': run_check_order,
+    'checkout': run_checkout,
+    'purchase': run_purchase,
+}
+
+
+def check_allocations(db):
+    """Every active config must belong to exactly one active order"""
+    configs = Counter()
+    cursor = None
+    while True:
+        page = db.get_orders_page(limit=500, cursor=cursor, status='active', columns=['config_id', 'tier'])
+        for order in page['orders']:
+            configs[(order['tier'], order['config_id'])] += 1
+        cursor = page['next_cursor']
+        if not cursor:
+            break
+    return {key: count for key, count in configs.items() if count > 1}, sum(configs.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Tunnelgrain web tier')
+    parser.add_argument('--mode', choices=('json', 'postgresql'), default='json')
+    parser.add_argument('--database-url', default=os.environ.get('BENCH_DATABASE_URL'))
+    parser.add_argument('--reset-db', action='store_true', help='TRUNCATE order tables first (postgresql)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200, help='iterations per scenario')
+    parser.add_argument('--vps-latency-ms', type=float, default=20)
+    parser.add_argument('--vps-failure-rate', type=float, default=0.0)
+    parser.add_argument('--stripe-latency-ms', type=float, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='tunnelgrain-bench-')
+    for name in ('data', 'static'):
+        os.symlink(os.path.join(REPO_ROOT, name), os.path.join(workdir, name))
+    os.chdir(workdir)
+
+    daemon = ServerThread(create_fake_daemon(args.vps_latency_ms, args.vps_failure_rate))
+    daemon.start()
+
+    # The app reads its configuration at import time
+    os.environ.update({
+        'STRIPE_PUBLISHABLE_KEY': 'pk_test_bench',
+        'STRIPE_SECRET_KEY': 'sk_test_bench',
+        'ADMIN_KEY': 'bench',
+        'VPS_1_ENDPOINT': f"http://127.0.0.1:{daemon.port}",
+        'RATE_LIMITS_ENABLED': 'false',
+        'TEST_QUOTA_MAX': '0',
+        'DATABASE_SSLMODE': os.environ.get('DATABASE_SSLMODE', 'disable'),
+    })
+    if args.mode == 'postgresql':
+        if not args.database_url:
+            parser.error('--database-url (or BENCH_DATABASE_URL) is required in postgresql mode')
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ.pop('DATABASE_URL', None)
+
+    import stripe
+    import app as web
+
+    StripeStub(args.stripe_latency_ms).install(stripe)
+
+    if args.mode == 'postgresql' and args.reset_db:
+        conn = web.db.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("TRUNCATE vpn_orders, order_stats")
+        conn.commit()
+        cursor.close()
+        conn.close()
+        web.db.order_cache.clear()
+
+    server = ServerThread(web.app)
+    server.start()
+    base = f"http://127.0.0.1:{server.port}"
+
+    print(f"Tunnelgrain web benchmark: mode={web.db.mode} concurrency={args.concurrency} "
+          f"requests/scenario={args.requests} vps_latency={args.vps_latency_ms}ms "
+          f"vps_failures={args.vps_failure_rate:.0%}")
+    print(f"{'endpoint':<28}{'count':>7}{'rps':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+
+    recorder = Recorder()
+    for scenario in [s.strip() for s in args.scenarios.split(',') if s.strip()]:
+        runner = RUNNERS[scenario]
+        scenario_recorder = Recorder()
+        known_numbers = list(recorder.allocated)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(lambda _: runner(base, scenario_recorder, known_numbers), range(args.requests)))
+        elapsed = time.perf_counter() - start
+
+        for name, values in scenario_recorder.latencies.items():
+            values.sort()
+            statuses = ' '.join(f"{k}:{v}" for k, v in sorted(scenario_recorder.statuses[name].items(), key=str))
+            print(f"{name:<28}{len(values):>7}{len(values) / elapsed:>9.1f}"
+                  f"{percentile(values, 50) * 1000:>9.1f}{percentile(values, 95) * 1000:>9.1f}"
+                  f"{percentile(values, 99) * 1000:>9.1f}  {statuses}")
+
+        recorder.allocated.extend(scenario_recorder.allocated)
+
+    duplicates, active = check_allocations(web.db)
+    duplicate_responses = [c for c, n in Counter(recorder.allocated).items() if n > 1]
+    print()
+    print(f"Allocation check: {active} active orders, {len(recorder.allocated)} test configs handed out")
+    if duplicates or duplicate_responses:
+        print(f"❌ Double-assigned configs: {sorted(duplicates) or duplicate_responses}")
+        exit_code = 1
+    else:
+        print("✅ No config assigned to more than one active order")
+        exit_code = 0
+
+    server.stop()
+    daemon.stop()
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Fake Tunnelgrain expiration daemon for local benchmarks.
+
+Implements the daemon API used by the web tier with in-memory timers and
+configurable latency/failure injection. No WireGuard involved.
+
+    python scripts/local/fake_vps_daemon.py --port 8081 --latency-ms 40 --failure-rate 0.05
+"""
+
+import argparse
+import base64
+import hashlib
+import io
+import os
+import random
+import tarfile
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import Flask, request, jsonify
+
+
+def create_fake_daemon(latency_ms=0, failure_rate=0.0):
+    """Build the fake daemon Flask app"""
+    app = Flask(__name__)
+    timers = {}
+    files = {}  # manifest path -> bytes, e.g. 'configs/monthly/42100001.conf'
+    lock = threading.Lock()
+    stats = {'requests': 0, 'failures': 0}
+
+    @app.before_request
+    def inject_latency_and_failures():
+        with lock:
+            stats['requests'] += 1
+        if latency_ms:
+            time.sleep(random.uniform(0.5, 1.5) * latency_ms / 1000)
+        if failure_rate and random.random() < failure_rate:
+            with lock:
+                stats['failures'] += 1
+            return jsonify({'error': 'Injected failure'}), 500
+
+    @app.route('/api/status', methods=['GET'])
+    def get_status():
+        with lock:
+            statuses = [t['status'] for t in timers.values()]
+        return jsonify({
+            'daemon': 'running',
+            'version': 'fake',
+            'timestamp': datetime.now().isoformat(),
+            'active_timers': statuses.count('active'),
+            'expired_timers': statuses.count('expired'),
+            'total_timers': len(statuses),
+            'wireguard_peers': 0,
+            'peer_mappings': 0
+        })
+
+    @app.route('/api/start-timer', methods=['POST'])
+    def start_timer():
+        data = request.json or {}
+        order_number = data.get('order_number')
+        tier = data.get('tier')
+        duration_minutes = data.get('duration_minutes')
+
+        if not all([order_number, tier, duration_minutes]):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        with lock:
+            timers[order_number] = {
+                'order_number': order_number,
+                'tier': tier,
+                'expires_at': (datetime.now() + timedelta(minutes=duration_minutes)).isoformat(),
+                'status': 'active'
+            }
+
+        return jsonify({
+            'success': True,
+            'message': f'Timer started for {order_number}',
+            'expires_in_minutes': duration_minutes
+        })
+
+    @app.route('/api/list-timers', methods=['GET'])
+    def list_timers():
+        status = request.args.get('status')
+        cursor = request.args.get('cursor', '')
+        limit = request.args.get('limit', type=int)
+        with lock:
+            timer_list = sorted((t for n, t in timers.items()
+                                 if n > cursor and (status is None or t.get('status') == status)),
+                                key=lambda t: t['order_number'])
+        next_cursor = None
+        if limit and len(timer_list) > limit:
+            timer_list = timer_list[:limit]
+            next_cursor = timer_list[-1]['order_number']
+        return jsonify({'count': len(timer_list), 'timers': timer_list, 'next_cursor': next_cursor})
+
+    @app.route('/api/force-expire/<order_number>', methods=['POST'])
+    def force_expire(order_number):
+        with lock:
+            if order_number in timers:
+                timers[order_number]['status'] = 'expired'
+        return jsonify({'success': True, 'message': f'Order {order_number} force expired'})
+
+    @app.route('/api/peers', methods=['GET'])
+    def list_peers():
+        # Every order that has not been expired still has its peer
+        with lock:
+            peers = sorted(n for n, t in timers.items() if t['status'] != 'expired')
+        return jsonify({'count': len(peers), 'peers': peers, 'unmapped_keys': []})
+
+    @app.route('/api/start-timers', methods=['POST'])
+    def start_timers():
+        entries = (request.json or {}).get('timers') or []
+        started = []
+        with lock:
+            for entry in entries:
+                if all(entry.get(k) for k in ('order_number', 'tier', 'duration_minutes')):
+                    timers[entry['order_number']] = {
+                        'order_number': entry['order_number'],
+                        'tier': entry['tier'],
+                        'expires_at': (datetime.now() + timedelta(minutes=entry['duration_minutes'])).isoformat(),
+                        'status': 'active'
+                    }
+                    started.append(entry['order_number'])
+        return jsonify({'success': True, 'started': started, 'skipped': len(entries) - len(started)})
+
+    @app.route('/api/expire-peers', methods=['POST'])
+    def expire_peers():
+        order_numbers = (request.json or {}).get('order_numbers') or []
+        with lock:
+            removed = [n for n in order_numbers if n in timers]
+            for n in removed:
+                timers[n]['status'] = 'expired'
+        return jsonify({'success': True, 'removed': removed,
+                        'missing_public_key': [n for n in order_numbers if n not in removed]})
+
+    @app.route('/api/regenerate-peers', methods=['POST'])
+    def regenerate_peers():
+        configs = (request.json or {}).get('configs') or []
+        fresh = {}
+        with lock:
+            for entry in configs:
+                config_id = entry.get('config_id')
+                timers.pop(config_id, None)
+                key = base64.b64encode(os.urandom(32)).decode()
+                fresh[config_id] = {
+                    'config': f"# Fake regenerated config {config_id}\n[Interface]\nPrivateKey = {key}\n",
+                    'qr_png': base64.b64encode(b'\x89PNG fake').decode(),
+                    'public_key': key
+                }
+        return jsonify({'success': True, 'configs': fresh, 'failed': {}})
+
+    @app.route('/api/config-manifest', methods=['GET'])
+    def config_manifest():
+        # Serves app.fake_files, empty by default: a sync then has nothing to fetch
+        with lock:
+            manifest = {rel: hashlib.sha256(content).hexdigest() for rel, content in files.items()}
+        return jsonify({'generated_at': datetime.now().isoformat(), 'count': len(manifest), 'files': manifest})
+
+    @app.route('/api/config-bundle', methods=['POST'])
+    def config_bundle():
+        paths = (request.json or {}).get('paths') or []
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as tar, lock:
+            for rel in paths:
+                if rel in files:
+                    info = tarfile.TarInfo(rel)
+                    info.size = len(files[rel])
+                    tar.addfile(info, io.BytesIO(files[rel]))
+        return buffer.getvalue(), 200, {'Content-Type': 'application/gzip'}
+
+    @app.route('/api/health', methods=['GET'])
+    def health():
+        return jsonify({'status': 'healthy', 'version': 'fake'})
+
+    app.fake_stats = stats
+    app.fake_timers = timers
+    app.fake_files = files
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fake Tunnelgrain VPS daemon')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    create_fake_daemon(args.latency_ms, args.failure_rate).run(host='127.0.0.1', port=args.port, threaded=True)
@@ -17,7 +17,9 @@ SERVER_IP="213.170.133.116"
 VPS_NAME="tunnelgrain-vps"
 ADMIN_EMAIL="support@tunnelgrain.com"
 
-# Business tiers
+# Business tiers: configs generated per tier. Paid tiers are sold from one
+# shared pool, so their counts only size that pool and pick the directory
+# each config's files live in; per-tier quotas are set in the web app.
 declare -A BUSINESS_TIERS
 BUSINESS_TIERS[test]=50
 BUSINESS_TIERS[monthly]=30
@@ -258,21 +260,50 @@ FIXED VERSION - Works correctly with peer removal
 
 import time
 import json
+import base64
+import hashlib
+import io
+import tarfile
 import subprocess
+from array import array
+from collections import deque
 import logging
 import os
 import threading
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, abort
+from functools import wraps
 import signal
 import sys
 import re
 
-# Configuration
-CONFIG_BASE = "/opt/tunnelgrain"
+# Configuration (paths overridable for local simulation)
+CONFIG_BASE = os.environ.get('TUNNELGRAIN_BASE', "/opt/tunnelgrain")
+WG_CONF = os.environ.get('TUNNELGRAIN_WG_CONF', "/etc/wireguard/wg0.conf")
+WG_BIN = os.environ.get('TUNNELGRAIN_WG_BIN', "wg")
 TIMER_FILE = f"{CONFIG_BASE}/active_timers.json"
 LOG_FILE = f"{CONFIG_BASE}/logs/expiration.log"
 PEER_MAP_FILE = f"{CONFIG_BASE}/peer_mapping.json"
+WG_BATCH_SIZE = 200  # peers per `wg set` call in bulk removals
+QRENCODE_BIN = os.environ.get('TUNNELGRAIN_QRENCODE_BIN', "qrencode")
+SERVER_ENDPOINT = os.environ.get('TUNNELGRAIN_ENDPOINT', "213.170.133.116:51820")
+SERVER_PUBLIC_KEY_FILE = f"{CONFIG_BASE}/keys/server_public.key"
+SUPPORT_EMAIL = "support@tunnelgrain.com"
+# Shared secret for endpoints that return private keys (set in /opt/tunnelgrain/daemon.env)
+API_TOKEN = os.environ.get('TUNNELGRAIN_API_TOKEN')
+SYNC_DIRS = ('configs', 'qr_codes')
+SYNC_PATH_RE = re.compile(r'^(configs|qr_codes)/[a-z]+/[A-Za-z0-9_-]+\.(conf|png)$')
+ORDER_NUMBER_RE = re.compile(r'(42[A-F0-9]{6}|72[A-F0-9]{6})')
+TIMER_CHANGE_LOG_SIZE = 10000  # timer mutations kept for /api/timer-changes
+TIMER_PAGE_MAX = 1000
+TRAFFIC_SAMPLE_SECONDS = int(os.environ.get('TUNNELGRAIN_TRAFFIC_SAMPLE_SECONDS', 60))
+TRAFFIC_RETENTION_DAYS = int(os.environ.get('TUNNELGRAIN_TRAFFIC_RETENTION_DAYS', 30))
+# (bucket width in seconds, buckets kept), finest first: 5-minute buckets for a day, hourly for the retention
+TRAFFIC_TIERS = ((300, 288), (3600, 24 * TRAFFIC_RETENTION_DAYS))
+TRAFFIC_FILE = f"{CONFIG_BASE}/traffic.bin"
+TRAFFIC_SAVE_SECONDS = 600
+TRAFFIC_POINTS_MAX = 1000  # points per /api/usage/<order_number> response
+PEER_CONNECTED_SECONDS = 180  # a handshake newer than this means the peer is connected
 
 os.makedirs(f"{CONFIG_BASE}/logs", exist_ok=True)
 
@@ -288,12 +319,157 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+def require_token(f):
+    """Reject requests without the shared API token (when one is configured)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if API_TOKEN and request.headers.get('X-Api-Token') != API_TOKEN:
+            abort(403)
+        return f(*args, **kwargs)
+    return decorated_function
+
+class ConfigManifest:
+    """sha256 of every synced file, rehashed only when size or mtime changes"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hashes = {}  # relative path -> (size, mtime_ns, sha256)
+    
+    def build(self):
+        files = {}
+        with self.lock:
+            seen = set()
+            for top in SYNC_DIRS:
+                for root, _, names in os.walk(f"{CONFIG_BASE}/{top}"):
+                    for name in names:
+                        full = os.path.join(root, name)
+                        rel = os.path.relpath(full, CONFIG_BASE)
+                        if not SYNC_PATH_RE.match(rel):
+                            continue
+                        
+                        st = os.stat(full)
+                        cached = self.hashes.get(rel)
+                        if not cached or cached[:2] != (st.st_size, st.st_mtime_ns):
+                            with open(full, 'rb') as f:
+                                cached = (st.st_size, st.st_mtime_ns, hashlib.sha256(f.read()).hexdigest())
+                            self.hashes[rel] = cached
+                        
+                        files[rel] = cached[2]
+                        seen.add(rel)
+            
+            for rel in set(self.hashes) - seen:
+                del self.hashes[rel]
+        return files
+
+config_manifest = ConfigManifest()
+
+class DaemonMetrics:
+    """Minimal Prometheus-style histograms and counters for /metrics"""
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 15.0, 30.0, 60.0, 300.0)
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}  # (name, labels) -> [bucket counts..., count, sum]
+        self.counters = {}    # (name, labels) -> value
+        self.help = {}
+    
+    def observe(self, name, value, help_text, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.help[name] = ('histogram', help_text)
+            state = self.histograms.setdefault(key, [0] * (len(self.BUCKETS) + 1) + [0.0])
+            for i, bound in enumerate(self.BUCKETS):
+                if value <= bound:
+                    state[i] += 1
+            state[len(self.BUCKETS)] += 1
+            state[-1] += value
+    
+    def inc(self, name, help_text, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.help[name] = ('counter', help_text)
+            self.counters[key] = self.counters.get(key, 0) + amount
+    
+    @staticmethod
+    def _labels(pairs):
+        return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}' if pairs else ''
+    
+    def expose(self, gauges):
+        """Render all series; gauges is a list of (name, help, value)"""
+        lines = []
+        with self.lock:
+            for name, (kind, help_text) in sorted(self.help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == 'counter':
+                    for (metric, labels), value in self.counters.items():
+                        if metric == name:
+                            lines.append(f"{name}{self._labels(labels)} {value}")
+                else:
+                    for (metric, labels), state in self.histograms.items():
+                        if metric != name:
+                            continue
+                        for i, bound in enumerate(self.BUCKETS):
+                            lines.append(f"{name}_bucket{self._labels(labels + (('le', bound),))} {state[i]}")
+                        lines.append(f"{name}_bucket{self._labels(labels + (('le', '+Inf'),))} {state[len(self.BUCKETS)]}")
+                        lines.append(f"{name}_count{self._labels(labels)} {state[len(self.BUCKETS)]}")
+                        lines.append(f"{name}_sum{self._labels(labels)} {state[-1]}")
+        for name, help_text, value in gauges:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+daemon_metrics = DaemonMetrics()
+
+def run_wg(args, timeout=10, input=None):
+    """Run a wg command and record its latency by subcommand"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        result = subprocess.run([WG_BIN] + args, capture_output=True, text=True, timeout=timeout, input=input)
+        outcome = 'ok' if result.returncode == 0 else 'failed'
+        return result
+    except subprocess.TimeoutExpired:
+        outcome = 'timeout'
+        raise
+    finally:
+        daemon_metrics.observe('tunnelgrain_wg_command_seconds', time.perf_counter() - start,
+                               'Latency of wg commands', command=args[0] if args else '', outcome=outcome)
+
+def timer_expires_at(timer_data):
+    """expires_at as a datetime; timers saved before expires_ts existed fall back to parsing"""
+    expires_ts = timer_data.get('expires_ts')
+    if expires_ts is not None:
+        return datetime.fromtimestamp(expires_ts)
+    return datetime.fromisoformat(timer_data['expires_at'])
+
+def timer_summary(order_number, timer_data, now_ts=None):
+    """The public view of one timer, as returned by the listing endpoints"""
+    expires_ts = timer_data.get('expires_ts')
+    if expires_ts is None:
+        expires_ts = datetime.fromisoformat(timer_data['expires_at']).timestamp()
+    now_ts = time.time() if now_ts is None else now_ts
+    return {
+        'order_number': order_number,
+        'tier': timer_data['tier'],
+        'expires_at': timer_data['expires_at'],
+        'time_remaining_minutes': max(0, round((expires_ts - now_ts) / 60, 1)),
+        'status': timer_data.get('status', 'unknown'),
+        'version': timer_data.get('version', 0)
+    }
+
 class ExpirationManager:
     def __init__(self):
         self.active_timers = {}
         self.peer_mapping = {}
         self.lock = threading.RLock()
         self.running = True
+        self.last_pass_at = 0
+        # Every timer mutation bumps version; changes holds (version, order_number)
+        self.version = 0
+        self.changes = deque(maxlen=TIMER_CHANGE_LOG_SIZE)
+        self.changes_floor = 0  # history at or below this version is gone
         self.load_data()
         self.build_peer_mapping()
         
@@ -303,7 +479,9 @@ class ExpirationManager:
             try:
                 with open(TIMER_FILE, 'r') as f:
                     self.active_timers = json.load(f)
-                logger.info(f"Loaded {len(self.active_timers)} timers")
+                self.version = max((t.get('version', 0) for t in self.active_timers.values()), default=0)
+                self.changes_floor = self.version
+                logger.info(f"Loaded {len(self.active_timers)} timers (version {self.version})")
             except Exception as e:
                 logger.error(f"Error loading timers: {e}")
                 self.active_timers = {}
@@ -370,11 +548,11 @@ class ExpirationManager:
     def build_peer_mapping_from_wg(self):
         """Fallback: Build peer mapping from WireGuard config"""
         try:
-            if not os.path.exists('/etc/wireguard/wg0.conf'):
+            if not os.path.exists(WG_CONF):
                 logger.error("WireGuard config not found")
                 return
             
-            with open('/etc/wireguard/wg0.conf', 'r') as f:
+            with open(WG_CONF, 'r') as f:
                 content = f.read()
             
             # Parse WireGuard config
@@ -425,6 +603,66 @@ class ExpirationManager:
         except Exception as e:
             logger.error(f"Error building peer mapping from WireGuard: {e}")
     
+    def touch_timer(self, order_number):
+        """Record a mutation of active_timers[order_number] (or its removal). Caller holds the lock"""
+        if len(self.changes) == self.changes.maxlen:
+            self.changes_floor = self.changes[0][0]
+        self.version += 1
+        self.changes.append((self.version, order_number))
+        if order_number in self.active_timers:
+            self.active_timers[order_number]['version'] = self.version
+    
+    def expire_timer(self, order_number, expired_at):
+        """Mark a timer expired. Caller holds the lock"""
+        timer_data = self.active_timers.get(order_number)
+        if timer_data is not None:
+            timer_data['status'] = 'expired'
+            timer_data['expired_at'] = expired_at
+            self.touch_timer(order_number)
+    
+    def new_timer(self, order_number, tier, duration_minutes, now):
+        """Create or replace a timer. Caller holds the lock"""
+        expires_at = now + timedelta(minutes=duration_minutes)
+        self.active_timers[order_number] = {
+            'order_number': order_number,
+            'tier': tier,
+            'expires_at': expires_at.isoformat(),
+            'expires_ts': expires_at.timestamp(),
+            'duration_minutes': duration_minutes,
+            'status': 'active',
+            'created_at': now.isoformat()
+        }
+        self.touch_timer(order_number)
+    
+    def changes_since(self, since, limit):
+        """Timers changed after version `since`, oldest change first.
+        
+        Returns (entries, next_since, has_more), or None when the history no longer
+        reaches back to `since` and the caller has to re-list everything.
+        """
+        with self.lock:
+            if since < self.changes_floor or since > self.version:
+                return None
+            
+            latest = {}
+            for version, order_number in self.changes:
+                if version > since:
+                    latest[order_number] = version
+            ordered = sorted(latest.items(), key=lambda item: item[1])
+            has_more = len(ordered) > limit
+            ordered = ordered[:limit]
+            
+            entries = []
+            for order_number, version in ordered:
+                timer_data = self.active_timers.get(order_number)
+                if timer_data is None:
+                    entries.append({'order_number': order_number, 'status': 'removed', 'version': version})
+                else:
+                    entries.append(timer_summary(order_number, timer_data))
+            next_since = ordered[-1][1] if has_more else self.version
+        
+        return entries, next_since, has_more
+    
     def get_public_key(self, order_number):
         """Get public key for order"""
         if order_number in self.peer_mapping:
@@ -436,17 +674,8 @@ class ExpirationManager:
     def add_timer(self, order_number, tier, duration_minutes):
         """Add expiration timer"""
         try:
-            expires_at = datetime.now() + timedelta(minutes=duration_minutes)
-            
             with self.lock:
-                self.active_timers[order_number] = {
-                    'order_number': order_number,
-                    'tier': tier,
-                    'expires_at': expires_at.isoformat(),
-                    'duration_minutes': duration_minutes,
-                    'status': 'active',
-                    'created_at': datetime.now().isoformat()
-                }
+                self.new_timer(order_number, tier, duration_minutes, datetime.now())
             
             self.save_data()
             
@@ -463,6 +692,195 @@ class ExpirationManager:
             logger.error(f"Error adding timer: {e}")
             return False
     
+    def add_timers(self, entries):
+        """Add many expiration timers with a single save"""
+        now = datetime.now()
+        added = []
+        
+        with self.lock:
+            for entry in entries:
+                order_number = entry.get('order_number')
+                tier = entry.get('tier')
+                duration_minutes = entry.get('duration_minutes')
+                if not all([order_number, tier, duration_minutes]):
+                    continue
+                
+                self.new_timer(order_number, tier, duration_minutes, now)
+                added.append(order_number)
+            
+            if added:
+                self.save_data()
+        
+        logger.info(f"⏰ Added {len(added)} timers in batch")
+        return added
+    
+    def live_peer_keys(self):
+        """Public keys currently on the wg0 interface"""
+        result = run_wg(['show', 'wg0', 'peers'], timeout=10)
+        if result.returncode != 0:
+            raise RuntimeError(f"wg show failed: {result.stderr}")
+        return {line.strip() for line in result.stdout.split('\n') if line.strip()}
+    
+    def remove_peers(self, order_numbers):
+        """Remove many peers: one `wg set` per WG_BATCH_SIZE peers, one config rewrite, one save
+        
+        Returns (removed order numbers, order numbers without a known public key).
+        """
+        with self.lock:
+            keys = {n: self.get_public_key(n) for n in set(order_numbers)}
+            missing = sorted(n for n, key in keys.items() if not key)
+            targets = sorted((n, key) for n, key in keys.items() if key)
+            removed = []
+            
+            for i in range(0, len(targets), WG_BATCH_SIZE):
+                chunk = targets[i:i + WG_BATCH_SIZE]
+                args = ['set', 'wg0']
+                for _, public_key in chunk:
+                    args += ['peer', public_key, 'remove']
+                
+                try:
+                    result = run_wg(args, timeout=30)
+                except subprocess.TimeoutExpired:
+                    logger.error(f"❌ Timeout removing {len(chunk)} peers")
+                    continue
+                
+                if result.returncode == 0:
+                    removed.extend(n for n, _ in chunk)
+                else:
+                    logger.error(f"❌ Failed to remove {len(chunk)} peers: {result.stderr}")
+            
+            if removed:
+                self.remove_peers_from_config({n: keys[n] for n in removed})
+                
+                now = datetime.now().isoformat()
+                for order_number in removed:
+                    self.expire_timer(order_number, now)
+                self.save_data()
+        
+        logger.info(f"🔥 Removed {len(removed)} peers in batch ({len(missing)} without public key)")
+        return removed, missing
+    
+    def write_peer_mapping_txt(self):
+        """Rewrite peer_mapping.txt so a restart rebuilds the current keys"""
+        tmp_file = f"{CONFIG_BASE}/peer_mapping.txt.tmp"
+        with open(tmp_file, 'w') as f:
+            for order_number, mapping in self.peer_mapping.items():
+                f.write(f"{order_number}:{mapping['public_key']}:{mapping['client_ip']}:{mapping['tier']}\n")
+        os.replace(tmp_file, f"{CONFIG_BASE}/peer_mapping.txt")
+    
+    def render_client_config(self, order_number, tier, private_key, client_ip, server_public_key):
+        """Client .conf in the same layout as the setup script generates"""
+        return f"""# Tunnelgrain VPN Configuration
+# Tier: {tier} | Order: {order_number}
+# Generated: {datetime.now().strftime('%a %b %d %H:%M:%S %Y')}
+# Support: {SUPPORT_EMAIL}
+
+[Interface]
+PrivateKey = {private_key}
+Address = {client_ip}/24
+DNS = 1.1.1.1, 1.0.0.1
+
+[Peer]
+PublicKey = {server_public_key}
+Endpoint = {SERVER_ENDPOINT}
+AllowedIPs = 0.0.0.0/0
+PersistentKeepalive = 25
+"""
+    
+    def regenerate_peers(self, configs):
+        """Give recycled configs fresh keypairs and put them back on wg0
+        
+        configs: [{'config_id', 'tier'}]. Old peers are dropped and new ones added
+        with one `wg set` per WG_BATCH_SIZE configs, one wg0.conf rewrite and one
+        save. Returns ({config_id: {'config', 'qr_png', 'public_key'}}, {config_id: error}).
+        """
+        with open(SERVER_PUBLIC_KEY_FILE, 'r') as f:
+            server_public_key = f.read().strip()
+        
+        fresh = {}
+        failed = {}
+        
+        with self.lock:
+            for entry in configs:
+                config_id = entry.get('config_id')
+                mapping = self.peer_mapping.get(config_id)
+                if not mapping or not mapping.get('client_ip'):
+                    failed[config_id] = 'unknown config'
+                    continue
+                
+                try:
+                    private_key = run_wg(['genkey']).stdout.strip()
+                    public_key = run_wg(['pubkey'], input=private_key + '\n').stdout.strip()
+                    if not private_key or not public_key:
+                        raise RuntimeError('wg genkey/pubkey returned nothing')
+                    
+                    tier = entry.get('tier') or mapping.get('tier')
+                    config_text = self.render_client_config(config_id, tier, private_key,
+                                                            mapping['client_ip'], server_public_key)
+                    qr = subprocess.run([QRENCODE_BIN, '-t', 'PNG', '-s', '8', '-m', '2', '-o', '-'],
+                                        input=config_text.encode(), capture_output=True, timeout=10)
+                    if qr.returncode != 0:
+                        raise RuntimeError(f"qrencode failed: {qr.stderr.decode(errors='replace')}")
+                    
+                    fresh[config_id] = {
+                        'tier': tier,
+                        'client_ip': mapping['client_ip'],
+                        'old_key': mapping.get('public_key'),
+                        'public_key': public_key,
+                        'config': config_text,
+                        'qr_png': qr.stdout
+                    }
+                except Exception as e:
+                    logger.error(f"❌ Key generation failed for {config_id}: {e}")
+                    failed[config_id] = str(e)
+            
+            # Swap peers on the live interface
+            items = sorted(fresh.items())
+            for i in range(0, len(items), WG_BATCH_SIZE):
+                chunk = items[i:i + WG_BATCH_SIZE]
+                args = ['set', 'wg0']
+                for _, peer in chunk:
+                    if peer['old_key']:
+                        args += ['peer', peer['old_key'], 'remove']
+                    args += ['peer', peer['public_key'], 'allowed-ips', f"{peer['client_ip']}/32"]
+                
+                result = run_wg(args, timeout=30)
+                if result.returncode != 0:
+                    for config_id, _ in chunk:
+                        failed[config_id] = f"wg set failed: {result.stderr}"
+                        del fresh[config_id]
+            
+            if fresh:
+                # Persist: drop old sections, append new ones, update mappings
+                self.remove_peers_from_config({c: p['old_key'] for c, p in fresh.items()})
+                with open(WG_CONF, 'a') as f:
+                    for config_id, peer in sorted(fresh.items()):
+                        f.write(f"\n[Peer]\n# {config_id} ({peer['tier']})\n"
+                                f"PublicKey = {peer['public_key']}\nAllowedIPs = {peer['client_ip']}/32\n")
+                
+                for config_id, peer in fresh.items():
+                    self.peer_mapping[config_id]['public_key'] = peer['public_key']
+                    # The previous order's timer is finished with
+                    if self.active_timers.pop(config_id, None) is not None:
+                        self.touch_timer(config_id)
+                    
+                    tier_dir = f"{CONFIG_BASE}/configs/{peer['tier']}"
+                    qr_dir = f"{CONFIG_BASE}/qr_codes/{peer['tier']}"
+                    os.makedirs(tier_dir, exist_ok=True)
+                    os.makedirs(qr_dir, exist_ok=True)
+                    with open(f"{tier_dir}/{config_id}.conf", 'w') as f:
+                        f.write(peer['config'])
+                    os.chmod(f"{tier_dir}/{config_id}.conf", 0o600)
+                    with open(f"{qr_dir}/{config_id}.png", 'wb') as f:
+                        f.write(peer['qr_png'])
+                
+                self.write_peer_mapping_txt()
+                self.save_data()
+        
+        logger.info(f"♻️ Regenerated {len(fresh)} configs ({len(failed)} failed)")
+        return ({c: {'config': p['config'], 'qr_png': p['qr_png'], 'public_key': p['public_key']}
+                 for c, p in fresh.items()}, failed)
+    
     def remove_peer_from_wireguard(self, order_number, public_key):
         """Remove peer from WireGuard interface and config"""
         try:
@@ -473,10 +891,7 @@ class ExpirationManager:
             logger.info(f"🔥 Removing peer {order_number} with key {public_key[:16]}...")
             
             # Remove from running WireGuard interface
-            result = subprocess.run(
-                ['wg', 'set', 'wg0', 'peer', public_key, 'remove'],
-                capture_output=True, text=True, timeout=10
-            )
+            result = run_wg(['set', 'wg0', 'peer', public_key, 'remove'], timeout=10)
             
             if result.returncode == 0:
                 logger.info(f"✅ Successfully removed peer {order_number} from WireGuard interface")
@@ -498,13 +913,20 @@ class ExpirationManager:
     
     def remove_peer_from_config(self, order_number, public_key):
         """Remove peer from WireGuard config file"""
+        logger.info(f"🗑️ Removing {order_number} from config file...")
+        self.remove_peers_from_config({order_number: public_key})
+    
+    def remove_peers_from_config(self, targets):
+        """Remove every peer section matching {order_number: public_key} in one rewrite"""
         try:
-            logger.info(f"🗑️ Removing {order_number} from config file...")
+            numbers = set(targets)
+            keys = {key for key in targets.values() if key}
             
-            with open('/etc/wireguard/wg0.conf', 'r') as f:
+            with open(WG_CONF, 'r') as f:
                 lines = f.readlines()
             
             new_lines = []
+            removed = 0
             i = 0
             
             while i < len(lines):
@@ -512,34 +934,32 @@ class ExpirationManager:
                 
                 # Check if this line starts a peer section
                 if line == '[Peer]':
-                    # Look ahead to see if this peer contains our order number or public key
                     peer_section = []
                     j = i
                     while j < len(lines) and (j == i or not lines[j].strip().startswith('[')):
                         peer_section.append(lines[j])
                         j += 1
                     
-                    peer_content = ''.join(peer_section)
+                    # Match on the order number comment or the PublicKey line
+                    section_numbers = set(ORDER_NUMBER_RE.findall(''.join(peer_section)))
+                    section_keys = {l.split('=', 1)[1].strip() for l in peer_section
+                                    if l.strip().startswith('PublicKey') and '=' in l}
                     
-                    # Check if this peer section contains our target
-                    if order_number in peer_content or public_key in peer_content:
-                        logger.info(f"🗑️ Found and removing peer section for {order_number}")
-                        i = j  # Skip this entire peer section
-                        continue
+                    if section_numbers & numbers or section_keys & keys:
+                        removed += 1
                     else:
-                        # Keep this peer section
                         new_lines.extend(peer_section)
-                        i = j
-                        continue
+                    i = j
+                    continue
                 
                 new_lines.append(lines[i])
                 i += 1
             
             # Write updated config
-            with open('/etc/wireguard/wg0.conf', 'w') as f:
+            with open(WG_CONF, 'w') as f:
                 f.writelines(new_lines)
             
-            logger.info(f"✅ Updated WireGuard config file")
+            logger.info(f"✅ Updated WireGuard config file ({removed} peer sections removed)")
             
         except Exception as e:
             logger.error(f"❌ Error updating config file: {e}")
@@ -555,28 +975,30 @@ class ExpirationManager:
                     if timer_data.get('status') != 'active':
                         continue
                     
-                    expires_at = datetime.fromisoformat(timer_data['expires_at'])
+                    expires_at = timer_expires_at(timer_data)
                     
                     if expires_at <= now:
                         logger.info(f"⏰ Timer expired for {order_number}")
+                        daemon_metrics.observe('tunnelgrain_expiry_lag_seconds', (now - expires_at).total_seconds(),
+                                               'Delay between expires_at and the expiry pass handling it')
                         
                         # Get public key and remove peer
                         public_key = self.get_public_key(order_number)
                         
                         if public_key:
                             if self.remove_peer_from_wireguard(order_number, public_key):
-                                # Mark as expired
-                                timer_data['status'] = 'expired'
-                                timer_data['expired_at'] = now.isoformat()
+                                self.expire_timer(order_number, now.isoformat())
                                 expired_orders.append(order_number)
+                                daemon_metrics.inc('tunnelgrain_expirations_total', 'Timer expirations by outcome', outcome='removed')
                                 logger.info(f"✅ Successfully expired {order_number}")
                             else:
+                                daemon_metrics.inc('tunnelgrain_expirations_total', 'Timer expirations by outcome', outcome='failed')
                                 logger.error(f"❌ Failed to expire {order_number}")
                         else:
                             logger.error(f"❌ No public key found for {order_number} - marking as expired anyway")
-                            timer_data['status'] = 'expired'
-                            timer_data['expired_at'] = now.isoformat()
+                            self.expire_timer(order_number, now.isoformat())
                             expired_orders.append(order_number)
+                            daemon_metrics.inc('tunnelgrain_expirations_total', 'Timer expirations by outcome', outcome='no_key')
                 
                 except Exception as e:
                     logger.error(f"❌ Error processing timer {order_number}: {e}")
@@ -586,7 +1008,7 @@ class ExpirationManager:
             
             # Log current WireGuard peer count
             try:
-                result = subprocess.run(['wg', 'show', 'wg0'], capture_output=True, text=True, timeout=5)
+                result = run_wg(['show', 'wg0'], timeout=5)
                 current_peers = len([line for line in result.stdout.split('\n') if line.strip().startswith('peer:')])
                 logger.info(f"📊 Current WireGuard peers: {current_peers}")
             except:
@@ -594,13 +1016,66 @@ class ExpirationManager:
         
         return len(expired_orders)
     
+    def catch_up_expired(self):
+        """Expire every overdue timer at once (startup after downtime).
+        
+        One scan, batched `wg set` calls, one wg0.conf rewrite and one save
+        via remove_peers, instead of a remove/rewrite/save per peer in the
+        first check_expiring_timers pass.
+        """
+        start = time.perf_counter()
+        now = datetime.now()
+        
+        with self.lock:
+            overdue = {}
+            for order_number, timer_data in self.active_timers.items():
+                if timer_data.get('status') != 'active':
+                    continue
+                try:
+                    expires_at = timer_expires_at(timer_data)
+                except (KeyError, ValueError) as e:
+                    logger.error(f"❌ Bad timer {order_number}: {e}")
+                    continue
+                if expires_at <= now:
+                    overdue[order_number] = expires_at
+            
+            if not overdue:
+                logger.info("✅ Startup catch-up: no overdue timers")
+                return 0
+            
+            logger.info(f"⏰ Startup catch-up: {len(overdue)} timers expired while the daemon was down")
+            removed, missing = self.remove_peers(list(overdue))
+            
+            # Same as the regular pass: no key means nothing to remove, the timer is done anyway
+            for order_number in missing:
+                self.expire_timer(order_number, now.isoformat())
+            if missing:
+                self.save_data()
+        
+        for order_number in removed + missing:
+            daemon_metrics.observe('tunnelgrain_expiry_lag_seconds', (now - overdue[order_number]).total_seconds(),
+                                   'Delay between expires_at and the expiry pass handling it')
+        daemon_metrics.inc('tunnelgrain_expirations_total', 'Timer expirations by outcome',
+                           amount=len(removed), outcome='removed')
+        daemon_metrics.inc('tunnelgrain_expirations_total', 'Timer expirations by outcome',
+                           amount=len(missing), outcome='no_key')
+        
+        failed = len(overdue) - len(removed) - len(missing)
+        logger.info(f"✅ Startup catch-up: removed {len(removed)} peers, {len(missing)} without key, "
+                    f"{failed} left for the regular pass ({(time.perf_counter() - start) * 1000:.0f} ms)")
+        return len(removed) + len(missing)
+    
     def expiration_loop(self):
         """Main expiration loop"""
         logger.info("🚀 Starting expiration checker")
         
         while self.running:
             try:
+                pass_start = time.perf_counter()
                 expired_count = self.check_expiring_timers()
+                self.last_pass_at = time.time()
+                daemon_metrics.observe('tunnelgrain_expiry_pass_seconds', time.perf_counter() - pass_start,
+                                       'Duration of one check_expiring_timers pass')
                 if expired_count > 0:
                     logger.info(f"⏰ Expired {expired_count} timers this cycle")
                 
@@ -610,8 +1085,283 @@ class ExpirationManager:
                 logger.error(f"❌ Error in expiration loop: {e}")
                 time.sleep(30)
 
+def parse_wg_dump(text):
+    """[(public_key, latest_handshake, rx_bytes, tx_bytes)] from `wg show <if> dump` output"""
+    peers = []
+    for line in text.split('\n')[1:]:  # first line is the interface itself
+        fields = line.split('\t')
+        if len(fields) < 8:
+            continue
+        try:
+            peers.append((fields[0], int(fields[4]), int(fields[5]), int(fields[6])))
+        except ValueError:
+            continue
+    return peers
+
+class TrafficSeries:
+    """Ring buffers for one peer: per tier, rx/tx KiB and the latest handshake per bucket"""
+    __slots__ = ('public_key', 'rings', 'rx_rest', 'tx_rest', 'last_active')
+    
+    def __init__(self, public_key, tiers):
+        self.public_key = public_key
+        self.rings = [tuple(array('I', bytes(4 * size)) for _ in range(3)) for _, size in tiers]
+        self.rx_rest = 0  # bytes below one KiB, carried into the next sample
+        self.tx_rest = 0
+        self.last_active = 0
+    
+    def nbytes(self):
+        return sum(a.itemsize * len(a) for rings in self.rings for a in rings)
+
+class TrafficCollector:
+    """Per-peer rx/tx and handshake history, sampled from `wg show wg0 dump`.
+    
+    Every peer gets the same preallocated uint32 arrays per tier (rx KiB, tx
+    KiB, latest handshake), indexed by bucket number modulo the tier size, so
+    memory is 12 bytes x buckets x peers (about 12 KB per peer with the
+    default tiers) and never grows with uptime. Pool
+    peers that never handshake get no series at all. Series are keyed by order
+    number through the peer mapping and start over when the order's public key
+    changes (recycled config). Counters reset by wg (peer re-added, interface
+    restart) count from zero rather than going negative.
+    """
+    
+    def __init__(self, manager, tiers=TRAFFIC_TIERS):
+        self.manager = manager
+        self.tiers = tiers
+        self.series = {}                   # order_number -> TrafficSeries
+        self.counters = {}                 # public_key -> (rx, tx) at the previous sample
+        self.buckets = [None] * len(tiers)  # current bucket number per tier
+        self.lock = threading.Lock()
+        self.primed = False
+        self.last_sample_at = 0
+        self.peers_seen = 0
+        self.peers_connected = 0
+        self.unmapped = 0
+    
+    def sample(self):
+        """Read wg counters once and record them"""
+        start = time.perf_counter()
+        result = run_wg(['show', 'wg0', 'dump'], timeout=10)
+        if result.returncode != 0:
+            raise RuntimeError(f"wg show dump failed: {result.stderr}")
+        peers = parse_wg_dump(result.stdout)
+        
+        with self.manager.lock:
+            by_key = {m.get('public_key'): n for n, m in self.manager.peer_mapping.items()}
+        
+        self.record(peers, by_key, time.time())
+        daemon_metrics.observe('tunnelgrain_traffic_sample_seconds', time.perf_counter() - start,
+                               'Duration of one traffic sample')
+    
+    def _advance(self, now):
+        """Move every tier to the bucket holding now, zeroing the buckets passed over"""
+        for i, (width, size) in enumerate(self.tiers):
+            bucket = int(now // width)
+            old = self.buckets[i]
+            if old is not None and bucket > old:
+                for skipped in range(max(old + 1, bucket - size + 1), bucket + 1):
+                    slot = skipped % size
+                    for series in self.series.values():
+                        for ring in series.rings[i]:
+                            ring[slot] = 0
+            if old is None or bucket > old:
+                self.buckets[i] = bucket
+    
+    def record(self, peers, by_key, now):
+        with self.lock:
+            self._advance(now)
+            slots = [bucket % size for bucket, (_, size) in zip(self.buckets, self.tiers)]
+            live = set()
+            connected = unmapped = 0
+            
+            for public_key, handshake, rx, tx in peers:
+                live.add(public_key)
+                previous = self.counters.get(public_key)
+                self.counters[public_key] = (rx, tx)
+                if previous is None:
+                    # First sample after startup only sets the baseline; a peer added later counts from zero
+                    d_rx, d_tx = (0, 0) if not self.primed else (rx, tx)
+                else:
+                    # A smaller counter means wg reset it
+                    d_rx = rx - previous[0] if rx >= previous[0] else rx
+                    d_tx = tx - previous[1] if tx >= previous[1] else tx
+                
+                if handshake and now - handshake <= PEER_CONNECTED_SECONDS:
+                    connected += 1
+                
+                order_number = by_key.get(public_key)
+                if order_number is None:
+                    unmapped += 1
+                    continue
+                
+                series = self.series.get(order_number)
+                if series is None or series.public_key != public_key:
+                    if not (handshake or d_rx or d_tx):
+                        continue  # never used: no series
+                    series = self.series[order_number] = TrafficSeries(public_key, self.tiers)
+                
+                rx_kib, series.rx_rest = divmod(series.rx_rest + d_rx, 1024)
+                tx_kib, series.tx_rest = divmod(series.tx_rest + d_tx, 1024)
+                if rx_kib or tx_kib:
+                    series.last_active = now
+                for (rx_ring, tx_ring, hs_ring), slot in zip(series.rings, slots):
+                    rx_ring[slot] = min(0xFFFFFFFF, rx_ring[slot] + rx_kib)
+                    tx_ring[slot] = min(0xFFFFFFFF, tx_ring[slot] + tx_kib)
+                    if handshake > hs_ring[slot]:
+                        hs_ring[slot] = handshake
+            
+            # Forget counters of removed peers; drop series once their whole history has aged out
+            for public_key in set(self.counters) - live:
+                del self.counters[public_key]
+            retention = self.tiers[-1][0] * self.tiers[-1][1]
+            for order_number in [n for n, s in self.series.items()
+                                 if s.public_key not in live and now - s.last_active > retention]:
+                del self.series[order_number]
+            
+            self.primed = True
+            self.last_sample_at = now
+            self.peers_seen = len(peers)
+            self.peers_connected = connected
+            self.unmapped = unmapped
+    
+    def _pick_tier(self, start):
+        """Finest tier whose history still reaches back to start"""
+        for i, (width, size) in enumerate(self.tiers):
+            if self.buckets[i] is not None and (self.buckets[i] - size + 1) * width <= start:
+                return i
+        return len(self.tiers) - 1
+    
+    def query(self, order_number, start, end, step):
+        """Usage of one order in [start, end), summed into points step seconds apart.
+        
+        Returns None for an order without a series. The step is rounded up to
+        a multiple of the bucket width of the finest tier covering start.
+        """
+        with self.lock:
+            series = self.series.get(order_number)
+            if series is None:
+                return None
+            
+            tier = self._pick_tier(start)
+            width, size = self.tiers[tier]
+            step = max(width, -(-int(step) // width) * width)
+            result = {'order_number': order_number, 'resolution_seconds': width, 'step_seconds': step, 'points': []}
+            current = self.buckets[tier]
+            if current is None:
+                return result
+            
+            rx_ring, tx_ring, hs_ring = series.rings[tier]
+            points = result['points']
+            for bucket in range(max(int(start // width), current - size + 1), min(int((end - 1) // width), current) + 1):
+                slot = bucket % size
+                t = bucket * width // step * step
+                if not points or points[-1][0] != t:
+                    points.append([t, 0, 0, 0])
+                point = points[-1]
+                point[1] += rx_ring[slot] * 1024
+                point[2] += tx_ring[slot] * 1024
+                point[3] = max(point[3], hs_ring[slot])
+            
+            result['points'] = [{'t': t, 'rx_bytes': rx, 'tx_bytes': tx, 'latest_handshake': hs or None}
+                                for t, rx, tx, hs in points]
+            return result
+    
+    def summary(self, window):
+        """Totals per order over the last window seconds, from the finest tier that covers it"""
+        with self.lock:
+            now = self.last_sample_at or time.time()
+            tier = self._pick_tier(now - window)
+            width, size = self.tiers[tier]
+            current = self.buckets[tier]
+            if current is None:
+                return []
+            
+            count = min(size, max(1, int(window // width)))
+            first = (current - count + 1) % size
+            last = current % size
+            ranges = [(first, last + 1)] if first <= last else [(first, size), (0, last + 1)]
+            
+            usage = []
+            for order_number, series in sorted(self.series.items()):
+                rx_ring, tx_ring, hs_ring = series.rings[tier]
+                usage.append({
+                    'order_number': order_number,
+                    'rx_bytes': sum(sum(rx_ring[a:b]) for a, b in ranges) * 1024,
+                    'tx_bytes': sum(sum(tx_ring[a:b]) for a, b in ranges) * 1024,
+                    'latest_handshake': max(max(hs_ring[a:b]) for a, b in ranges) or None
+                })
+            return usage
+    
+    def allocated_bytes(self):
+        with self.lock:
+            return sum(s.nbytes() for s in self.series.values())
+    
+    def save(self, path=TRAFFIC_FILE):
+        """JSON header line followed by the raw arrays; written aside and renamed into place"""
+        with self.lock:
+            order = sorted(self.series.items())
+            header = {
+                'tiers': [list(t) for t in self.tiers],
+                'buckets': self.buckets,
+                'series': [[n, s.public_key, s.rx_rest, s.tx_rest, s.last_active] for n, s in order]
+            }
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(json.dumps(header).encode() + b'\n')
+                for _, series in order:
+                    for rings in series.rings:
+                        for ring in rings:
+                            ring.tofile(f)
+            os.replace(tmp_path, path)
+    
+    def load(self, path=TRAFFIC_FILE):
+        """Restore saved history; a file written with other tiers is ignored"""
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                if [tuple(t) for t in header['tiers']] != list(self.tiers):
+                    logger.warning("⚠️ Traffic history was saved with other tiers, starting empty")
+                    return
+                series = {}
+                for order_number, public_key, rx_rest, tx_rest, last_active in header['series']:
+                    entry = TrafficSeries(public_key, self.tiers)
+                    entry.rx_rest, entry.tx_rest, entry.last_active = rx_rest, tx_rest, last_active
+                    for rings in entry.rings:
+                        for ring in rings:
+                            size = len(ring)
+                            del ring[:]
+                            ring.fromfile(f, size)
+                    series[order_number] = entry
+            with self.lock:
+                self.series = series
+                self.buckets = header['buckets']
+            logger.info(f"Loaded traffic history for {len(series)} peers")
+        except Exception as e:
+            logger.error(f"❌ Error loading traffic history: {e}")
+    
+    def collection_loop(self):
+        """Sample every TRAFFIC_SAMPLE_SECONDS, save every TRAFFIC_SAVE_SECONDS"""
+        logger.info("📈 Starting traffic collector")
+        last_save = time.monotonic()
+        
+        while self.manager.running:
+            try:
+                self.sample()
+                daemon_metrics.inc('tunnelgrain_traffic_samples_total', 'Traffic samples taken', outcome='ok')
+                if time.monotonic() - last_save >= TRAFFIC_SAVE_SECONDS:
+                    self.save()
+                    last_save = time.monotonic()
+            except Exception as e:
+                daemon_metrics.inc('tunnelgrain_traffic_samples_total', 'Traffic samples taken', outcome='error')
+                logger.error(f"❌ Error sampling traffic: {e}")
+            time.sleep(TRAFFIC_SAMPLE_SECONDS)
+
 # Global manager
 manager = ExpirationManager()
+traffic = TrafficCollector(manager)
+traffic.load()
 
 @app.route('/api/status', methods=['GET'])
 def get_status():
@@ -623,8 +1373,7 @@ def get_status():
             
             # Get WireGuard peer count
             try:
-                result = subprocess.run(['wg', 'show', 'wg0'], 
-                                      capture_output=True, text=True, timeout=5)
+                result = run_wg(['show', 'wg0'], timeout=5)
                 wireguard_peers = len([line for line in result.stdout.split('\n') 
                                      if line.strip().startswith('peer:')])
             except:
@@ -638,7 +1387,8 @@ def get_status():
             'expired_timers': expired_count,
             'total_timers': len(manager.active_timers),
             'wireguard_peers': wireguard_peers,
-            'peer_mappings': len(manager.peer_mapping)
+            'peer_mappings': len(manager.peer_mapping),
+            'connected_peers': traffic.peers_connected
         })
         
     except Exception as e:
@@ -673,32 +1423,73 @@ def start_timer():
 
 @app.route('/api/list-timers', methods=['GET'])
 def list_timers():
-    """List active timers"""
+    """List timers ordered by order number.
+    
+    Optional filters: status, tier. Pagination: limit (max TIMER_PAGE_MAX) and
+    cursor (the next_cursor of the previous page). Without limit every
+    matching timer is returned. `version` can seed /api/timer-changes.
+    """
     try:
+        status = request.args.get('status')
+        tier = request.args.get('tier')
+        cursor = request.args.get('cursor', '')
+        limit = request.args.get('limit', type=int)
+        if limit is not None:
+            limit = max(1, min(limit, TIMER_PAGE_MAX))
+        
+        # Only shallow copies under the lock; sorting and formatting happen outside it
         with manager.lock:
-            timers = []
-            now = datetime.now()
-            
-            for order_number, timer_data in manager.active_timers.items():
-                expires_at = datetime.fromisoformat(timer_data['expires_at'])
-                time_remaining = (expires_at - now).total_seconds() / 60
-                
-                timers.append({
-                    'order_number': order_number,
-                    'tier': timer_data['tier'],
-                    'expires_at': timer_data['expires_at'],
-                    'time_remaining_minutes': max(0, round(time_remaining, 1)),
-                    'status': timer_data.get('status', 'unknown')
-                })
+            version = manager.version
+            selected = [
+                (order_number, dict(timer_data))
+                for order_number, timer_data in manager.active_timers.items()
+                if order_number > cursor
+                and (status is None or timer_data.get('status') == status)
+                and (tier is None or timer_data.get('tier') == tier)
+            ]
+        
+        selected.sort(key=lambda item: item[0])
+        next_cursor = None
+        if limit is not None and len(selected) > limit:
+            selected = selected[:limit]
+            next_cursor = selected[-1][0]
+        
+        now_ts = time.time()
+        timers = [timer_summary(order_number, timer_data, now_ts) for order_number, timer_data in selected]
         
         return jsonify({
             'count': len(timers),
-            'timers': timers
+            'timers': timers,
+            'next_cursor': next_cursor,
+            'version': version
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/timer-changes', methods=['GET'])
+def timer_changes():
+    """Timers created, expired or removed after version `since`.
+    
+    Poll with since=<previous next_since>. reset=true means the change log no
+    longer covers `since`: re-list with /api/list-timers and continue from its version.
+    """
+    since = request.args.get('since', 0, type=int)
+    limit = max(1, min(request.args.get('limit', TIMER_PAGE_MAX, type=int), TIMER_PAGE_MAX))
+    
+    result = manager.changes_since(since, limit)
+    if result is None:
+        return jsonify({'reset': True, 'version': manager.version, 'changes': [], 'next_since': manager.version})
+    
+    entries, next_since, has_more = result
+    return jsonify({
+        'reset': False,
+        'version': manager.version,
+        'changes': entries,
+        'next_since': next_since,
+        'has_more': has_more
+    })
+
 @app.route('/api/force-expire/<order_number>', methods=['POST'])
 def force_expire(order_number):
     """Force expire a specific order"""
@@ -710,9 +1501,7 @@ def force_expire(order_number):
             if public_key:
                 if manager.remove_peer_from_wireguard(order_number, public_key):
                     # Mark as expired if timer exists
-                    if order_number in manager.active_timers:
-                        manager.active_timers[order_number]['status'] = 'expired'
-                        manager.active_timers[order_number]['expired_at'] = datetime.now().isoformat()
+                    manager.expire_timer(order_number, datetime.now().isoformat())
                     manager.save_data()
                     
                     return jsonify({
@@ -728,6 +1517,174 @@ def force_expire(order_number):
         logger.error(f"Error force expiring {order_number}: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/peers', methods=['GET'])
+def list_peers():
+    """Live WireGuard peers, resolved to order numbers via the peer mapping"""
+    try:
+        live_keys = manager.live_peer_keys()
+        
+        with manager.lock:
+            by_key = {m.get('public_key'): n for n, m in manager.peer_mapping.items()}
+        
+        peers = sorted(by_key[key] for key in live_keys if key in by_key)
+        unmapped = sorted(key for key in live_keys if key not in by_key)
+        
+        return jsonify({
+            'count': len(live_keys),
+            'peers': peers,
+            'unmapped_keys': unmapped
+        })
+        
+    except Exception as e:
+        logger.error(f"Error listing peers: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/usage', methods=['GET'])
+def usage_summary():
+    """rx/tx totals and latest handshake per order over ?window= seconds (default one day)"""
+    try:
+        window = max(1, int(request.args.get('window', 86400)))
+    except ValueError:
+        return jsonify({'error': 'window must be a number of seconds'}), 400
+    
+    usage = traffic.summary(window)
+    return jsonify({
+        'window_seconds': window,
+        'sampled_at': traffic.last_sample_at or None,
+        'count': len(usage),
+        'usage': usage
+    })
+
+@app.route('/api/usage/<order_number>', methods=['GET'])
+def usage_series(order_number):
+    """Downsampled usage of one order: ?from=&to= (unix seconds, default last day), ?step= or ?points="""
+    try:
+        now = time.time()
+        end = float(request.args.get('to', now))
+        start = float(request.args.get('from', end - 86400))
+        points = min(TRAFFIC_POINTS_MAX, max(1, int(request.args.get('points', TRAFFIC_POINTS_MAX))))
+        step = int(request.args.get('step', 0))
+    except ValueError:
+        return jsonify({'error': 'from, to, step and points must be numbers'}), 400
+    if end <= start:
+        return jsonify({'error': 'from must be before to'}), 400
+    
+    # Never more than points (or TRAFFIC_POINTS_MAX) points, whatever step was asked for
+    step = max(step, int(-(-(end - start) // points)))
+    result = traffic.query(order_number, start, end, step)
+    if result is None:
+        return jsonify({'error': 'No usage recorded for this order', 'order_number': order_number}), 404
+    return jsonify(result)
+
+@app.route('/api/start-timers', methods=['POST'])
+def start_timers():
+    """Start many timers in one call: {"timers": [{order_number, tier, duration_minutes}, ...]}"""
+    try:
+        entries = (request.json or {}).get('timers') or []
+        added = manager.add_timers(entries)
+        
+        return jsonify({
+            'success': True,
+            'started': added,
+            'skipped': len(entries) - len(added)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error starting timers: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/expire-peers', methods=['POST'])
+def expire_peers():
+    """Remove many peers in one call: {"order_numbers": [...]}"""
+    try:
+        order_numbers = (request.json or {}).get('order_numbers') or []
+        removed, missing = manager.remove_peers(order_numbers)
+        
+        return jsonify({
+            'success': True,
+            'removed': removed,
+            'missing_public_key': missing
+        })
+        
+    except Exception as e:
+        logger.error(f"Error expiring peers: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/regenerate-peers', methods=['POST'])
+@require_token
+def regenerate_peers():
+    """Fresh keys for recycled configs: {"configs": [{config_id, tier}, ...]}"""
+    try:
+        configs = (request.json or {}).get('configs') or []
+        fresh, failed = manager.regenerate_peers(configs)
+        
+        return jsonify({
+            'success': True,
+            'configs': {
+                config_id: {
+                    'config': peer['config'],
+                    'qr_png': base64.b64encode(peer['qr_png']).decode(),
+                    'public_key': peer['public_key']
+                }
+                for config_id, peer in fresh.items()
+            },
+            'failed': failed
+        })
+        
+    except Exception as e:
+        logger.error(f"Error regenerating peers: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/config-manifest', methods=['GET'])
+def get_config_manifest():
+    """Content hashes of every config and QR file: {"files": {"configs/test/72100001.conf": sha256}}"""
+    try:
+        files = config_manifest.build()
+        return jsonify({
+            'generated_at': datetime.now().isoformat(),
+            'count': len(files),
+            'files': files
+        })
+    except Exception as e:
+        logger.error(f"Error building config manifest: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/config-bundle', methods=['POST'])
+@require_token
+def get_config_bundle():
+    """tar.gz of the requested manifest paths: {"paths": [...]}"""
+    paths = (request.json or {}).get('paths') or []
+    if any(not SYNC_PATH_RE.match(p) for p in paths):
+        return jsonify({'error': 'Invalid path in request'}), 400
+    
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for rel in paths:
+            full = f"{CONFIG_BASE}/{rel}"
+            if os.path.isfile(full):
+                tar.add(full, arcname=rel)
+    
+    return buffer.getvalue(), 200, {'Content-Type': 'application/gzip'}
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition"""
+    with manager.lock:
+        statuses = [t.get('status') for t in manager.active_timers.values()]
+        peer_mappings = len(manager.peer_mapping)
+    
+    gauges = [
+        ('tunnelgrain_timers_active', 'Timers waiting to expire', statuses.count('active')),
+        ('tunnelgrain_timers_expired', 'Timers already expired', statuses.count('expired')),
+        ('tunnelgrain_peer_mappings', 'Known order to peer mappings', peer_mappings),
+        ('tunnelgrain_last_expiry_pass_timestamp', 'Unix time of the last expiry pass', manager.last_pass_at),
+        ('tunnelgrain_wg_peers', 'Peers on wg0 at the last traffic sample', traffic.peers_seen),
+        ('tunnelgrain_wg_peers_connected', 'Peers with a handshake in the last 3 minutes', traffic.peers_connected),
+        ('tunnelgrain_traffic_series', 'Peers with traffic history', len(traffic.series)),
+        ('tunnelgrain_traffic_buffer_bytes', 'Memory held by traffic ring buffers', traffic.allocated_bytes()),
+    ]
+    return daemon_metrics.expose(gauges), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/api/health', methods=['GET'])
 def health():
     """Health check endpoint"""
@@ -741,16 +1698,29 @@ def signal_handler(signum, frame):
     """Handle shutdown signals"""
     logger.info("🛑 Shutting down expiration daemon...")
     manager.running = False
+    try:
+        traffic.save()
+    except Exception as e:
+        logger.error(f"❌ Error saving traffic history: {e}")
     sys.exit(0)
 
 if __name__ == '__main__':
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
     
+    # Clear the backlog from any downtime before serving or starting the regular loop
+    try:
+        manager.catch_up_expired()
+    except Exception as e:
+        logger.error(f"❌ Startup catch-up failed, the regular pass will handle overdue timers: {e}")
+    
     # Start expiration checker thread
     expiration_thread = threading.Thread(target=manager.expiration_loop, daemon=True)
     expiration_thread.start()
     
+    traffic_thread = threading.Thread(target=traffic.collection_loop, daemon=True)
+    traffic_thread.start()
+    
     logger.info("🚀 Tunnelgrain Expiration Daemon v5.1-FINAL starting")
     app.run(host='0.0.0.0', port=8081, debug=False)
 FIXED_DAEMON_EOF
@@ -773,6 +1743,7 @@ Type=simple
 User=root
 WorkingDirectory=/opt/tunnelgrain
 Environment=PATH=/opt/tunnelgrain/api/venv/bin
+EnvironmentFile=-/opt/tunnelgrain/daemon.env
 ExecStart=/opt/tunnelgrain/api/venv/bin/python /opt/tunnelgrain/expiration_daemon.py
 Restart=always
 RestartSec=10
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+Scale simulator for the Tunnelgrain expiration daemon.
+
+Extracts the daemon embedded in complete_vps_setup.sh, points it at a
+scratch directory with a synthetic wg0.conf / peer_mapping.txt holding
+thousands of peers and a fake `wg` binary, then measures:
+
+  - startup (load + peer mapping build)
+  - add_timer latency and persistence (save_data) cost
+  - an expiry storm: pass duration and per-peer expiry lag
+  - /api/status and /api/list-timers latency while the storm runs
+  - manager lock hold times
+  - traffic sampling (`wg show wg0 dump`) and its ring buffer memory
+  - memory (tracemalloc peak and max RSS)
+
+    python scripts/server/simulate_expiration_daemon.py --peers 5000 --timers 2000 --storm 1000
+"""
+
+import argparse
+import base64
+import importlib.util
+import logging
+import os
+import resource
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+SETUP_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'complete_vps_setup.sh')
+TIERS = ('test', 'monthly', 'quarterly', 'biannual', 'annual', 'lifetime')
+
+FAKE_WG = r'''#!/usr/bin/env python3
+"""Fake `wg`: keeps live peers in a state file, sleeps FAKE_WG_LATENCY_MS per call"""
+import base64, hashlib, os, sys, time, random
+state = os.environ['FAKE_WG_STATE']
+time.sleep(float(os.environ.get('FAKE_WG_LATENCY_MS', '0')) / 1000)
+args = sys.argv[1:]
+with open(state + '.calls', 'a') as f:
+    f.write((args[0] if args else '') + '\n')
+with open(state) as f:
+    peers = [line.split() for line in f if line.strip()]
+if args[:1] == ['genkey']:
+    print(base64.b64encode(os.urandom(32)).decode())
+elif args[:1] == ['pubkey']:
+    print(base64.b64encode(hashlib.sha256(sys.stdin.read().strip().encode()).digest()).decode())
+elif args[:1] == ['set']:
+    remove, add = set(), {}
+    i = 2
+    while i < len(args):
+        if args[i] == 'peer' and i + 2 < len(args) and args[i + 2] == 'remove':
+            remove.add(args[i + 1]); i += 3
+        elif args[i] == 'peer' and i + 3 < len(args) and args[i + 2] == 'allowed-ips':
+            add[args[i + 1]] = args[i + 3].split('/')[0]; i += 4
+        else:
+            i += 1
+    peers = [p for p in peers if p[0] not in remove and p[0] not in add] + [[k, ip] for k, ip in add.items()]
+    with open(state + '.tmp', 'w') as f:
+        f.writelines(' '.join(p) + '\n' for p in peers)
+    os.replace(state + '.tmp', state)
+elif args[:1] == ['show']:
+    mode = args[2] if len(args) > 2 else ''
+    now = int(time.time())
+    if mode == 'peers':
+        print('\n'.join(p[0] for p in peers))
+    elif mode == 'dump':
+        print('PRIVATEKEY\tPUBLICKEY\t51820\toff')
+        for key, ip in peers:
+            rx = random.randint(0, 10 ** 9)
+            print(f"{key}\t(none)\t203.0.113.1:51820\t{ip}/32\t{now - random.randint(0, 300)}\t{rx}\t{rx // 4}\toff")
+    else:
+        print('interface: wg0')
+        for key, ip in peers:
+            print(f'peer: {key}\n  allowed ips: {ip}/32')
+'''
+
+
+def _count_wg_calls(base):
+    """Number of fake `wg` invocations so far"""
+    try:
+        with open(os.path.join(base, 'wg_state.calls')) as f:
+            return sum(1 for _ in f)
+    except FileNotFoundError:
+        return 0
+
+
+class InstrumentedRLock:
+    """RLock that records how long the outermost acquisition was held"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self.holds = []
+        self.waits = []
+
+    def acquire(self, *args, **kwargs):
+        start = time.perf_counter()
+        acquired = self._lock.acquire(*args, **kwargs)
+        if acquired:
+            depth = getattr(self._local, 'depth', 0)
+            if depth == 0:
+                self.waits.append(time.perf_counter() - start)
+                self._local.since = time.perf_counter()
+            self._local.depth = depth + 1
+        return acquired
+
+    def release(self):
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            self.holds.append(time.perf_counter() - self._local.since)
+        self._lock.release()
+
+    __enter__ = acquire
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def fake_key(i):
+    return base64.b64encode(i.to_bytes(4, 'big') + os.urandom(28)).decode()
+
+
+def build_environment(base, peers, wg_latency_ms):
+    """Synthetic wg0.conf, peer_mapping.txt, fake wg and its state file"""
+    os.makedirs(os.path.join(base, 'logs'), exist_ok=True)
+    mapping_lines, conf_lines, state_lines, orders = [], [], [], []
+
+    conf_lines.append("[Interface]\nAddress = 10.0.0.1/16\nListenPort = 51820\nPrivateKey = SIMULATED\n")
+    for i in range(peers):
+        tier = 'test' if i % 3 == 0 else TIERS[1 + i % (len(TIERS) - 1)]
+        order_number = f"{'72' if tier == 'test' else '42'}{0x100000 + i:06X}"
+        key = fake_key(i)
+        ip = f"10.{(i // 250) % 250}.{i % 250 + 2}.{i % 7 + 1}"
+        mapping_lines.append(f"{order_number}:{key}:{ip}:{tier}\n")
+        conf_lines.append(f"\n[Peer]\n# {order_number} ({tier})\nPublicKey = {key}\nAllowedIPs = {ip}/32\n")
+        state_lines.append(f"{key} {ip}\n")
+        orders.append((order_number, tier))
+
+    with open(os.path.join(base, 'peer_mapping.txt'), 'w') as f:
+        f.writelines(mapping_lines)
+    with open(os.path.join(base, 'wg0.conf'), 'w') as f:
+        f.writelines(conf_lines)
+    with open(os.path.join(base, 'wg_state'), 'w') as f:
+        f.writelines(state_lines)
+
+    wg_bin = os.path.join(base, 'wg')
+    with open(wg_bin, 'w') as f:
+        f.write(FAKE_WG)
+    os.chmod(wg_bin, os.stat(wg_bin).st_mode | stat.S_IEXEC)
+
+    os.environ.update({
+        'TUNNELGRAIN_BASE': base,
+        'TUNNELGRAIN_WG_CONF': os.path.join(base, 'wg0.conf'),
+        'TUNNELGRAIN_WG_BIN': wg_bin,
+        'FAKE_WG_STATE': os.path.join(base, 'wg_state'),
+        'FAKE_WG_LATENCY_MS': str(wg_latency_ms),
+    })
+    return orders
+
+
+def load_daemon(base):
+    """Write the embedded daemon source to the scratch dir and import it"""
+    with open(SETUP_SCRIPT) as f:
+        script = f.read()
+    marker = "<< 'FIXED_DAEMON_EOF'\n"
+    start = script.index(marker) + len(marker)
+    end = script.index("\nFIXED_DAEMON_EOF\n", start)
+
+    path = os.path.join(base, 'expiration_daemon.py')
+    with open(path, 'w') as f:
+        f.write(script[start:end] + '\n')
+
+    spec = importlib.util.spec_from_file_location('expiration_daemon', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def summarize(name, values, unit='ms', scale=1000):
+    if not values:
+        print(f"  {name:<34} (no samples)")
+        return
+    values = sorted(values)
+    pick = lambda pct: values[min(len(values) - 1, int(pct / 100 * len(values)))] * scale
+    print(f"  {name:<34} n={len(values):<6} p50={pick(50):9.2f}{unit} p95={pick(95):9.2f}{unit} "
+          f"p99={pick(99):9.2f}{unit} max={values[-1] * scale:9.2f}{unit}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate the expiration daemon at scale')
+    parser.add_argument('--peers', type=int, default=2000)
+    parser.add_argument('--timers', type=int, default=1000, help='timers added through add_timer')
+    parser.add_argument('--storm', type=int, default=500, help='timers forced overdue at once')
+    parser.add_argument('--catch-up', type=int, default=300,
+                        help='timers overdue at startup, expired by the catch-up pass')
+    parser.add_argument('--pollers', type=int, default=4, help='threads polling the API during the storm')
+    parser.add_argument('--wg-latency-ms', type=float, default=2)
+    parser.add_argument('--keep', action='store_true', help='keep the scratch directory')
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix='tunnelgrain-daemon-sim-')
+    orders = build_environment(base, args.peers, args.wg_latency_ms)
+    print(f"Scratch dir: {base}")
+    print(f"Peers: {args.peers}  timers: {args.timers}  storm: {args.storm}  wg latency: {args.wg_latency_ms}ms")
+
+    tracemalloc.start()
+
+    start = time.perf_counter()
+    daemon = load_daemon(base)
+    startup = time.perf_counter() - start
+    manager = daemon.manager
+    logging.getLogger().setLevel(logging.WARNING)
+
+    lock = InstrumentedRLock()
+    manager.lock = lock
+
+    print("\nStartup")
+    print(f"  load + peer mapping build          {startup * 1000:9.2f}ms ({len(manager.peer_mapping)} mappings)")
+
+    # add_timer latency (each call persists the full state)
+    add_latencies = []
+    for order_number, tier in orders[:args.timers]:
+        t = time.perf_counter()
+        manager.add_timer(order_number, tier, 30 * 24 * 60)
+        add_latencies.append(time.perf_counter() - t)
+
+    save_latencies = []
+    for _ in range(20):
+        t = time.perf_counter()
+        manager.save_data()
+        save_latencies.append(time.perf_counter() - t)
+
+    print("\nTimers")
+    summarize('add_timer', add_latencies)
+    summarize('save_data', save_latencies)
+    print(f"  timer file size                    {os.path.getsize(daemon.TIMER_FILE) / 1024:9.1f}KB")
+
+    # Expiry storm with concurrent status polling
+    storm = [o for o, _ in orders[:min(args.storm, args.timers)]]
+    overdue_at = {}
+    with manager.lock:
+        for i, order_number in enumerate(storm):
+            expires_at = datetime.now() - timedelta(seconds=1 + i % 60)
+            manager.active_timers[order_number]['expires_at'] = expires_at.isoformat()
+            manager.active_timers[order_number]['expires_ts'] = expires_at.timestamp()
+            overdue_at[order_number] = expires_at
+
+    expiry_lags = []
+    original_remove = manager.remove_peer_from_wireguard
+
+    def timed_remove(order_number, public_key):
+        result = original_remove(order_number, public_key)
+        if order_number in overdue_at:
+            expiry_lags.append((datetime.now() - overdue_at[order_number]).total_seconds())
+        return result
+
+    manager.remove_peer_from_wireguard = timed_remove
+
+    poll_latencies = {'/api/status': [], '/api/list-timers': []}
+    stop = threading.Event()
+
+    def poller(path):
+        client = daemon.app.test_client()
+        while not stop.is_set():
+            t = time.perf_counter()
+            client.get(path)
+            poll_latencies[path].append(time.perf_counter() - t)
+
+    paths = list(poll_latencies)
+    threads = [threading.Thread(target=poller, args=(paths[i % len(paths)],), daemon=True)
+               for i in range(args.pollers)]
+    lock.holds.clear()
+    lock.waits.clear()
+    for thread in threads:
+        thread.start()
+
+    t = time.perf_counter()
+    expired = manager.check_expiring_timers()
+    storm_duration = time.perf_counter() - t
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print("\nExpiry storm")
+    print(f"  expired                            {expired} of {len(storm)} in {storm_duration:.2f}s "
+          f"({expired / storm_duration if storm_duration else 0:.1f} peers/s)")
+    summarize('expiry lag', expiry_lags, unit='s', scale=1)
+    summarize('lock hold', lock.holds)
+    summarize('lock wait', lock.waits)
+    for path, values in poll_latencies.items():
+        summarize(f"GET {path}", values)
+
+    # Downtime backlog: timers that went overdue while the daemon was stopped
+    backlog = [o for o, _ in orders[len(storm):min(len(storm) + args.catch_up, args.timers)]]
+    with manager.lock:
+        for order_number in backlog:
+            expires_at = datetime.now() - timedelta(hours=1)
+            manager.active_timers[order_number]['expires_at'] = expires_at.isoformat()
+            manager.active_timers[order_number]['expires_ts'] = expires_at.timestamp()
+    wg_calls_before = _count_wg_calls(base)
+
+    t = time.perf_counter()
+    caught_up = manager.catch_up_expired()
+    catch_up_duration = time.perf_counter() - t
+
+    print("\nStartup catch-up")
+    print(f"  expired                            {caught_up} of {len(backlog)} in {catch_up_duration:.2f}s "
+          f"({_count_wg_calls(base) - wg_calls_before} wg calls)")
+
+    traffic = daemon.traffic
+    sample_latencies = []
+    for _ in range(3):
+        t = time.perf_counter()
+        traffic.sample()
+        sample_latencies.append(time.perf_counter() - t)
+
+    print("\nTraffic")
+    summarize('sample', sample_latencies)
+    print(f"  ring buffers                       {traffic.allocated_bytes() / 1024 / 1024:9.1f}MB "
+          f"({len(traffic.series)} series, {traffic.peers_seen} peers)")
+
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print("\nMemory")
+    print(f"  python heap (current/peak)         {current / 1024 / 1024:9.1f}MB / {peak / 1024 / 1024:.1f}MB")
+    print(f"  max RSS                            {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:9.1f}MB")
+
+    if not args.keep:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,37 +5,27 @@ echo "Date: $(date)"
 echo "Syncing from: 213.170.133.116"
 echo ""
 
+VPS_ENDPOINT="${VPS_1_ENDPOINT:-http://213.170.133.116:8081}"
+export VPS_1_ENDPOINT="$VPS_ENDPOINT"
+
 # VPS connection test
-echo "🔗 Testing VPS connection..."
-if ! ssh -o ConnectTimeout=10 root@213.170.133.116 "echo 'Connection successful'" 2>/dev/null; then
-    echo "❌ Cannot connect to VPS. Please check:"
-    echo "  - SSH connection"
+echo "🔗 Testing VPS daemon API..."
+if ! curl -sf --max-time 10 "$VPS_ENDPOINT/api/health" > /dev/null; then
+    echo "❌ Cannot reach the VPS daemon at $VPS_ENDPOINT. Please check:"
     echo "  - VPS is running"
-    echo "  - SSH key authentication"
+    echo "  - tunnelgrain-expiration service is active"
+    echo "  - VPS_API_TOKEN matches TUNNELGRAIN_API_TOKEN on the VPS (if set)"
     exit 1
 fi
-echo "✅ VPS connection successful"
-echo ""
-
-# Create directories
-echo "📁 Creating local directories..."
-mkdir -p data/vps_1/ip_213.170.133.116/{test,monthly,quarterly,biannual,annual,lifetime}
-mkdir -p static/qr_codes/vps_1/ip_213.170.133.116/{test,monthly,quarterly,biannual,annual,lifetime}
-
-# Remove old configs (they're invalid after VPS rebuild)
-echo "🗑️  Removing old configs..."
-rm -f data/vps_1/ip_213.170.133.116/*/*.conf
-rm -f static/qr_codes/vps_1/ip_213.170.133.116/*/*.png
-
-echo "✅ Old configs removed"
+echo "✅ VPS daemon reachable"
 echo ""
 
 # Verify VPS has configs
 echo "🔍 Verifying VPS has fresh configs..."
-vps_config_count=$(ssh root@213.170.133.116 "find /opt/tunnelgrain/configs -name '*.conf' | wc -l" 2>/dev/null || echo "0")
-vps_qr_count=$(ssh root@213.170.133.116 "find /opt/tunnelgrain/qr_codes -name '*.png' | wc -l" 2>/dev/null || echo "0")
+vps_config_count=$(curl -sf --max-time 60 "$VPS_ENDPOINT/api/config-manifest" | \
+    python3 -c "import json, sys; print(sum(p.endswith('.conf') for p in json.load(sys.stdin)['files']))" 2>/dev/null || echo "0")
 
-echo "VPS has $vps_config_count configs and $vps_qr_count QR codes"
+echo "VPS has $vps_config_count configs"
 
 if [ "$vps_config_count" -lt 100 ]; then
     echo "⚠️ Warning: VPS has fewer configs than expected"
@@ -51,29 +41,17 @@ if [ "$vps_config_count" -lt 100 ]; then
 fi
 echo ""
 
-echo "📥 Downloading fresh configs..."
+# Only files whose hash changed are downloaded; each one is swapped in atomically,
+# so the app keeps serving the old copy until the new one is complete.
+# --prune deletes local files the VPS no longer has (e.g. after a rebuild).
+echo "📥 Downloading changed configs..."
+if ! flask --app app sync-configs --prune; then
+    echo "❌ Config sync failed"
+    exit 1
+fi
 
-# Download configs for each tier with progress
 tiers=("test" "monthly" "quarterly" "biannual" "annual" "lifetime")
 
-for tier in "${tiers[@]}"; do
-    echo "  📋 Syncing $tier configs..."
-    
-    # Download configs
-    config_result=$(scp -q "root@213.170.133.116:/opt/tunnelgrain/configs/$tier/*" "./data/vps_1/ip_213.170.133.116/$tier/" 2>&1)
-    config_count=$(ls data/vps_1/ip_213.170.133.116/$tier/*.conf 2>/dev/null | wc -l)
-    
-    # Download QR codes
-    qr_result=$(scp -q "root@213.170.133.116:/opt/tunnelgrain/qr_codes/$tier/*" "./static/qr_codes/vps_1/ip_213.170.133.116/$tier/" 2>&1)
-    qr_count=$(ls static/qr_codes/vps_1/ip_213.170.133.116/$tier/*.png 2>/dev/null | wc -l)
-    
-    if [ "$config_count" -gt 0 ] && [ "$qr_count" -gt 0 ]; then
-        echo "    ✅ $tier: $config_count configs, $qr_count QR codes"
-    else
-        echo "    ⚠️ $tier: $config_count configs, $qr_count QR codes (some files may be missing)"
-    fi
-done
-
 echo ""
 echo "📊 Final sync summary:"
 echo "======================"
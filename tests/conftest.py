@@ -0,0 +1,70 @@
+import os
+import sys
+
+import pytest
+
+# Modules live at the top of the repo, next to app.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def json_db(tmp_path, monkeypatch):
+    """TunnelgrainDB in JSON mode, on a fresh tunnelgrain_orders.json in a temporary directory"""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv('DATABASE_URL', raising=False)
+    monkeypatch.setenv('VPS_1_ENDPOINT', 'http://127.0.0.1:9')
+    from database_manager import TunnelgrainDB
+    return TunnelgrainDB()
+
+
+@pytest.fixture
+def client(json_db, monkeypatch):
+    """Flask test client for app.py on the json_db database, admin key 'k'"""
+    import app
+    monkeypatch.setattr(app, 'db', json_db)
+    # The recycler thread keeps app's own database and would outlive the temporary directory
+    monkeypatch.setattr(app, 'CONFIG_RECYCLER_ENABLED', False)
+    monkeypatch.setattr(app, 'ADMIN_KEY', 'k')
+    return app.app.test_client()
+
+
+@pytest.fixture
+def fake_daemon():
+    """scripts/local/fake_vps_daemon.py served on a free local port: (endpoint, flask app)"""
+    import importlib.util
+    import threading
+    from werkzeug.serving import make_server
+
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'scripts', 'local', 'fake_vps_daemon.py')
+    spec = importlib.util.spec_from_file_location('fake_vps_daemon', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    daemon = module.create_fake_daemon()
+    server = make_server('127.0.0.1', 0, daemon, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", daemon
+    server.shutdown()
+    thread.join()
+
+
+@pytest.fixture
+def vps_daemon(tmp_path, monkeypatch):
+    """The daemon embedded in complete_vps_setup.sh, loaded by the scale simulator against
+    a scratch directory with 12 synthetic peers and a fake `wg`: (module, [(order_number, tier)])"""
+    import importlib.util
+
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                        'scripts', 'server', 'simulate_expiration_daemon.py')
+    spec = importlib.util.spec_from_file_location('simulate_expiration_daemon', path)
+    sim = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sim)
+
+    # build_environment sets these in os.environ; registering them here restores them afterwards
+    for name in ('TUNNELGRAIN_BASE', 'TUNNELGRAIN_WG_CONF', 'TUNNELGRAIN_WG_BIN',
+                 'FAKE_WG_STATE', 'FAKE_WG_LATENCY_MS'):
+        monkeypatch.delenv(name, raising=False)
+    orders = sim.build_environment(str(tmp_path), peers=12, wg_latency_ms=0)
+    return sim.load_daemon(str(tmp_path)), orders
@@ -0,0 +1,54 @@
+import json
+from datetime import datetime, timedelta
+
+
+def set_expires(db, order_number, expires_at, status=None):
+    with open(db.json_file) as f:
+        data = json.load(f)
+    for order in data['orders'].values():
+        if order['order_number'] == order_number:
+            order['expires_at'] = expires_at.isoformat()
+            if status:
+                order['status'] = status
+    db.write_json(data)
+
+
+def stored(db):
+    with open(db.json_file) as f:
+        return json.load(f)
+
+
+def test_only_old_expired_orders_are_archived(json_db):
+    old, recent, active = (json_db.create_order('monthly')[1] for _ in range(3))
+    set_expires(json_db, old, datetime.now() - timedelta(days=40), status='expired')
+    set_expires(json_db, recent, datetime.now() - timedelta(days=2), status='expired')
+
+    assert json_db.archive_expired_orders(retention_days=30) == 1
+
+    data = stored(json_db)
+    assert {o['order_number'] for o in data['archive'].values()} == {old}
+    assert {o['order_number'] for o in data['orders'].values()} == {recent, active}
+    assert all('archived_at' in o for o in data['archive'].values())
+
+
+def test_archive_runs_in_batches(json_db):
+    numbers = [json_db.create_order('monthly')[1] for _ in range(5)]
+    for number in numbers:
+        set_expires(json_db, number, datetime.now() - timedelta(days=40), status='expired')
+
+    assert json_db.archive_expired_orders(retention_days=30, batch_size=2, max_batches=1) == 2
+    assert json_db.archive_expired_orders(retention_days=30, batch_size=2) == 3
+    assert not stored(json_db)['orders']
+
+
+def test_archived_orders_are_still_found(json_db):
+    number = json_db.create_order('monthly')[1]
+    assert json_db.get_order_by_number(number)['status'] == 'active'
+
+    set_expires(json_db, number, datetime.now() - timedelta(days=40), status='expired')
+    json_db.archive_expired_orders(retention_days=30)
+
+    # The cached active copy is dropped when the order moves
+    order = json_db.get_order_by_number(number)
+    assert order['status'] == 'expired'
+    assert 'archived_at' in order
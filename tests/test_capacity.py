@@ -0,0 +1,116 @@
+import random
+
+import pytest
+
+from capacity import rebalance_quotas, split_quotas, tier_headroom
+
+PAID = ('monthly', 'quarterly', 'biannual', 'annual', 'lifetime')
+
+
+def test_split_follows_weights_and_fills_the_budget():
+    assert split_quotas(48, {'monthly': 30, 'quarterly': 20, 'lifetime': 5}) == \
+        {'monthly': 27, 'quarterly': 17, 'lifetime': 4}
+    assert split_quotas(10, {'a': 0, 'b': 0}) == {'a': 5, 'b': 5}
+
+
+def test_split_gives_every_tier_its_minimum():
+    quotas = split_quotas(10, {'big': 1000, 'small': 1}, minimum=2)
+    assert quotas['small'] == 2
+    assert sum(quotas.values()) >= 10
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_rebalance_invariants(seed):
+    rng = random.Random(seed)
+    pool_size = rng.randint(10, 200)
+    current = {tier: rng.randint(1, pool_size // 5 + 1) for tier in PAID}
+    demand = {tier: rng.choice([0, rng.randint(1, 100)]) for tier in PAID}
+    pinned = rng.sample(PAID, rng.randint(0, 2))
+
+    quotas = rebalance_quotas(pool_size, current, demand, pinned=pinned)
+
+    assert set(quotas) == set(PAID)
+    assert all(quotas[tier] == current[tier] for tier in pinned)
+    assert all(quotas[tier] >= 1 for tier in PAID)
+    unpinned = [tier for tier in PAID if tier not in pinned]
+    budget = max(int(pool_size * 0.6) - sum(current[tier] for tier in pinned), len(unpinned))
+    assert sum(quotas[tier] for tier in unpinned) <= budget
+
+
+def test_rebalance_moves_toward_demand():
+    current = {'monthly': 20, 'lifetime': 20}
+    quotas = rebalance_quotas(100, current, {'monthly': 0, 'lifetime': 90}, smoothing=0.5)
+    assert quotas['lifetime'] > 20 > quotas['monthly']
+
+    # Repeated rounds settle within one config of the demand split
+    target = split_quotas(60, {'monthly': 1, 'lifetime': 91})
+    for _ in range(20):
+        quotas = rebalance_quotas(100, quotas, {'monthly': 0, 'lifetime': 90}, smoothing=0.5)
+    assert all(abs(quotas[tier] - target[tier]) <= 1 for tier in target)
+
+
+def test_headroom_protects_unfilled_quotas():
+    # 10 free configs; annual has 4 unfilled quota slots the others must leave alone
+    headroom = tier_headroom(10, {'monthly': 8, 'annual': 1}, {'monthly': 5, 'annual': 5})
+    assert headroom == {'monthly': 6, 'annual': 10}
+
+
+@pytest.mark.parametrize('seed', range(50))
+def test_headroom_invariants(seed):
+    rng = random.Random(seed)
+    quotas = {tier: rng.randint(0, 20) for tier in PAID}
+    active = {tier: rng.randint(0, 25) for tier in PAID}
+    free = rng.randint(0, 60)
+
+    headroom = tier_headroom(free, active, quotas)
+
+    for tier in PAID:
+        unmet = max(0, quotas[tier] - active[tier])
+        assert 0 <= headroom[tier] <= free
+        # A tier can always fill its own quota while configs are free
+        assert headroom[tier] >= min(unmet, free)
+        # Borrowing past the quota never eats into the other tiers' unfilled quotas
+        others_unmet = sum(max(0, quotas[t] - active[t]) for t in PAID if t != tier)
+        if headroom[tier] > unmet:
+            assert headroom[tier] <= free - others_unmet
+
+
+@pytest.fixture
+def availability(client, json_db, monkeypatch):
+    """Counts availability lookups behind the public pages; set result to change what they return"""
+    import app
+    monkeypatch.setattr(app, '_availability_cache', {'fetched_at': None, 'availability': {}})
+    now = [1000.0]
+    monkeypatch.setattr(app.time, 'monotonic', lambda: now[0])
+    state = {'calls': 0, 'result': json_db.get_slot_availability(), 'now': now}
+
+    def lookup():
+        state['calls'] += 1
+        return state['result']
+
+    monkeypatch.setattr(json_db, 'get_slot_availability', lookup)
+    return state
+
+
+def test_public_pages_share_a_cached_lookup(client, availability):
+    for path in ('/', '/pricing', '/'):
+        assert client.get(path).status_code == 200
+    assert availability['calls'] == 1
+
+    availability['now'][0] += 10
+    client.get('/pricing')
+    assert availability['calls'] == 2
+
+
+def test_failed_lookup_keeps_the_last_known_capacity(client, availability):
+    import app
+    known = app.service_tiers_with_capacity()
+
+    availability['result'] = {}  # what get_slot_availability returns when the database is down
+    availability['now'][0] += 10
+
+    assert app.service_tiers_with_capacity() == known
+    assert known['monthly']['capacity'] > 0
+    # Retried after the TTL, not on every page view
+    app.service_tiers_with_capacity()
+    assert availability['calls'] == 2
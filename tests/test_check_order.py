@@ -0,0 +1,34 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+
+def set_expires_at(db, order_number, expires_at):
+    with open(db.json_file) as f:
+        data = json.load(f)
+    for order in data['orders'].values():
+        if order['order_number'] == order_number:
+            order['expires_at'] = expires_at
+    db.write_json(data)
+    db.order_cache.invalidate(order_number)
+
+
+@pytest.mark.parametrize('expires_at, status', [
+    # Legacy rows: naive local time
+    (lambda: (datetime.now() + timedelta(hours=2)).isoformat(), 'active'),
+    (lambda: (datetime.now() - timedelta(minutes=1)).isoformat(), 'expired'),
+    # Rows carrying an offset
+    (lambda: (datetime.now(timezone.utc) + timedelta(hours=2)).isoformat().replace('+00:00', 'Z'), 'active'),
+    (lambda: (datetime.now(timezone(timedelta(hours=3))) - timedelta(minutes=1)).isoformat(), 'expired'),
+], ids=['naive-active', 'naive-expired', 'utc-active', 'offset-expired'])
+def test_check_order_with_naive_and_aware_expiry(client, json_db, expires_at, status):
+    _, order_number = json_db.create_order('monthly')
+    set_expires_at(json_db, order_number, expires_at())
+
+    response = client.post('/check-order', data={'order_number': order_number})
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == status
+    if status == 'active':
+        assert response.get_json()['time_remaining'] in ('1 hours', '2 hours')
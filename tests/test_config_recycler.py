@@ -0,0 +1,79 @@
+import json
+from datetime import datetime, timedelta
+
+from config_recycler import ConfigRecycler
+
+
+def expire(db, order_number):
+    with open(db.json_file) as f:
+        data = json.load(f)
+    for order in data['orders'].values():
+        if order['order_number'] == order_number:
+            order['expires_at'] = (datetime.now() - timedelta(minutes=1)).isoformat()
+    db.write_json(data)
+    db.cleanup_expired_orders()
+
+
+def pool_entry(db, config_id):
+    with open(db.json_file) as f:
+        return json.load(f)['config_pool'][config_id]
+
+
+def test_expired_configs_are_withheld_until_regenerated(json_db):
+    json_db.CONFIG_RECYCLING = True
+    _, order_number = json_db.create_order('monthly')
+    expire(json_db, order_number)
+
+    assert json_db.get_config_pool_states() == {order_number: 'dirty'}
+    assert order_number in json_db.get_used_configs('monthly')
+
+
+def test_claims_are_exclusive_until_stale(json_db):
+    json_db.CONFIG_RECYCLING = True
+    _, order_number = json_db.create_order('monthly')
+    expire(json_db, order_number)
+
+    assert json_db.claim_dirty_configs() == [(order_number, 'monthly')]
+    assert json_db.claim_dirty_configs() == []
+    # A claim older than stale_after_seconds belonged to a worker that died mid-batch
+    assert json_db.claim_dirty_configs(stale_after_seconds=-1) == [(order_number, 'monthly')]
+
+
+def test_failed_regeneration_returns_configs_to_dirty(json_db):
+    json_db.CONFIG_RECYCLING = True
+    _, order_number = json_db.create_order('monthly')
+    expire(json_db, order_number)
+
+    ConfigRecycler(json_db, 'http://127.0.0.1:9').run_once()
+
+    entry = pool_entry(json_db, order_number)
+    assert entry['state'] == 'dirty' and entry['last_error']
+    assert json_db.claim_dirty_configs() == [(order_number, 'monthly')]
+
+
+def test_regenerated_configs_are_sold_with_fresh_keys(json_db, fake_daemon):
+    endpoint, _ = fake_daemon
+    json_db.CONFIG_RECYCLING = True
+    _, order_number = json_db.create_order('monthly')
+    expire(json_db, order_number)
+
+    assert ConfigRecycler(json_db, endpoint).run_once() == 1
+
+    assert json_db.get_config_pool_states() == {order_number: 'clean'}
+    fresh = json_db.get_fresh_config(order_number)
+    assert 'Fake regenerated config' in fresh['config_text'] and fresh['generation'] == 1
+    assert order_number not in json_db.get_used_configs('monthly')
+
+
+def test_daemon_without_regeneration_reuses_configs(json_db, fake_daemon):
+    endpoint, _ = fake_daemon
+    json_db.CONFIG_RECYCLING = True
+    _, order_number = json_db.create_order('monthly')
+    expire(json_db, order_number)
+
+    # Every route under this prefix answers 404, like a daemon predating regenerate-peers
+    ConfigRecycler(json_db, f"{endpoint}/old-daemon").run_once()
+
+    assert pool_entry(json_db, order_number)['state'] == 'clean'
+    assert json_db.get_fresh_config(order_number) is None  # the synced files are served again
+    assert order_number not in json_db.get_used_configs('monthly')
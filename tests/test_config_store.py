@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+from config_store import ConfigStore, build_store, store_path
+from config_sync import local_roots
+
+
+def write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    """Config and QR trees of one node, laid out as config sync writes them"""
+    monkeypatch.chdir(tmp_path)
+    roots = local_roots('vps_1', '10.0.0.1')
+    write(f"{roots['configs']}/test/72100001.conf", b'[Interface]\nPrivateKey = t1\n')
+    write(f"{roots['qr_codes']}/test/72100001.png", b'\x89PNG test')
+    write(f"{roots['configs']}/monthly/42100033.conf", b'[Interface]\nPrivateKey = m1\n')
+    return roots
+
+
+def test_round_trip(tree):
+    report = build_store('vps_1', '10.0.0.1')
+    assert (report['configs'], report['qr_codes']) == (2, 1)
+    assert report['path'] == store_path('vps_1', '10.0.0.1')
+
+    store = ConfigStore(report['path'], check_interval=0)
+    assert store.available()
+    assert bytes(store.get('72100001', 'conf')) == b'[Interface]\nPrivateKey = t1\n'
+    assert bytes(store.get('72100001', 'qr', tier='test')) == b'\x89PNG test'
+    assert bytes(store.get('42100033', 'conf', tier='monthly')) == b'[Interface]\nPrivateKey = m1\n'
+    assert store.stats()['configs'] == 2
+
+
+def test_missing_entries(tree):
+    store = ConfigStore(build_store('vps_1', '10.0.0.1')['path'], check_interval=0)
+
+    assert store.get('42100033', 'qr') is None  # config without a QR code
+    assert store.get('42100033', 'conf', tier='test') is None  # wrong tier
+    assert store.get('4210FFFF', 'conf') is None
+
+
+def test_rebuild_is_picked_up(tree):
+    path = build_store('vps_1', '10.0.0.1')['path']
+    store = ConfigStore(path, check_interval=0)
+    old = store.get('72100001', 'conf')
+
+    write(f"{tree['configs']}/test/72100001.conf", b'[Interface]\nPrivateKey = fresh\n')
+    build_store('vps_1', '10.0.0.1')
+
+    assert bytes(store.get('72100001', 'conf')) == b'[Interface]\nPrivateKey = fresh\n'
+    # Views handed out before the rebuild still read the old mapping
+    assert bytes(old) == b'[Interface]\nPrivateKey = t1\n'
+
+
+def test_absent_or_corrupt_store(tmp_path):
+    store = ConfigStore(str(tmp_path / 'missing.pack'), check_interval=0)
+    assert not store.available()
+    assert store.get('72100001') is None
+
+    write(str(tmp_path / 'bad.pack'), b'not a store at all')
+    assert not ConfigStore(str(tmp_path / 'bad.pack'), check_interval=0).available()
+
+
+def test_config_in_two_tiers_is_rejected(tree):
+    write(f"{tree['configs']}/annual/72100001.conf", b'duplicate')
+    with pytest.raises(ValueError):
+        build_store('vps_1', '10.0.0.1')
@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+from config_sync import local_manifest, sync_configs
+
+CONF = 'configs/monthly/42100001.conf'
+QR = 'qr_codes/monthly/42100001.png'
+LOCAL_CONF = 'data/vps_1/ip_213.170.133.116/monthly/42100001.conf'
+
+
+@pytest.fixture
+def daemon(fake_daemon, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    endpoint, app = fake_daemon
+    app.fake_files.update({CONF: b'[Interface]\nPrivateKey = a\n', QR: b'\x89PNG a'})
+    return endpoint, app.fake_files
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_first_sync_fetches_everything_then_nothing(daemon):
+    endpoint, files = daemon
+
+    report = sync_configs(endpoint)
+    assert report['updated'] == [CONF, QR] and report['errors'] == []
+    assert read(LOCAL_CONF) == files[CONF]
+    assert set(local_manifest()) == {CONF, QR}
+
+    again = sync_configs(endpoint)
+    assert again['changed'] == [] and again['unchanged'] == 2
+
+
+def test_only_changed_files_are_downloaded(daemon):
+    endpoint, files = daemon
+    sync_configs(endpoint)
+    files[CONF] = b'[Interface]\nPrivateKey = b\n'
+
+    report = sync_configs(endpoint)
+
+    assert report['changed'] == report['updated'] == [CONF]
+    assert read(LOCAL_CONF) == files[CONF]
+
+
+def test_dry_run_writes_nothing(daemon):
+    endpoint, _ = daemon
+
+    report = sync_configs(endpoint, dry_run=True)
+
+    assert report['changed'] == [CONF, QR] and report['updated'] == []
+    assert not os.path.exists(LOCAL_CONF)
+
+
+def test_files_gone_from_the_vps_are_removed_only_with_prune(daemon):
+    endpoint, files = daemon
+    sync_configs(endpoint)
+    del files[QR]
+
+    assert sync_configs(endpoint)['removed'] == [QR]
+    assert QR in local_manifest()
+
+    assert sync_configs(endpoint, prune=True)['pruned'] == [QR]
+    assert set(local_manifest()) == {CONF}
+
+
+def test_unexpected_manifest_paths_are_ignored(daemon):
+    endpoint, files = daemon
+    files['configs/../../app.py'] = b'print("nope")'
+
+    report = sync_configs(endpoint)
+
+    assert report['remote_files'] == 2
+    assert not os.path.exists('app.py')
@@ -0,0 +1,71 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+
+def overdue(manager, order_number, hours=1):
+    expires_at = datetime.now() - timedelta(hours=hours)
+    with manager.lock:
+        manager.active_timers[order_number]['expires_at'] = expires_at.isoformat()
+        manager.active_timers[order_number]['expires_ts'] = expires_at.timestamp()
+
+
+def wg_calls(daemon):
+    try:
+        with open(os.path.join(daemon.CONFIG_BASE, 'wg_state.calls')) as f:
+            return [line.strip() for line in f]
+    except FileNotFoundError:
+        return []
+
+
+def live_keys(daemon):
+    with open(os.path.join(daemon.CONFIG_BASE, 'wg_state')) as f:
+        return {line.split()[0] for line in f if line.strip()}
+
+
+def test_catch_up_expires_every_overdue_timer_in_one_batch(vps_daemon):
+    daemon, orders = vps_daemon
+    manager = daemon.manager
+    manager.add_timers([{'order_number': n, 'tier': t, 'duration_minutes': 60} for n, t in orders])
+    manager.add_timer('42FFFFFF', 'monthly', 60)  # no peer behind it
+    late = [n for n, _ in orders[:4]]
+    for order_number in late + ['42FFFFFF']:
+        overdue(manager, order_number)
+    late_keys = {manager.get_public_key(n) for n in late}
+    calls_before = len(wg_calls(daemon))
+
+    assert manager.catch_up_expired() == 5
+
+    statuses = {n: t['status'] for n, t in manager.active_timers.items()}
+    assert all(statuses[n] == 'expired' for n in late + ['42FFFFFF'])
+    assert all(statuses[n] == 'active' for n, _ in orders[4:])
+    assert not late_keys & live_keys(daemon)
+    assert wg_calls(daemon)[calls_before:] == ['set']
+
+    with open(daemon.WG_CONF) as f:
+        conf = f.read()
+    assert not any(n in conf for n in late) and orders[4][0] in conf
+    with open(daemon.TIMER_FILE) as f:
+        saved = json.load(f)
+    assert all(saved[n]['status'] == 'expired' for n in late)
+
+
+def test_catch_up_without_overdue_timers_touches_nothing(vps_daemon):
+    daemon, orders = vps_daemon
+    daemon.manager.add_timers([{'order_number': n, 'tier': t, 'duration_minutes': 60} for n, t in orders])
+    calls_before = len(wg_calls(daemon))
+
+    assert daemon.manager.catch_up_expired() == 0
+    assert len(wg_calls(daemon)) == calls_before
+
+
+def test_regular_pass_has_nothing_left_after_catch_up(vps_daemon):
+    daemon, orders = vps_daemon
+    manager = daemon.manager
+    manager.add_timers([{'order_number': n, 'tier': t, 'duration_minutes': 60} for n, t in orders])
+    for order_number, _ in orders[:3]:
+        overdue(manager, order_number)
+
+    manager.catch_up_expired()
+
+    assert manager.check_expiring_timers() == 0
@@ -0,0 +1,88 @@
+from collections import deque
+
+
+def list_all(client, **params):
+    pages, cursor = [], ''
+    while True:
+        page = client.get('/api/list-timers', query_string=dict(params, cursor=cursor)).get_json()
+        pages.append(page)
+        if not page['next_cursor']:
+            return pages
+        cursor = page['next_cursor']
+
+
+def test_timer_listing_pages_in_order_number_order(vps_daemon):
+    daemon, orders = vps_daemon
+    daemon.manager.add_timers([{'order_number': n, 'tier': t, 'duration_minutes': 60} for n, t in orders])
+    client = daemon.app.test_client()
+
+    pages = list_all(client, limit=5)
+
+    assert [page['count'] for page in pages] == [5, 5, 2]
+    listed = [timer['order_number'] for page in pages for timer in page['timers']]
+    assert listed == sorted(n for n, _ in orders)
+    assert client.get('/api/list-timers').get_json()['count'] == len(orders)
+
+
+def test_timer_listing_filters(vps_daemon):
+    daemon, orders = vps_daemon
+    daemon.manager.add_timers([{'order_number': n, 'tier': t, 'duration_minutes': 60} for n, t in orders])
+    client = daemon.app.test_client()
+    expired = orders[0][0]
+    assert client.post(f'/api/force-expire/{expired}').status_code == 200
+
+    listed = client.get('/api/list-timers', query_string={'status': 'expired'}).get_json()['timers']
+    assert [timer['order_number'] for timer in listed] == [expired]
+
+    tests = client.get('/api/list-timers', query_string={'tier': 'test'}).get_json()['timers']
+    assert sorted(timer['order_number'] for timer in tests) == sorted(n for n, t in orders if t == 'test')
+
+
+def test_change_feed_reports_each_timer_once_in_its_latest_state(vps_daemon):
+    daemon, orders = vps_daemon
+    client = daemon.app.test_client()
+    daemon.manager.add_timers([{'order_number': n, 'tier': t, 'duration_minutes': 60} for n, t in orders[:3]])
+    since = client.get('/api/list-timers').get_json()['version']
+
+    daemon.manager.add_timer(orders[3][0], orders[3][1], 60)
+    client.post(f'/api/force-expire/{orders[0][0]}')
+    daemon.manager.add_timer(orders[3][0], orders[3][1], 120)  # replaced: still one entry
+
+    feed = client.get('/api/timer-changes', query_string={'since': since}).get_json()
+    assert not feed['reset'] and not feed['has_more']
+    assert [(c['order_number'], c['status']) for c in feed['changes']] == \
+        [(orders[0][0], 'expired'), (orders[3][0], 'active')]
+
+    # Caught up: nothing new after next_since
+    again = client.get('/api/timer-changes', query_string={'since': feed['next_since']}).get_json()
+    assert again['changes'] == [] and again['next_since'] == feed['next_since']
+
+
+def test_change_feed_pages_with_limit(vps_daemon):
+    daemon, orders = vps_daemon
+    client = daemon.app.test_client()
+    daemon.manager.add_timers([{'order_number': n, 'tier': t, 'duration_minutes': 60} for n, t in orders])
+
+    seen, since = [], 0
+    while True:
+        feed = client.get('/api/timer-changes', query_string={'since': since, 'limit': 5}).get_json()
+        seen += [c['order_number'] for c in feed['changes']]
+        since = feed['next_since']
+        if not feed['has_more']:
+            break
+
+    assert sorted(seen) == sorted(n for n, _ in orders) and len(seen) == len(orders)
+
+
+def test_change_feed_asks_for_a_relist_once_history_is_gone(vps_daemon):
+    daemon, orders = vps_daemon
+    client = daemon.app.test_client()
+    daemon.manager.changes = deque(maxlen=3)
+    since = daemon.manager.version
+
+    for order_number, tier in orders[:5]:
+        daemon.manager.add_timer(order_number, tier, 60)
+
+    feed = client.get('/api/timer-changes', query_string={'since': since}).get_json()
+    assert feed['reset'] and feed['changes'] == []
+    assert feed['version'] == daemon.manager.version
@@ -0,0 +1,113 @@
+import pytest
+
+T = 6_000_000  # a multiple of every tier width below
+TIERS = ((60, 5), (300, 4))
+
+
+@pytest.fixture
+def traffic(vps_daemon):
+    daemon, _ = vps_daemon
+    return daemon.TrafficCollector(daemon.manager, tiers=TIERS)
+
+
+def totals(traffic, order_number, start, end):
+    result = traffic.query(order_number, start, end, 60)
+    return [(p['t'], p['rx_bytes'], p['tx_bytes']) for p in result['points']]
+
+
+def test_parse_wg_dump_skips_the_interface_and_bad_lines(vps_daemon):
+    daemon, _ = vps_daemon
+    dump = ("PRIVATE\tPUBLIC\t51820\toff\n"
+            "key1\t(none)\t203.0.113.1:51820\t10.0.0.2/32\t1700000000\t100\t200\toff\n"
+            "key2\t(none)\t(none)\t10.0.0.3/32\t0\t0\t0\toff\n"
+            "broken\tline\n")
+
+    assert daemon.parse_wg_dump(dump) == [('key1', 1700000000, 100, 200), ('key2', 0, 0, 0)]
+
+
+def test_first_sample_is_a_baseline_then_deltas_count_in_kib(traffic):
+    by_key = {'key1': '42100001'}
+    traffic.record([('key1', T - 10, 10_000, 0)], by_key, T)
+    traffic.record([('key1', T + 50, 10_000 + 2048 + 512, 1024)], by_key, T + 50)
+    traffic.record([('key1', T + 70, 10_000 + 3072, 1024)], by_key, T + 70)
+
+    # The 512 bytes below one KiB are carried into the next sample
+    assert totals(traffic, '42100001', T, T + 120) == [(T, 2048, 1024), (T + 60, 1024, 0)]
+
+
+def test_counter_reset_counts_from_zero(traffic):
+    by_key = {'key1': '42100001'}
+    traffic.record([('key1', T, 50_000, 0)], by_key, T)
+    traffic.record([('key1', T, 4096, 0)], by_key, T + 1)  # wg re-added the peer
+
+    assert totals(traffic, '42100001', T, T + 60) == [(T, 4096, 0)]
+
+
+def test_unused_and_unmapped_peers_get_no_series(traffic):
+    traffic.record([('pool', 0, 0, 0), ('stranger', T, 10, 10)], {'pool': '42100001'}, T)
+
+    assert traffic.series == {}
+    assert traffic.unmapped == 1 and traffic.peers_seen == 2
+
+
+def test_a_new_key_starts_a_new_series(traffic):
+    traffic.record([('old', T, 0, 0)], {'old': '42100001'}, T)
+    traffic.record([('old', T, 8192, 0)], {'old': '42100001'}, T + 1)
+    traffic.record([('new', T + 2, 1024, 0)], {'new': '42100001'}, T + 2)
+
+    assert traffic.series['42100001'].public_key == 'new'
+    assert totals(traffic, '42100001', T, T + 60) == [(T, 1024, 0)]
+
+
+def test_rings_forget_buckets_older_than_their_size(traffic):
+    by_key = {'key1': '42100001'}
+    traffic.record([('key1', T, 0, 0)], by_key, T)
+    traffic.record([('key1', T, 1024, 0)], by_key, T + 1)
+    traffic.record([('key1', T, 2048, 0)], by_key, T + 5 * 60)  # the minute tier has wrapped
+
+    minutes = traffic.query('42100001', T + 60, T + 6 * 60, 60)
+    assert minutes['resolution_seconds'] == 60
+    assert [p['rx_bytes'] for p in minutes['points']] == [0, 0, 0, 0, 1024]
+
+    # Older history comes from the coarser tier
+    assert traffic.query('42100001', T, T + 600, 300)['points'][0]['rx_bytes'] == 1024
+
+
+def test_summary_sums_the_window(traffic):
+    by_key = {'key1': '42100001', 'key2': '42100002'}
+    traffic.record([('key1', T, 0, 0), ('key2', T, 0, 0)], by_key, T)
+    traffic.record([('key1', T + 1, 1024, 2048), ('key2', T + 1, 0, 0)], by_key, T + 1)
+    traffic.record([('key1', T + 61, 3072, 2048), ('key2', T + 61, 0, 0)], by_key, T + 61)
+
+    usage = {u['order_number']: u for u in traffic.summary(120)}
+    assert (usage['42100001']['rx_bytes'], usage['42100001']['tx_bytes']) == (3072, 2048)
+    assert usage['42100002']['rx_bytes'] == 0 and usage['42100002']['latest_handshake'] == T + 61
+
+
+def test_history_survives_save_and_load(vps_daemon, traffic, tmp_path):
+    daemon, _ = vps_daemon
+    by_key = {'key1': '42100001'}
+    traffic.record([('key1', T, 0, 0)], by_key, T)
+    traffic.record([('key1', T, 5120, 1024)], by_key, T + 1)
+    path = str(tmp_path / 'traffic.bin')
+    traffic.save(path)
+
+    restored = daemon.TrafficCollector(daemon.manager, tiers=TIERS)
+    restored.load(path)
+    assert totals(restored, '42100001', T, T + 60) == totals(traffic, '42100001', T, T + 60)
+
+    # A file written with other tiers is ignored
+    other = daemon.TrafficCollector(daemon.manager, tiers=((60, 10),))
+    other.load(path)
+    assert other.series == {}
+
+
+def test_sample_reads_the_interface(vps_daemon, traffic):
+    daemon, orders = vps_daemon
+
+    traffic.sample()
+
+    assert traffic.peers_seen == len(orders) and traffic.unmapped == 0
+    # The fake wg reports a recent handshake for every peer
+    assert set(traffic.series) == {n for n, _ in orders}
+    assert traffic.allocated_bytes() == len(orders) * 12 * (5 + 4)
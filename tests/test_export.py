@@ -0,0 +1,71 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+
+from database_manager import ORDER_COLUMNS
+
+
+def backdate(db, order_number, days):
+    with open(db.json_file) as f:
+        data = json.load(f)
+    for order in data['orders'].values():
+        if order['order_number'] == order_number:
+            order['created_at'] = (datetime.now() - timedelta(days=days)).isoformat()
+            order['expires_at'] = (datetime.now() - timedelta(days=days - 1)).isoformat()
+    db.write_json(data)
+
+
+def test_iter_orders_yields_oldest_first_with_the_archive(json_db):
+    old = json_db.create_order('monthly')[1]
+    backdate(json_db, old, 60)
+    json_db.cleanup_expired_orders()
+    assert json_db.archive_expired_orders(retention_days=30) == 1
+    recent = json_db.create_order('annual')[1]
+
+    rows = list(json_db.iter_orders(columns=['order_number', 'status']))
+    assert rows == [{'order_number': old, 'status': 'expired'}, {'order_number': recent, 'status': 'active'}]
+
+    assert [r['order_number'] for r in json_db.iter_orders(include_archive=False)] == [recent]
+
+
+def test_iter_orders_filters(json_db):
+    old = json_db.create_order('monthly')[1]
+    backdate(json_db, old, 10)
+    monthly = json_db.create_order('monthly')[1]
+    json_db.create_order('annual')
+
+    numbers = lambda **f: [r['order_number'] for r in json_db.iter_orders(columns=['order_number'], **f)]
+    assert numbers(tier='monthly') == [old, monthly]
+    assert numbers(created_from=datetime.now() - timedelta(days=1), tier='monthly') == [monthly]
+    assert numbers(created_to=datetime.now() - timedelta(days=1)) == [old]
+    # Columns outside ORDER_COLUMNS are dropped
+    assert set(next(json_db.iter_orders(columns=['order_number', 'password']))) == {'order_number'}
+
+
+def test_csv_export(client, json_db):
+    numbers = [json_db.create_order(tier)[1] for tier in ('monthly', 'lifetime')]
+
+    response = client.get('/admin/export/orders.csv?key=k&fields=order_number,tier,price_cents')
+
+    assert response.status_code == 200 and response.mimetype == 'text/csv'
+    assert 'attachment' in response.headers['Content-Disposition']
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+    assert rows == [['order_number', 'tier', 'price_cents'], [numbers[0], 'monthly', '499'],
+                    [numbers[1], 'lifetime', '9999']]
+
+
+def test_ndjson_export(client, json_db):
+    json_db.create_order('monthly')
+
+    response = client.get('/admin/export/orders.ndjson?key=k&tier=monthly')
+
+    lines = response.get_data(as_text=True).splitlines()
+    assert len(lines) == 1
+    assert tuple(json.loads(lines[0])) == ORDER_COLUMNS
+
+
+def test_export_rejects_bad_requests(client):
+    assert client.get('/admin/export/orders.csv').status_code == 404
+    assert client.get('/admin/export/orders.xml?key=k').status_code == 404
+    assert client.get('/admin/export/orders.csv?key=k&created_from=yesterday').status_code == 400
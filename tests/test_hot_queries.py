@@ -0,0 +1,34 @@
+import os
+from datetime import datetime
+
+import pytest
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+pytestmark = pytest.mark.skipif(not DATABASE_URL, reason="needs DATABASE_URL (a disposable PostgreSQL database)")
+
+
+@pytest.fixture
+def conn():
+    import psycopg2
+    from migrations import migrate
+
+    conn = psycopg2.connect(DATABASE_URL)
+    migrate(conn)
+    yield conn
+    conn.close()
+
+
+def test_hot_queries_use_their_indexes(conn):
+    from db_pool import HOT_QUERIES, explain_hot_queries
+
+    results = explain_hot_queries(conn, {
+        'used_configs': (['test', 'monthly'],),
+        'order_by_number': ('72100001',),
+        'expire_orders': (datetime.now(),),
+    })
+
+    assert set(results) == set(HOT_QUERIES)
+    for name, (ok, scans) in results.items():
+        assert 'Seq Scan' not in scans, f"{name} falls back to a sequential scan: {scans}"
+        assert ok, f"{name} does not use its index: {scans}"
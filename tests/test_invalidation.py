@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from invalidation import PAYLOAD_BATCH, FileBus, _batches, _decode, _encode
+
+
+class WorkerBus(FileBus):
+    """FileBus posing as one of several worker processes"""
+
+    def __init__(self, path, name, **kwargs):
+        super().__init__(path, poll_interval=0.02, **kwargs)
+        # A listener that finds no log yet resyncs once the first message creates it
+        open(path, 'a').close()
+        self.name = name
+        self.received = []
+        self.subscribe(self.received.append)
+
+    @property
+    def origin(self):
+        return self.name
+
+    def wait_for(self, predicate, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not predicate(self.received):
+            if time.monotonic() > deadline:
+                pytest.fail(f"timed out, received {self.received}")
+            time.sleep(0.01)
+
+
+def test_payload_round_trip():
+    assert _decode(_encode('host:1', ['42100033', '72100001'])) == ('host:1', ['42100033', '72100001'])
+    assert _decode(_encode('host:1', None)) == ('host:1', None)
+
+
+def test_batches_split_large_invalidations():
+    numbers = [f"{i:08X}" for i in range(PAYLOAD_BATCH + 1)]
+    assert [len(batch) for batch in _batches(numbers + numbers)] == [PAYLOAD_BATCH, 1]
+    assert list(_batches(None)) == [None]
+
+
+def test_other_workers_receive_invalidations(tmp_path):
+    path = str(tmp_path / 'bus.log')
+    writer, reader = WorkerBus(path, 'a'), WorkerBus(path, 'b')
+    reader.ensure_started()
+    reader.wait_for(lambda received: received == [None])  # startup resync
+
+    writer.publish(['42100033'])
+    writer.publish(None)
+    writer.publish([])  # nothing to say: no message
+    reader.wait_for(lambda received: len(received) >= 3)
+    assert reader.received == [None, ['42100033'], None]
+
+
+def test_own_messages_are_ignored(tmp_path):
+    bus = WorkerBus(str(tmp_path / 'bus.log'), 'a')
+    bus.ensure_started()
+    bus.wait_for(lambda received: received == [None])
+
+    bus.publish(['42100033'])
+    other = WorkerBus(str(tmp_path / 'bus.log'), 'b')
+    other.publish(['42100034'])
+    bus.wait_for(lambda received: len(received) >= 2)
+    assert bus.received == [None, ['42100034']]
+
+
+def test_rotation_triggers_resync(tmp_path):
+    path = str(tmp_path / 'bus.log')
+    writer = WorkerBus(path, 'a', max_bytes=200)
+    reader = WorkerBus(path, 'b')
+    reader.ensure_started()
+    reader.wait_for(lambda received: received == [None])
+
+    # Past max_bytes the writer renames the log aside; the reader may miss
+    # the tail of the old file, so it has to drop everything
+    writer.publish([f"{i:08X}" for i in range(30)])
+    assert (tmp_path / 'bus.log.1').exists()
+    writer.publish(['42100033'])
+
+    reader.wait_for(lambda received: ['42100033'] in received)
+    after_first = reader.received[1:]
+    assert None in after_first[:after_first.index(['42100033'])]
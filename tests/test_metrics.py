@@ -0,0 +1,67 @@
+import pytest
+
+from metrics import Registry, timed_query
+
+
+def test_counter_and_gauge_exposition():
+    registry = Registry()
+    counter = registry.counter('requests_total', 'Requests', ('route',))
+    counter.inc(route='/a')
+    counter.inc(2, route='/a')
+    counter.inc(route='/b"x')
+    registry.gauge('queue_depth', 'Depth').set(7)
+    registry.gauge('slots', 'Slots', ('tier',), callback=lambda: {('test',): 3})
+
+    text = registry.expose()
+    assert '# TYPE requests_total counter' in text
+    assert 'requests_total{route="/a"} 3' in text
+    assert 'requests_total{route="/b\\"x"} 1' in text
+    assert 'queue_depth 7' in text
+    assert 'slots{tier="test"} 3' in text
+
+
+def test_failing_gauge_callback_renders_no_samples():
+    registry = Registry()
+    registry.gauge('broken', 'Broken', callback=lambda: 1 / 0)
+    assert registry.expose().splitlines() == ['# HELP broken Broken', '# TYPE broken gauge']
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram('latency_seconds', 'Latency', buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value)
+
+    text = registry.expose()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert 'latency_seconds_count 3' in text
+    assert 'latency_seconds_sum 5.55' in text
+
+
+def test_registering_twice_returns_the_same_metric():
+    registry = Registry()
+    assert registry.counter('c', 'C') is registry.counter('c', 'C')
+
+
+def test_timed_query_records_calls_and_errors():
+    from metrics import DB_QUERY_ERRORS, DB_QUERY_SECONDS
+
+    class FakeDB:
+        mode = 'json'
+
+        @timed_query
+        def lookup_for_metrics_test(self, fail=False):
+            if fail:
+                raise RuntimeError("boom")
+            return 'ok'
+
+    db = FakeDB()
+    assert db.lookup_for_metrics_test() == 'ok'
+    with pytest.raises(RuntimeError):
+        db.lookup_for_metrics_test(fail=True)
+
+    labels = '{method="lookup_for_metrics_test",mode="json"}'
+    assert f'tunnelgrain_db_query_seconds_count{labels} 2' in '\n'.join(DB_QUERY_SECONDS.expose())
+    assert f'tunnelgrain_db_query_errors_total{labels} 1' in '\n'.join(DB_QUERY_ERRORS.expose())
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import order_cache
+from order_cache import OrderCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(order_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def active_order(seconds_left):
+    return {'order_number': '42100033', 'status': 'active',
+            'expires_at': (datetime.now() + timedelta(seconds=seconds_left)).isoformat()}
+
+
+def test_active_order_lives_for_active_ttl(clock):
+    cache = OrderCache(active_ttl=60)
+    cache.set('42100033', active_order(3600))
+
+    clock[0] += 59
+    assert cache.get('42100033')[0]
+    clock[0] += 2
+    assert cache.get('42100033') == (False, None)
+
+
+def test_active_order_never_outlives_its_expiry(clock):
+    cache = OrderCache(active_ttl=60)
+    cache.set('42100033', active_order(10))
+
+    clock[0] += 9
+    assert cache.get('42100033')[0]
+    clock[0] += 2
+    assert not cache.get('42100033')[0]
+
+
+def test_past_expiry_is_cached_for_at_least_a_second(clock):
+    cache = OrderCache(active_ttl=60)
+    cache.set('42100033', active_order(-30))
+
+    assert cache.get('42100033')[0]
+    clock[0] += 1
+    assert not cache.get('42100033')[0]
+
+
+def test_expired_and_missing_ttls(clock):
+    cache = OrderCache(expired_ttl=600, missing_ttl=30)
+    cache.set('42100033', {'order_number': '42100033', 'status': 'expired'})
+    cache.set('42100034', None)
+
+    assert cache.get('42100034') == (True, None)
+    clock[0] += 31
+    assert not cache.get('42100034')[0]
+    assert cache.get('42100033')[0]
+    clock[0] += 570
+    assert not cache.get('42100033')[0]
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = OrderCache(max_entries=2)
+    cache.set('a', None)
+    cache.set('b', None)
+    cache.get('a')
+    cache.set('c', None)
+
+    assert cache.get('a')[0]
+    assert not cache.get('b')[0]
+    assert cache.stats()['entries'] == 2
+
+
+def test_hands_out_copies(clock):
+    cache = OrderCache()
+    cache.set('42100033', active_order(3600))
+
+    cache.get('42100033')[1]['status'] = 'expired'
+    assert cache.get('42100033')[1]['status'] == 'active'
+
+
+def test_invalidation(clock):
+    cache = OrderCache()
+    for number in ('a', 'b', 'c'):
+        cache.set(number, None)
+
+    cache.invalidate('a')
+    cache.invalidate_many(['b'])
+    assert [cache.get(n)[0] for n in ('a', 'b', 'c')] == [False, False, True]
+    cache.clear()
+    assert not cache.get('c')[0]
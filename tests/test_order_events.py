@@ -0,0 +1,120 @@
+import queue
+
+import pytest
+
+from order_events import OrderEventHub
+
+
+class Orders:
+    """Loader backed by a dict, counting loads"""
+
+    def __init__(self, **snapshots):
+        self.snapshots = snapshots
+        self.loads = 0
+
+    def __call__(self, order_number):
+        self.loads += 1
+        snapshot = self.snapshots.get(order_number)
+        return dict(snapshot) if snapshot else None
+
+
+def active(**fields):
+    return dict({'status': 'active', 'timer_started': False, 'seconds_remaining': 3600}, **fields)
+
+
+def test_watchers_of_one_order_share_a_single_load():
+    orders = Orders(**{'42100001': active()})
+    hub = OrderEventHub(orders)
+
+    first = hub.subscribe('42100001')
+    second = hub.subscribe('42100001')
+
+    assert orders.loads == 1
+    assert first[1] == second[1] == active()
+    assert hub.watcher_count() == 2
+
+
+def test_notify_fans_out_changes_to_every_watcher():
+    orders = Orders(**{'42100001': active()})
+    hub = OrderEventHub(orders)
+    watchers = [hub.subscribe('42100001')[0] for _ in range(3)]
+
+    orders.snapshots['42100001'] = active(timer_started=True)
+    hub.notify('42100001')
+
+    for events in watchers:
+        assert events.get(timeout=2) == ('timer_started', active(timer_started=True))
+
+
+def test_unchanged_reload_sends_nothing():
+    orders = Orders(**{'42100001': active()})
+    hub = OrderEventHub(orders)
+    events, _ = hub.subscribe('42100001')
+
+    orders.snapshots['42100001'] = active(seconds_remaining=3500)  # only the countdown moved
+    hub.notify_all()
+
+    with pytest.raises(queue.Empty):
+        events.get(timeout=0.3)
+    assert orders.loads == 2
+
+
+def test_expiry_reloads_without_a_notify():
+    orders = Orders(**{'72100001': active(seconds_remaining=0)})
+    hub = OrderEventHub(orders, refresh_interval=60)
+    events, _ = hub.subscribe('72100001')
+
+    orders.snapshots['72100001'] = {'status': 'expired', 'timer_started': False, 'seconds_remaining': 0}
+
+    assert events.get(timeout=3)[0] == 'expired'
+
+
+def test_max_watchers_rejects_until_a_watcher_leaves():
+    hub = OrderEventHub(Orders(**{'42100001': active()}), max_watchers=2)
+    first, _ = hub.subscribe('42100001')
+    hub.subscribe('42100002')  # unknown orders count too
+
+    assert hub.subscribe('42100001') is None
+
+    hub.unsubscribe('42100001', first)
+    assert hub.subscribe('42100001') is not None
+    assert hub.watcher_count() == 2
+
+
+def test_stream_ends_when_the_order_expires():
+    orders = Orders(**{'42100001': active()})
+    hub = OrderEventHub(orders, keepalive=5)
+    subscription = hub.subscribe('42100001')
+    subscription[0].put(('expired', {'status': 'expired'}))
+
+    body = list(hub.stream('42100001', subscription))
+
+    assert body[0] == 'retry: 3000\n\n'
+    assert body[1].startswith('event: status\n')
+    assert body[2] == 'event: expired\ndata: {"status": "expired"}\n\n'
+    assert len(body) == 3
+
+
+def test_stream_closes_after_max_duration():
+    hub = OrderEventHub(Orders(**{'42100001': active()}), keepalive=0.05, max_duration=0.2)
+
+    body = list(hub.stream('42100001', hub.subscribe('42100001')))
+
+    assert ': keepalive\n\n' in body
+    assert len(body) < 10
+
+
+def test_stream_of_an_unknown_order_sends_one_status():
+    hub = OrderEventHub(Orders())
+
+    body = list(hub.stream('42999999', hub.subscribe('42999999')))
+
+    assert body[1:] == ['event: status\ndata: {"order_found": false}\n\n']
+
+
+def test_route_answers_503_when_streams_are_full(client, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'order_events', OrderEventHub(app.order_event_snapshot, max_watchers=0))
+
+    assert client.get('/order-events/42100001').status_code == 503
+    assert client.get('/order-events/nope').status_code == 400
@@ -0,0 +1,41 @@
+import json
+from datetime import datetime, timedelta
+
+
+def expire(db, order_number):
+    with open(db.json_file) as f:
+        data = json.load(f)
+    for order in data['orders'].values():
+        if order['order_number'] == order_number:
+            order['expires_at'] = (datetime.now() - timedelta(minutes=1)).isoformat()
+    db.write_json(data)
+
+
+def counters(stats):
+    return {tier: {k: v for k, v in values.items() if k != 'updated_at'} for tier, values in stats.items()}
+
+
+def test_counters_follow_orders(json_db):
+    _, monthly = json_db.create_order('monthly')
+    json_db.create_order('monthly')
+    json_db.create_order('annual')
+
+    stats = json_db.get_order_stats()
+    assert stats['monthly']['active_count'] == 2
+    assert stats['monthly']['revenue_cents'] == 2 * 499
+    assert stats['annual']['active_count'] == 1
+
+    expire(json_db, monthly)
+    assert json_db.cleanup_expired_orders() == 1
+    stats = json_db.get_order_stats()
+    assert (stats['monthly']['active_count'], stats['monthly']['expired_count']) == (1, 1)
+
+
+def test_rebuild_matches_incremental_counters(json_db):
+    numbers = [json_db.create_order(tier)[1] for tier in ('monthly', 'quarterly', 'quarterly', 'lifetime')]
+    json_db.mark_timers_started(numbers[:2])
+    expire(json_db, numbers[1])
+    json_db.cleanup_expired_orders()
+
+    incremental = counters(json_db.get_order_stats())
+    assert counters(json_db.rebuild_order_stats()) == incremental
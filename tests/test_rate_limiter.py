@@ -0,0 +1,93 @@
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimit, RateLimiter, ShardedMemoryStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_parse():
+    limit = RateLimit.parse('30/60')
+    assert (limit.capacity, limit.period, limit.rate) == (30, 60, 0.5)
+
+
+def test_bucket_denies_when_empty_and_refills(clock):
+    store = ShardedMemoryStore()
+    limit = RateLimit(3, 60)  # one token every 20s
+
+    assert [store.consume('k', limit)[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = store.consume('k', limit)
+    assert not allowed
+    assert retry_after == pytest.approx(20)
+
+    clock[0] += 19
+    assert not store.consume('k', limit)[0]
+    clock[0] += 1
+    assert store.consume('k', limit)[0]
+
+
+def test_refill_is_capped_at_capacity(clock):
+    store = ShardedMemoryStore()
+    limit = RateLimit(2, 10)
+    store.consume('k', limit)
+
+    clock[0] += 3600
+    assert [store.consume('k', limit)[0] for _ in range(3)] == [True, True, False]
+
+
+def test_keys_are_independent(clock):
+    store = ShardedMemoryStore()
+    limit = RateLimit(1, 60)
+
+    assert store.consume('a', limit)[0]
+    assert not store.consume('a', limit)[0]
+    assert store.consume('b', limit)[0]
+
+
+def test_least_recently_used_buckets_are_evicted(clock):
+    store = ShardedMemoryStore(shards=1, max_keys_per_shard=3)
+    limit = RateLimit(1, 60)
+    for key in ('a', 'b', 'c'):
+        store.consume(key, limit)
+    store.consume('a', limit)  # a is now the most recently used
+    store.consume('d', limit)
+
+    assert list(store._shards[0][0]) == ['c', 'a', 'd']
+
+
+def test_other_routes_never_refill_a_drained_bucket(clock):
+    store = ShardedMemoryStore(shards=1, max_keys_per_shard=100)
+    strict, loose = RateLimit(1, 3600), RateLimit(1000, 1)
+    assert store.consume('get_test_vpn:fingerprint:fp', strict)[0]
+
+    # A flood of keys on a loose route (e.g. rotated User-Agents), below the shard cap
+    for i in range(50):
+        store.consume(f"lookup:fingerprint:{i}", loose)
+    assert not store.consume('get_test_vpn:fingerprint:fp', strict)[0]
+
+
+def test_limiter_checks_every_identity(clock):
+    limiter = RateLimiter(ShardedMemoryStore(), {
+        'lookup': {'fingerprint': RateLimit(1, 60), 'ip': RateLimit(5, 60)}
+    })
+
+    assert limiter.check('lookup', {'fingerprint': 'fp', 'ip': '1.2.3.4'}) == (True, 0)
+    allowed, retry_after = limiter.check('lookup', {'fingerprint': 'fp', 'ip': '1.2.3.4'})
+    assert not allowed and retry_after == 60
+    # Another fingerprint behind the same IP still has the IP's budget
+    assert limiter.check('lookup', {'fingerprint': 'other', 'ip': '1.2.3.4'})[0]
+    assert limiter.check('unlimited', {'ip': '1.2.3.4'}) == (True, 0)
+
+
+def test_limiter_fails_open_on_store_errors():
+    class BrokenStore:
+        def consume(self, key, limit, cost=1):
+            raise ConnectionError("database down")
+
+    limiter = RateLimiter(BrokenStore(), {'lookup': {'ip': RateLimit(1, 60)}})
+    assert limiter.check('lookup', {'ip': '1.2.3.4'}) == (True, 0)
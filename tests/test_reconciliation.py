@@ -0,0 +1,75 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+import requests
+
+from reconciliation import reconcile
+
+
+def expire(db, order_number):
+    with open(db.json_file) as f:
+        data = json.load(f)
+    for order in data['orders'].values():
+        if order['order_number'] == order_number:
+            order['expires_at'] = (datetime.now() - timedelta(minutes=1)).isoformat()
+    db.write_json(data)
+    db.cleanup_expired_orders()
+
+
+def start_timer(endpoint, order_number, tier='monthly'):
+    requests.post(f"{endpoint}/api/start-timer", timeout=5,
+                  json={'order_number': order_number, 'tier': tier, 'duration_minutes': 60}).raise_for_status()
+
+
+def drifted(db, endpoint):
+    """One order of each kind of drift; returns their numbers"""
+    downloaded = db.create_order('monthly')[1]  # downloaded, its timer was lost
+    db.mark_timers_started([downloaded])
+    undownloaded = db.create_order('monthly')[1]  # no timer yet, none due
+    expired = db.create_order('monthly')[1]  # expired here, peer still live on the daemon
+    start_timer(endpoint, expired)
+    expire(db, expired)
+    orphan = '42999999'  # timer with no order behind it
+    start_timer(endpoint, orphan)
+    return downloaded, undownloaded, expired, orphan
+
+
+def test_dry_run_reports_drift_without_repairing(json_db, fake_daemon):
+    endpoint, daemon = fake_daemon
+    downloaded, undownloaded, expired, orphan = drifted(json_db, endpoint)
+
+    report = reconcile(json_db, endpoint, dry_run=True)
+
+    assert report['missing_timers'] == [downloaded]
+    assert report['awaiting_download'] == 1
+    # The expired order's timer still runs on the daemon: it has no active order either
+    assert report['orphan_timers'] == sorted([expired, orphan])
+    assert report['stale_peers'] == sorted([expired, orphan])
+    assert report['timers_started'] == report['peers_removed'] == []
+    assert downloaded not in daemon.fake_timers
+    assert daemon.fake_timers[expired]['status'] == 'active'
+
+
+def test_reconcile_repairs_drift(json_db, fake_daemon):
+    endpoint, daemon = fake_daemon
+    downloaded, undownloaded, expired, orphan = drifted(json_db, endpoint)
+
+    report = reconcile(json_db, endpoint)
+
+    assert report['timers_started'] == [downloaded]
+    assert sorted(report['peers_removed']) == sorted([expired, orphan])
+    assert report['errors'] == []
+    assert daemon.fake_timers[downloaded]['status'] == 'active'
+    # Never started for an order the customer has not downloaded
+    assert undownloaded not in daemon.fake_timers
+
+    again = reconcile(json_db, endpoint)
+    assert again['missing_timers'] == again['stale_peers'] == []
+    assert again['awaiting_download'] == 1
+
+
+def test_unreachable_daemon_raises(json_db):
+    json_db.create_order('monthly')
+    with pytest.raises(requests.exceptions.ConnectionError):
+        reconcile(json_db, 'http://127.0.0.1:9')
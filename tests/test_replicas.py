@@ -0,0 +1,43 @@
+import os
+
+import psycopg2
+import pytest
+
+from db_pool import ReplicaSet
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+
+def unreachable(factory):
+    return psycopg2.connect('postgresql://nobody@127.0.0.1:1/none', connect_timeout=1,
+                            connection_factory=factory)
+
+
+def test_unreachable_replica_falls_back_to_primary():
+    replicas = ReplicaSet([unreachable], check_interval=60)
+
+    assert replicas.get() is None
+    status, = replicas.status()
+    assert status['error'] and not status['usable']
+    # Skipped until its next check instead of costing a connect attempt per read
+    assert replicas.get() is None
+    assert replicas.status()[0]['error'] == status['error']
+
+
+@pytest.mark.skipif(not DATABASE_URL, reason="needs DATABASE_URL (a disposable PostgreSQL database)")
+def test_healthy_replicas_are_used_round_robin():
+    def connect(factory):
+        return psycopg2.connect(DATABASE_URL, connection_factory=factory)
+
+    replicas = ReplicaSet([connect, unreachable, connect], max_lag=5)
+    for _ in range(3):
+        conn = replicas.get()
+        assert conn is not None
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.close()
+
+    status = replicas.status()
+    assert [s['usable'] for s in status] == [True, False, True]
+    # A primary is never in recovery, so it reports no lag
+    assert [s['lag_seconds'] for s in status if s['usable']] == [0, 0]
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from database_manager import QuotaExceededError, RecentFingerprintCache
+
+
+def orders(db):
+    with open(db.json_file) as f:
+        return list(json.load(f)['orders'].values())
+
+
+def test_quota_counts_test_orders_per_fingerprint(json_db):
+    json_db.TEST_QUOTA_MAX = 2
+    json_db.create_order('test', user_fingerprint='fp-a')
+    json_db.create_order('test', user_fingerprint='fp-a')
+
+    with pytest.raises(QuotaExceededError):
+        json_db.create_order('test', user_fingerprint='fp-a')
+
+    # Other clients and paid tiers are not affected
+    assert json_db.create_order('test', user_fingerprint='fp-b')[1]
+    assert json_db.create_order('monthly', user_fingerprint='fp-a')[1]
+
+
+def test_rejected_request_allocates_nothing(json_db):
+    json_db.TEST_QUOTA_MAX = 1
+    json_db.create_order('test', user_fingerprint='fp-a')
+    used = json_db.get_used_configs('test')
+
+    # A fresh in-process cache, as in another worker: the stored orders decide
+    json_db.recent_fingerprints = RecentFingerprintCache(json_db.TEST_QUOTA_WINDOW_MINUTES)
+    with pytest.raises(QuotaExceededError):
+        json_db.create_order('test', user_fingerprint='fp-a')
+
+    assert len(orders(json_db)) == 1
+    assert json_db.get_used_configs('test') == used
+
+
+def test_zero_disables_the_quota(json_db):
+    json_db.TEST_QUOTA_MAX = 0
+    for _ in range(4):
+        assert json_db.create_order('test', user_fingerprint='fp-a')[1]